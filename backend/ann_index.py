@@ -0,0 +1,287 @@
+import os
+import sys
+import json
+import time
+
+import numpy as np
+
+# --- Add root_dir to path (so 'backend' imports work when run as a script) ---
+backend_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(backend_dir)
+if root_dir not in sys.path:
+    sys.path.append(root_dir)
+# ---
+
+# --- ANN Index Settings ---
+# Personal memory (Chroma HNSW). Used for NEW collections; a tuned collection
+# keeps its own settings (see below). Defaults are Chroma's own.
+HNSW_M = int(os.environ.get("LUMI_HNSW_M", "16"))                              # Links per node
+HNSW_EF_CONSTRUCTION = int(os.environ.get("LUMI_HNSW_EF_CONSTRUCTION", "100"))  # Build-time beam
+HNSW_EF_SEARCH = int(os.environ.get("LUMI_HNSW_EF_SEARCH", "100"))              # Query-time beam
+
+# Uploaded documents (FAISS). Sections stay exact (flat) until they reach
+# DOC_ANN_MIN_CHUNKS -- below that a brute-force scan is both faster and exact.
+DOC_INDEX = os.environ.get("LUMI_DOC_INDEX", "flat").lower()   # flat | hnsw | ivf
+DOC_ANN_MIN_CHUNKS = int(os.environ.get("LUMI_DOC_ANN_MIN_CHUNKS", "1000"))
+DOC_HNSW_M = int(os.environ.get("LUMI_DOC_HNSW_M", "32"))
+DOC_HNSW_EF_SEARCH = int(os.environ.get("LUMI_DOC_HNSW_EF_SEARCH", "64"))
+DOC_IVF_NLIST = int(os.environ.get("LUMI_DOC_IVF_NLIST", "0"))    # 0 = about 4 * sqrt(chunks)
+DOC_IVF_NPROBE = int(os.environ.get("LUMI_DOC_IVF_NPROBE", "8"))
+
+# Auto-tuning
+TARGET_RECALL = float(os.environ.get("LUMI_ANN_TARGET_RECALL", "0.95"))
+TUNE_QUERIES = 200        # Held-out vectors used as queries
+TUNE_K = 4                # recall@k, k = what the assistant actually retrieves
+HNSW_GRID = {"max_neighbors": (8, 16, 32), "ef_construction": (64, 100, 200),
+             "ef_search": (10, 20, 40, 80, 160)}
+IVF_PROBES = (1, 2, 4, 8, 16, 32)
+SETTINGS_KEY = "lumi:ann"  # Collection metadata key holding the tuned settings (JSON)
+# ---
+
+
+# --- Personal memory: Chroma collections ---
+
+def default_hnsw_settings():
+    return {"max_neighbors": HNSW_M, "ef_construction": HNSW_EF_CONSTRUCTION, "ef_search": HNSW_EF_SEARCH}
+
+
+def stored_settings(collection):
+    """The tuned settings saved with the collection, else the configured defaults."""
+    raw = (collection.metadata or {}).get(SETTINGS_KEY)
+    settings = default_hnsw_settings()
+    if raw:
+        settings.update({key: value for key, value in json.loads(raw).items() if key in settings})
+    return settings
+
+
+def current_hnsw(collection):
+    """The HNSW parameters the collection was actually built with."""
+    hnsw = (getattr(collection, "configuration", None) or {}).get("hnsw") or {}
+    return {key: hnsw.get(key) for key in ("max_neighbors", "ef_construction", "ef_search")}
+
+
+def open_collection(client, name, settings=None):
+    """Gets a collection, creating it with the given (or default) HNSW settings if it doesn't exist."""
+    try:
+        return client.get_collection(name=name)
+    except Exception:
+        settings = settings or default_hnsw_settings()
+        print(f"ANN: Creating collection {name} with HNSW {settings}")
+        return client.create_collection(
+            name=name,
+            configuration={"hnsw": dict(settings, space="l2")},
+            metadata={SETTINGS_KEY: json.dumps(settings)},
+        )
+
+
+def save_settings(collection, settings, report):
+    """Stores the tuned settings with the collection and applies ef_search right away."""
+    metadata = dict(collection.metadata or {})
+    metadata[SETTINGS_KEY] = json.dumps(dict(settings, recall=report["recall"], latency_ms=report["latency_ms"],
+                                             k=report["k"], target=report["target"], tuned_at=time.time()))
+    collection.modify(metadata=metadata)
+    # ef_search can change on a live index; links (M, ef_construction) need a rebuild
+    collection.modify(configuration={"hnsw": {"ef_search": settings["ef_search"]}})
+
+
+# --- Uploaded documents: FAISS ---
+
+def _ivf_nlist(n):
+    """About 4 * sqrt(n) lists, but never fewer than the ~39 training points per list FAISS wants."""
+    return max(1, min(int(4 * np.sqrt(n)), n // 39))
+
+
+def build_doc_index(vectors, kind=DOC_INDEX):
+    """
+    A FAISS index holding `vectors`, or None when the exact flat index should
+    stay (kind 'flat', or too few vectors for an approximate one to pay off).
+    """
+    import faiss
+
+    n, dim = vectors.shape
+    if kind == "flat" or n < DOC_ANN_MIN_CHUNKS:
+        return None
+    if kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, DOC_HNSW_M)
+        index.hnsw.efSearch = DOC_HNSW_EF_SEARCH
+    elif kind == "ivf":
+        nlist = DOC_IVF_NLIST or _ivf_nlist(n)
+        index = faiss.IndexIVFFlat(faiss.IndexFlatL2(dim), dim, nlist)
+        index.train(vectors)
+        index.nprobe = DOC_IVF_NPROBE
+    else:
+        raise ValueError(f"Unknown LUMI_DOC_INDEX '{kind}' (use flat, hnsw or ivf).")
+    index.add(vectors)
+    return index
+
+
+# --- Auto-tuning ---
+
+def exact_neighbors(base, queries, k):
+    """Ground truth: ids of the k nearest base vectors (squared L2) for each query."""
+    distances = (queries ** 2).sum(1)[:, None] - 2 * queries @ base.T + (base ** 2).sum(1)[None, :]
+    return np.argsort(distances, axis=1)[:, :k]
+
+
+def recall_at_k(found, truth):
+    hits = sum(len(set(f[f >= 0]) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def _split(vectors, sample):
+    """Holds out `sample` vectors as queries; the index is built from the rest."""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    rng = np.random.default_rng(0)
+    held_out = rng.choice(len(vectors), size=min(sample, len(vectors) // 5), replace=False)
+    mask = np.ones(len(vectors), dtype=bool)
+    mask[held_out] = False
+    return vectors[mask], vectors[held_out]
+
+
+def _measure(index, queries, truth, k):
+    started = time.perf_counter()
+    found = np.vstack([index.search(query[None, :], k)[1] for query in queries])  # One at a time, like real queries
+    latency_ms = (time.perf_counter() - started) * 1000 / len(queries)
+    return recall_at_k(found, truth), latency_ms
+
+
+def _pick(results, target):
+    """Cheapest (fastest) setting that meets the target; the most accurate one if none does."""
+    meeting = [r for r in results if r["recall"] >= target]
+    if meeting:
+        return min(meeting, key=lambda r: (r["latency_ms"], r.get("max_neighbors", 0), r.get("ef_construction", 0)))
+    return max(results, key=lambda r: (r["recall"], -r["latency_ms"]))
+
+
+def tune_hnsw(vectors, k=TUNE_K, target=TARGET_RECALL, sample=TUNE_QUERIES, grid=HNSW_GRID):
+    """
+    Grid-searches HNSW settings for these vectors. FAISS's HNSW (same graph
+    algorithm as Chroma's) stands in for the collection, so nothing in the
+    live store is rebuilt while tuning. Returns (chosen, all results).
+    """
+    import faiss
+
+    base, queries = _split(vectors, sample)
+    truth = exact_neighbors(base, queries, k)
+    results = []
+    for m in grid["max_neighbors"]:
+        for ef_construction in grid["ef_construction"]:
+            index = faiss.IndexHNSWFlat(base.shape[1], m)
+            index.hnsw.efConstruction = ef_construction
+            index.add(base)
+            for ef_search in grid["ef_search"]:
+                if ef_search < k:
+                    continue
+                index.hnsw.efSearch = ef_search
+                recall, latency_ms = _measure(index, queries, truth, k)
+                results.append({"max_neighbors": m, "ef_construction": ef_construction, "ef_search": ef_search,
+                                "recall": round(recall, 4), "latency_ms": round(latency_ms, 4)})
+    chosen = _pick(results, target)
+    return chosen, results
+
+
+def tune_doc_index(vectors, k=TUNE_K, target=TARGET_RECALL, sample=TUNE_QUERIES):
+    """Compares flat, HNSW and IVF for a document's chunk vectors. Returns (chosen, all results)."""
+    import faiss
+
+    base, queries = _split(vectors, sample)
+    truth = exact_neighbors(base, queries, k)
+    dim = base.shape[1]
+    results = []
+
+    flat = faiss.IndexFlatL2(dim)
+    flat.add(base)
+    recall, latency_ms = _measure(flat, queries, truth, k)
+    results.append({"kind": "flat", "recall": round(recall, 4), "latency_ms": round(latency_ms, 4)})
+
+    for m in (16, 32):
+        index = faiss.IndexHNSWFlat(dim, m)
+        index.add(base)
+        for ef_search in (16, 32, 64, 128):
+            index.hnsw.efSearch = ef_search
+            recall, latency_ms = _measure(index, queries, truth, k)
+            results.append({"kind": "hnsw", "m": m, "ef_search": ef_search,
+                            "recall": round(recall, 4), "latency_ms": round(latency_ms, 4)})
+
+    nlist = _ivf_nlist(len(base))
+    if nlist > 1:
+        index = faiss.IndexIVFFlat(faiss.IndexFlatL2(dim), dim, nlist)
+        index.train(base)
+        index.add(base)
+        for nprobe in IVF_PROBES:
+            if nprobe > nlist:
+                break
+            index.nprobe = nprobe
+            recall, latency_ms = _measure(index, queries, truth, k)
+            results.append({"kind": "ivf", "nlist": nlist, "nprobe": nprobe,
+                            "recall": round(recall, 4), "latency_ms": round(latency_ms, 4)})
+    return _pick(results, target), results
+
+
+def tune_collection(collection, k=TUNE_K, target=TARGET_RECALL, sample=TUNE_QUERIES, apply=False):
+    """Tunes the collection's HNSW settings on its own vectors; apply=True stores them with it."""
+    vectors = np.asarray(collection.get(include=["embeddings"])["embeddings"], dtype=np.float32)
+    if len(vectors) < 5 * k:
+        raise ValueError(f"Only {len(vectors)} chunks: too few to tune (exact search is fine at this size).")
+    started = time.time()
+    chosen, results = tune_hnsw(vectors, k=k, target=target, sample=sample)
+    current = current_hnsw(collection)
+    report = {
+        "chunks": len(vectors),
+        "k": k,
+        "target": target,
+        "recall": chosen["recall"],
+        "latency_ms": chosen["latency_ms"],
+        "chosen": {key: chosen[key] for key in ("max_neighbors", "ef_search", "ef_construction")},
+        "current": current,
+        "rebuild_needed": (current["max_neighbors"], current["ef_construction"])
+                          != (chosen["max_neighbors"], chosen["ef_construction"]),
+        "results": results,
+        "seconds": round(time.time() - started, 1),
+    }
+    if apply:
+        save_settings(collection, report["chosen"], report)
+    return report
+
+
+# --- Command line ---
+if __name__ == "__main__":
+    # python backend/ann_index.py memory [--apply] [--target 0.95] [--k 4]
+    #   tunes the personal-memory collection (inside the memory service);
+    #   --apply stores the result with the collection and sets ef_search now.
+    #   If M / ef_construction changed, 'python backend/embedding_migration.py rebuild'
+    #   copies the vectors into a collection built with them.
+    # python backend/ann_index.py document <file.pdf> [--target 0.95] [--k 4]
+    #   tunes a document index and prints the LUMI_DOC_* settings to use.
+    args = sys.argv[1:]
+    target = float(args[args.index("--target") + 1]) if "--target" in args else TARGET_RECALL
+    k = int(args[args.index("--k") + 1]) if "--k" in args else TUNE_K
+
+    if args and args[0] == "document":
+        from backend.memory_client import connect
+        from backend.document_processor import count_pages, extract_page_texts, text_splitter
+
+        with open(args[1], "rb") as f:
+            file_bytes = f.read()
+        text = "".join(t for _, t in extract_page_texts(file_bytes, args[1], 0, count_pages(file_bytes, args[1])))
+        chunks = text_splitter.split_text(text)
+        embeddings, _ = connect()
+        vectors = np.asarray(embeddings.embed_documents(chunks), dtype=np.float32)
+        chosen, results = tune_doc_index(vectors, k=k, target=target)
+        for result in results:
+            print(result)
+        print(f"\n{len(chunks)} chunks. Cheapest setting with recall@{k} >= {target}: {chosen}")
+        if chosen["kind"] == "hnsw":
+            print(f"LUMI_DOC_INDEX=hnsw LUMI_DOC_HNSW_M={chosen['m']} LUMI_DOC_HNSW_EF_SEARCH={chosen['ef_search']}")
+        elif chosen["kind"] == "ivf":
+            print(f"LUMI_DOC_INDEX=ivf LUMI_DOC_IVF_NLIST={chosen['nlist']} LUMI_DOC_IVF_NPROBE={chosen['nprobe']}")
+        else:
+            print("LUMI_DOC_INDEX=flat")
+    else:
+        from backend.memory_client import connect
+
+        _, vector_store = connect()
+        report = vector_store.tune(k=k, target=target, apply="--apply" in args)
+        for result in report.pop("results"):
+            print(result)
+        print(json.dumps(report, indent=2))
@@ -0,0 +1,89 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+
+# --- Memory Version ---
+# Every write to the memory store (add_to_memory, ingest.py, compaction...)
+# bumps the version. Cached answers remember the version they were built
+# from, so anything cached before a write can never be served after it.
+# The marker file lets separate processes (e.g. ingest.py) invalidate the
+# server's cache too: its modification time is part of the version.
+backend_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(backend_dir)
+CHROMA_PATH = os.environ.get("LUMI_CHROMA_PATH", os.path.join(root_dir, "chroma_db"))
+MEMORY_VERSION_FILE = os.path.join(CHROMA_PATH, ".memory_version")
+
+ANSWER_CACHE_SIZE = int(os.environ.get("LUMI_ANSWER_CACHE_SIZE", "256"))
+# ---
+
+_local_version = 0
+_version_lock = threading.Lock()
+
+
+def bump_memory_version():
+    """Call after ANY write to the memory store."""
+    global _local_version
+    with _version_lock:
+        _local_version += 1
+        try:
+            os.makedirs(os.path.dirname(MEMORY_VERSION_FILE), exist_ok=True)
+            with open(MEMORY_VERSION_FILE, "a"):
+                pass
+            os.utime(MEMORY_VERSION_FILE, None)
+        except OSError as e:
+            print(f"AnswerCache: Could not touch version file: {e}")
+
+
+def memory_version():
+    """(in-process writes, last write from any process) -- a single stat() call."""
+    try:
+        file_version = os.stat(MEMORY_VERSION_FILE).st_mtime_ns
+    except OSError:
+        file_version = 0
+    return (_local_version, file_version)
+
+
+def normalize_query(text: str) -> str:
+    """'What's on my shopping list?' and 'whats on my shopping list' share a key."""
+    text = re.sub(r"[^\w\s]", "", text.lower())
+    return " ".join(text.split())
+
+
+class AnswerCache:
+    """LRU cache of answers keyed by (namespace, normalized query, memory version)."""
+
+    def __init__(self, max_size=ANSWER_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, query, namespace="default"):
+        """
+        Returns (answer or None, key). Pass the key back to store() -- it pins
+        the memory version seen *before* the answer was computed, so a write
+        that lands mid-query can't get its stale answer cached.
+        """
+        key = (namespace, normalize_query(query), memory_version())
+        with self._lock:
+            answer = self._entries.get(key)
+            if answer is None:
+                self.misses += 1
+                return None, key
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return answer, key
+
+    def store(self, key, answer):
+        with self._lock:
+            self._entries[key] = answer
+            self._entries.move_to_end(key)
+            # Entries from old versions are never hit again; LRU pushes them out
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
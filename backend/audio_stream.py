@@ -0,0 +1,236 @@
+import io
+import os
+import json
+import time
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import scipy.io.wavfile as wavfile
+from websockets.sync.server import serve
+from websockets.exceptions import ConnectionClosed
+
+# --- Streaming Audio Settings ---
+STREAM_HOST = "127.0.0.1"
+STREAM_PORT = int(os.environ.get("LUMI_STREAM_PORT", "5003"))
+DEFAULT_SAMPLE_RATE = 16000
+SEGMENT_SECONDS = float(os.environ.get("LUMI_STREAM_SEGMENT_SECONDS", "2.5"))  # Audio per partial transcription
+MIN_SEGMENT_SECONDS = 0.8          # A pause can close a segment once it's at least this long
+PAUSE_SECONDS = 0.3                # Quiet this long = a pause between words (safe place to cut)
+ENDPOINT_SECONDS = float(os.environ.get("LUMI_STREAM_ENDPOINT_SECONDS", "0.8"))  # Quiet this long after speech = done
+MAX_UTTERANCE_SECONDS = 60
+SPEECH_RMS = 500                   # int16 RMS of a 20 ms frame that counts as speech
+FRAME_SECONDS = 0.02
+MAX_PARALLEL_SEGMENTS = 4
+# ---
+
+# Protocol (ws://127.0.0.1:5003), one utterance per connection:
+#   client -> {"type": "start", "sample_rate": 16000, "session_id": "..."}
+#   client -> binary messages: little-endian int16 mono PCM, any frame size
+#   client -> {"type": "stop"}   (optional: the server also ends the utterance
+#                                 by itself after ENDPOINT_SECONDS of quiet)
+#   server -> {"type": "partial", "text": "..."}     whenever a segment is transcribed
+#   server -> {"type": "end"}                        the server heard the end of speech
+#   server -> {"type": "final", "text": "..."}       the whole transcript ("complete": false if a
+#                                                    segment failed; an error follows, no response)
+#   server -> {"type": "response", ...}              the brain's answer (same fields as /listen)
+#   server -> {"type": "error", "message": "..."}
+#
+# Audio never touches the disk. While the user is still talking, finished
+# segments (cut at pauses, so words aren't split) are already being
+# transcribed, so when speech ends only the last short segment is left.
+
+_segment_pool = ThreadPoolExecutor(max_workers=MAX_PARALLEL_SEGMENTS, thread_name_prefix="stream-segment")
+
+
+def to_wav_bytes(samples, sample_rate):
+    buffer = io.BytesIO()
+    wavfile.write(buffer, sample_rate, samples)
+    return buffer.getvalue()
+
+
+def frame_rms(samples, sample_rate):
+    """RMS of each 20 ms frame."""
+    frame = int(sample_rate * FRAME_SECONDS)
+    count = len(samples) // frame
+    if not count:
+        return np.zeros(0)
+    frames = samples[:count * frame].astype(np.float32).reshape(count, frame)
+    return np.sqrt((frames ** 2).mean(axis=1))
+
+
+class StreamingTranscriber:
+    """
+    Buffers one utterance in memory and transcribes it segment by segment.
+    transcribe(wav_bytes) -> text is called on a worker pool for each
+    segment; on_partial(text) gets the transcript so far as segments finish.
+    """
+
+    def __init__(self, transcribe, sample_rate=DEFAULT_SAMPLE_RATE, on_partial=None):
+        self.transcribe = transcribe
+        self.sample_rate = sample_rate
+        self.on_partial = on_partial
+        self._pending = np.zeros(0, dtype=np.int16)   # Audio not yet sent off as a segment
+        self._carry = np.zeros(0, dtype=np.int16)     # Tail shorter than one frame, not yet measured
+        self._odd_byte = b""                          # Half a sample left over from the last message
+        self._texts = []                              # One per segment, in order ("" until done)
+        self._futures = []
+        self._lock = threading.Lock()
+        self.total_samples = 0
+        self.heard_speech = False
+        self.quiet_samples = 0                        # Trailing quiet since the last speech frame
+        self.complete = True                          # False once a segment with speech failed to transcribe
+
+    def feed(self, pcm_bytes):
+        """Adds int16 PCM. Returns True once the speaker has paused long enough to be done."""
+        # Clients may split a message mid-sample: keep the odd byte for the next one
+        pcm_bytes = self._odd_byte + bytes(pcm_bytes)
+        usable = len(pcm_bytes) // 2 * 2
+        self._odd_byte = pcm_bytes[usable:]
+        samples = np.frombuffer(pcm_bytes[:usable], dtype="<i2")
+        if not len(samples) or self.total_samples >= MAX_UTTERANCE_SECONDS * self.sample_rate:
+            return self.total_samples >= MAX_UTTERANCE_SECONDS * self.sample_rate
+        self.total_samples += len(samples)
+        self._pending = np.concatenate([self._pending, samples])
+
+        # Speech / quiet is decided per 20 ms frame, whatever size the client's messages are
+        frame = int(self.sample_rate * FRAME_SECONDS)
+        unmeasured = np.concatenate([self._carry, samples])
+        measured = len(unmeasured) // frame * frame
+        self._carry = unmeasured[measured:]
+        rms = frame_rms(unmeasured[:measured], self.sample_rate)
+        loud = np.nonzero(rms >= SPEECH_RMS)[0]
+        if len(loud):
+            self.heard_speech = True
+            self.quiet_samples = (len(rms) - 1 - int(loud[-1])) * frame
+        else:
+            self.quiet_samples += measured
+
+        self._maybe_cut()
+        return self.heard_speech and self.quiet_samples >= ENDPOINT_SECONDS * self.sample_rate
+
+    def _maybe_cut(self):
+        rate = self.sample_rate
+        pending = len(self._pending)
+        if pending >= MIN_SEGMENT_SECONDS * rate and self.quiet_samples >= PAUSE_SECONDS * rate:
+            self._submit(pending)           # Cut at the pause, right at the end
+        elif pending >= SEGMENT_SECONDS * rate:
+            # No pause: cut at the quietest frame in the last second, so a word is unlikely to be split
+            rms = frame_rms(self._pending, rate)
+            frame = int(rate * FRAME_SECONDS)
+            window = min(len(rms), int(1.0 / FRAME_SECONDS))
+            quietest = len(rms) - window + int(np.argmin(rms[-window:]))
+            self._submit(max(frame, (quietest + 1) * frame))
+
+    def _submit(self, length):
+        segment, self._pending = self._pending[:length], self._pending[length:]
+        index = len(self._texts)
+        self._texts.append("")
+        rms = frame_rms(segment, self.sample_rate)
+        if not len(rms) or rms.max() < SPEECH_RMS:
+            self._futures.append(None)      # Silence: no API call
+            return
+        self._futures.append(_segment_pool.submit(self._transcribe_segment, index, segment))
+
+    def _transcribe_segment(self, index, segment):
+        started = time.perf_counter()
+        text = (self.transcribe(to_wav_bytes(segment, self.sample_rate)) or "").strip()
+        print(f"AudioStream: Segment {index} ({len(segment) / self.sample_rate:.1f}s audio) "
+              f"transcribed in {time.perf_counter() - started:.2f}s")
+        with self._lock:
+            self._texts[index] = text
+            partial = self.transcript()
+        if self.on_partial:
+            self.on_partial(partial)
+        return text
+
+    def transcript(self):
+        return " ".join(text for text in self._texts if text)
+
+    def finish(self):
+        """
+        Sends off the last segment and waits for every transcription. Returns the full transcript;
+        `complete` is False if any segment with speech failed (the transcript has a gap).
+        """
+        if len(self._pending):
+            self._submit(len(self._pending))
+        for future in self._futures:
+            if future is None:
+                continue
+            try:
+                future.result()
+            except Exception as e:
+                print(f"AudioStream: A segment failed to transcribe: {e}")
+                self.complete = False
+        with self._lock:
+            return self.transcript()
+
+
+def _handle_connection(websocket, transcribe, on_final):
+    """One utterance: stream in, partial transcripts out, then the final answer."""
+    outbox = queue.Queue()    # Partials come from worker threads; only this thread sends
+    transcriber = None
+    session_id = "default"
+    ended = False
+
+    def new_transcriber(sample_rate=DEFAULT_SAMPLE_RATE):
+        return StreamingTranscriber(transcribe, sample_rate=sample_rate,
+                                    on_partial=lambda text: outbox.put({"type": "partial", "text": text}))
+
+    def flush():
+        while not outbox.empty():
+            websocket.send(json.dumps(outbox.get()))
+
+    try:
+        while not ended:
+            try:
+                message = websocket.recv(timeout=0.05)
+            except TimeoutError:
+                flush()
+                continue
+            if isinstance(message, bytes):
+                if transcriber is None:
+                    transcriber = new_transcriber()
+                if transcriber.feed(message):
+                    outbox.put({"type": "end"})
+                    ended = True
+            else:
+                control = json.loads(message)
+                if control.get("type") == "start":
+                    session_id = control.get("session_id") or session_id
+                    transcriber = new_transcriber(int(control.get("sample_rate", DEFAULT_SAMPLE_RATE)))
+                elif control.get("type") == "stop":
+                    ended = True
+            flush()
+
+        text = transcriber.finish() if transcriber else ""
+        flush()
+        if transcriber and not transcriber.complete:
+            # Routing a transcript with a hole in it could run the wrong command or save half a note
+            websocket.send(json.dumps({"type": "final", "text": text, "complete": False}))
+            websocket.send(json.dumps({"type": "error", "message": "Part of what you said couldn't be transcribed. Please try again."}))
+            return
+        websocket.send(json.dumps({"type": "final", "text": text}))
+        # The transcript is complete: routing starts now, not after a fixed recording window
+        websocket.send(json.dumps(dict(on_final(text, session_id), type="response")))
+    except ConnectionClosed:
+        print("AudioStream: Client disconnected mid-utterance.")
+    except Exception as e:
+        print(f"AudioStream: Error: {e}")
+        try:
+            websocket.send(json.dumps({"type": "error", "message": str(e)}))
+        except Exception:
+            pass
+
+
+def start_stream_server(transcribe, on_final, host=STREAM_HOST, port=STREAM_PORT):
+    """
+    Serves the streaming endpoint on a background thread.
+    transcribe(wav_bytes) -> text; on_final(text, session_id) -> response dict.
+    """
+    server = serve(lambda websocket: _handle_connection(websocket, transcribe, on_final),
+                   host, port, max_size=2 ** 20)
+    threading.Thread(target=server.serve_forever, name="lumi-audio-stream", daemon=True).start()
+    print(f"AudioStream: Listening on ws://{host}:{port}")
+    return server
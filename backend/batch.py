@@ -0,0 +1,145 @@
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.prompts import PromptTemplate
+from langchain_core.output_parsers import StrOutputParser
+from langchain_google_genai import ChatGoogleGenerativeAI
+
+from backend import brain, memory_tool, system_tool
+from backend.planner import INTENTS, looks_compound
+from backend.command_parser import fast_parse, normalize_command
+from backend.llm_memo import memoized
+from backend.resilience import guarded, StageUnavailable
+
+MAX_BATCH_ITEMS = 500
+ROUTER_BATCH_SIZE = 50      # Statements classified per router prompt
+MAX_PARALLEL_QUERIES = 8
+QUERY_INTENTS = ("CONVERSATION", "PERSONAL_QUERY", "GENERAL_KNOWLEDGE", "VISION")
+
+# --- Batched router: one prompt classifies many statements ---
+batch_router_template = """
+Classify EACH numbered statement into one of six categories:
+
+1. 'CONVERSATION': Simple greetings, small talk, or conversational questions.
+2. 'VISION': Asking to see, look at, or analyze the screen.
+3. 'INGEST': Stating a new fact or note to be saved ("Remember that...", "My new idea is...").
+4. 'PERSONAL_QUERY': A question about the user themselves, their plans, or their saved notes.
+5. 'GENERAL_KNOWLEDGE': A general fact-based question about the world.
+6. 'SYSTEM_COMMAND': An action on the computer, including timers and reminders.
+
+Respond with ONLY one line per statement, in order, formatted as
+<number>: <CATEGORY>
+
+Statements:
+{statements}
+"""
+# Its own stage: a 50-item prompt takes longer than one routing call, and its
+# latency must not skew (or trip the breaker of) the interactive router
+batch_router_llm = memoized(guarded(ChatGoogleGenerativeAI(model="gemini-flash-latest", temperature=0, google_api_key=brain.GOOGLE_API_KEY), "batch_router"))
+batch_router_chain = PromptTemplate.from_template(batch_router_template) | batch_router_llm | StrOutputParser()
+
+_LINE_PATTERN = re.compile(r"^\s*(\d+)\s*[:.)-]\s*'?\"?([A-Z_]+)", re.MULTILINE)
+
+_query_pool = ThreadPoolExecutor(max_workers=MAX_PARALLEL_QUERIES, thread_name_prefix="batch-query")
+
+
+def parse_batch_intents(raw_text: str, count: int) -> dict:
+    """'1: INGEST\\n2: SYSTEM_COMMAND' -> {0: 'INGEST', 1: 'SYSTEM_COMMAND'} (valid lines only)."""
+    intents = {}
+    for number, intent in _LINE_PATTERN.findall(raw_text):
+        index = int(number) - 1
+        if 0 <= index < count and intent in INTENTS:
+            intents[index] = intent
+    return intents
+
+
+def classify_batch(inputs: list) -> list:
+    """
+    One intent per input. Greetings and commands the fast parser knows are
+    classified locally; the rest share one router prompt per 50 items.
+    Anything the router skips (or an outage) falls back to keyword rules.
+    """
+    intents = [None] * len(inputs)
+    for i, text in enumerate(inputs):
+        clean = text.lower().strip("?!., ")
+        if any(clean.startswith(word) for word in brain.GREETING_KEYWORDS) and not looks_compound(text):
+            intents[i] = "GREETING"
+        elif fast_parse(normalize_command(text)) is not None:
+            intents[i] = "SYSTEM_COMMAND"
+
+    remaining = [i for i, intent in enumerate(intents) if intent is None]
+    for start in range(0, len(remaining), ROUTER_BATCH_SIZE):
+        group = remaining[start:start + ROUTER_BATCH_SIZE]
+        statements = "\n".join(f"{n + 1}: {inputs[i]}" for n, i in enumerate(group))
+        try:
+            found = parse_batch_intents(batch_router_chain.invoke({"statements": statements}), len(group))
+        except StageUnavailable as e:
+            print(f"Batch: Router unavailable ({e}), using keyword rules.")
+            found = {}
+        for n, i in enumerate(group):
+            intents[i] = found.get(n) or brain.fallback_intent(inputs[i])
+    return intents
+
+
+def run_batch(inputs: list) -> list:
+    """
+    Processes many inputs at once and returns one result per input (same order):
+      1. classify everything (batched router),
+      2. save ALL notes in a single embed + upsert pass,
+      3. run system commands one by one, in order (they have side effects),
+      4. answer the questions concurrently.
+    Notes are saved before questions run, so a batch can add notes and ask about them.
+    """
+    started = time.perf_counter()
+    intents = classify_batch(inputs)
+    results = [{"index": i, "user_text": text, "intent": intent} for i, (text, intent) in enumerate(zip(inputs, intents))]
+    by_intent = {}
+    for i, intent in enumerate(intents):
+        by_intent.setdefault(intent, []).append(i)
+    counts = {intent: len(items) for intent, items in by_intent.items()}
+    print(f"Batch: {len(inputs)} items classified in {time.perf_counter() - started:.2f}s {counts}")
+
+    def finish(i, full_answer, needs_summary=False, status="ok"):
+        results[i].update(brain.make_response(full_answer, needs_summary), status=status)
+
+    # Greetings: canned
+    for i in by_intent.get("GREETING", []):
+        finish(i, "Hi there! How can I help you?")
+
+    # INGEST: one pass
+    notes = by_intent.get("INGEST", [])
+    if notes:
+        try:
+            memory_tool.add_notes_to_memory([inputs[i] for i in notes])
+            for i in notes:
+                finish(i, "Got it. I've saved that to my memory.")
+        except Exception as e:
+            print(f"Batch: Saving notes failed: {e}")
+            for i in notes:
+                finish(i, "I couldn't save that note.", status="error")
+
+    # SYSTEM_COMMAND: sequential, in input order
+    for i in by_intent.get("SYSTEM_COMMAND", []):
+        try:
+            finish(i, system_tool.execute_system_command(inputs[i]))
+        except Exception as e:
+            print(f"Batch: Command {i} failed: {e}")
+            finish(i, "I couldn't run that command.", status="error")
+
+    # Questions: concurrently
+    def answer(i):
+        full_answer, needs_summary = brain.run_intent(intents[i], inputs[i])
+        return brain.make_response(full_answer, needs_summary)
+
+    futures = {i: _query_pool.submit(answer, i)
+               for intent in QUERY_INTENTS for i in by_intent.get(intent, [])}
+    for i, future in futures.items():
+        try:
+            results[i].update(future.result(), status="ok")
+        except Exception as e:
+            print(f"Batch: Question {i} failed: {e}")
+            finish(i, "I encountered an error answering that.", status="error")
+
+    print(f"Batch: {len(inputs)} items done in {time.perf_counter() - started:.2f}s")
+    return results
@@ -1,16 +1,20 @@
 import os
+import time
 import uuid
-import chromadb
 from langchain_core.prompts import PromptTemplate
 from langchain_core.runnables import RunnablePassthrough
 from langchain_core.output_parsers import StrOutputParser
 from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_chroma import Chroma
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
 # --- UPDATED: Import all 4 tools ---
 from backend import memory_tool, general_tool, system_tool, vision_tool
+from backend import planner
+from backend.conversation import conversation_store
+from backend.llm_memo import memoized
+from backend.resilience import guarded, StageUnavailable
+from backend.command_parser import fast_parse, normalize_command
+from backend import profiling
 # ---
 
 # --- 1. Get the API Key ---
@@ -22,7 +26,8 @@ if not GOOGLE_API_KEY:
 print("Brain: Initializing...")
 # --- FIX: Added 'google_api_key=GOOGLE_API_KEY' back in ---
 rag_llm = ChatGoogleGenerativeAI(model="gemini-flash-latest", temperature=0, google_api_key=GOOGLE_API_KEY)
-router_llm = ChatGoogleGenerativeAI(model="gemini-flash-latest", temperature=0, google_api_key=GOOGLE_API_KEY)
+# --- NEW: temperature=0 -> identical prompts are answered from the memo ---
+router_llm = memoized(guarded(ChatGoogleGenerativeAI(model="gemini-flash-latest", temperature=0, google_api_key=GOOGLE_API_KEY), "router"))
 general_llm = ChatGoogleGenerativeAI(model="gemini-pro-latest", temperature=0.7, google_api_key=GOOGLE_API_KEY)
 # --- END OF FIX ---
 
@@ -39,7 +44,7 @@ Classify the user's intent into one of six categories:
 3. 'INGEST': User is stating a new fact or note to be saved (e.g., "Remember that...", "My new idea is...").
 4. 'PERSONAL_QUERY': User is asking a question about themselves, their plans, or their saved notes (e.g., "What's my project idea?", "What's on my shopping list?").
 5. 'GENERAL_KNOWLEDGE': User is asking a general fact-based question about the world (e.g., "What is the capital of India?", "How does a car engine work?").
-6. 'SYSTEM_COMMAND': User is asking to perform an action on the computer (e.g., "Open Chrome", "Set a timer for 20 seconds", "Close this app").
+6. 'SYSTEM_COMMAND': User is asking to perform an action on the computer, including timers and reminders (e.g., "Open Chrome", "Set a timer for 20 seconds", "Remind me to stretch in an hour", "Cancel my timer", "Close this app").
 
 Respond with ONLY the category name (e.g., "CONVERSATION", "VISION", "INGEST", "PERSONAL_QUERY", "GENERAL_KNOWLEDGE", "SYSTEM_COMMAND").
 
@@ -58,7 +63,30 @@ Summary:
 """
 summarizer_prompt = PromptTemplate.from_template(summarizer_prompt_template)
 # --- FIX: Added 'google_api_key=GOOGLE_API_KEY' back in ---
-summarizer_chain = summarizer_prompt | ChatGoogleGenerativeAI(model="gemini-flash-latest", temperature=0, google_api_key=GOOGLE_API_KEY) | StrOutputParser()
+summarizer_chain = summarizer_prompt | memoized(guarded(ChatGoogleGenerativeAI(model="gemini-flash-latest", temperature=0, google_api_key=GOOGLE_API_KEY), "summarizer")) | StrOutputParser()
+
+# Same answer -> same summary (e.g. a cached personal-memory answer); the memo handles it
+def summarize(full_text):
+    try:
+        return summarizer_chain.invoke({"full_text": full_text})
+    except StageUnavailable as e:
+        # Local fallback: the first sentence is a decent spoken summary
+        print(f"Summarizer unavailable ({e}), using the first sentence.")
+        first_sentence = full_text.strip().split(". ")[0].strip()
+        return first_sentence if len(first_sentence) <= 200 else first_sentence[:197] + "..."
+
+# --- NEW: Router fallback (keyword rules) for when the router LLM is unavailable ---
+def fallback_intent(user_input):
+    lowered = user_input.lower()
+    if fast_parse(normalize_command(user_input)) is not None:
+        return "SYSTEM_COMMAND"
+    if lowered.startswith(("remember", "note that", "save", "my new")):
+        return "INGEST"
+    if "screen" in lowered:
+        return "VISION"
+    if any(word in lowered.split() for word in ("my", "i", "me")):
+        return "PERSONAL_QUERY"
+    return "GENERAL_KNOWLEDGE"
 
 # --- NEW: Define Greeting Keywords ---
 GREETING_KEYWORDS = ['hello', 'hi', 'hey', 'greeting', 'greetings', 'yo']
@@ -69,62 +97,123 @@ print("--- Brain Initialized ---")
 
 # --- 4. Define Main Logic Function (UPDATED) ---
 
-def get_ai_response(user_input):
+def run_intent(intent, user_input):
     """
-    This is the main function the server will call.
-    It routes the intent and calls the correct tool.
+    Calls the correct tool for an intent.
+    Returns (full_answer, needs_summary).
     """
-    
-    # --- NEW: Simple keyword check for greetings ---
-    # We check this *before* calling the LLM router
-    clean_input = user_input.lower().strip("?!., ")
-    if any(clean_input.startswith(word) for word in GREETING_KEYWORDS):
-        print("[Intent: GREETING] (Hard-coded)")
-        full_answer = "Hi there! How can I help you?"
-        return {
-            "full_text": full_answer,
-            "summary_text": full_answer
-        }
-    # --- END OF NEW CHECK ---
-
-    # 1. Use the LLM Router
-    intent = router_chain.invoke({"user_input": user_input})
-    print(f"[Intent: {intent}]")
-
-    full_answer = ""
-    needs_summary = False
-
-    # 2. Call the correct tool based on the intent
     if "VISION" in intent:
-        full_answer = vision_tool.analyze_screen(user_input)
-        needs_summary = True # Vision answers can be long
+        return vision_tool.analyze_screen(user_input), True # Vision answers can be long
 
     elif "CONVERSATION" in intent: # This will now catch "How are you?"
-        full_answer = general_tool.ask_general_knowledge(user_input)
-        needs_summary = False 
+        return general_tool.ask_general_knowledge(user_input, intent="CONVERSATION"), False
 
     elif "PERSONAL_QUERY" in intent:
-        full_answer = memory_tool.ask_personal_memory(user_input)
-        needs_summary = True
+        return memory_tool.ask_personal_memory(user_input), True
     
     elif "INGEST" in intent:
-        full_answer = memory_tool.add_to_memory(user_input)
-        needs_summary = False
+        return memory_tool.add_to_memory(user_input), False
 
     elif "GENERAL_KNOWLEDGE" in intent:
-        full_answer = general_tool.ask_general_knowledge(user_input)
-        needs_summary = True
+        return general_tool.ask_general_knowledge(user_input), True
 
     elif "SYSTEM_COMMAND" in intent:
-        full_answer = system_tool.execute_system_command(user_input)
-        needs_summary = False
+        return system_tool.execute_system_command(user_input), False
     
     else:
         # Fallback for any unknown intent
         print("[Intent: Fallback to General]")
-        full_answer = general_tool.ask_general_knowledge(user_input)
-        needs_summary = True
+        return general_tool.ask_general_knowledge(user_input), True
+
+# --- NEW: Compound requests ("open Spotify, play Nirvana and remember...") ---
 
+def run_plan(steps):
+    """
+    Runs a multi-step plan (independent steps in parallel) and merges
+    the answers into one. Returns (full_answer, needs_summary).
+    """
+    def run_step(step):
+        print(f"[Step {step['id']}: {step['intent']}] {step['input']}")
+        return run_intent(step["intent"], step["input"])
+
+    start = time.perf_counter()
+    results = planner.execute_plan(steps, run_step)
+    print(f"Plan: {len(steps)} steps finished in {time.perf_counter() - start:.2f}s")
+
+    answers = []
+    needs_summary = False
+    for step, result in zip(steps, results):
+        if isinstance(result, Exception):
+            answers.append(f"I couldn't finish '{step['input']}'.")
+            continue
+        answer, step_needs_summary = result
+        answers.append(answer.strip())
+        needs_summary = needs_summary or step_needs_summary
+
+    return "\n".join(answers), needs_summary
+
+def get_ai_response(user_input, session_id="default"):
+    """
+    This is the main function the server will call.
+    Follow-ups are first rewritten using the session's (token-budgeted)
+    conversation history, then routed like any other request.
+    """
+    standalone_input = conversation_store.contextualize(session_id, user_input)
+    response = respond(standalone_input)
+    conversation_store.record_turn(session_id, standalone_input, response["summary_text"])
+    return response
+
+def respond(user_input):
+    """
+    Routes a standalone request and calls the correct tool(s).
+    """
+    is_compound = planner.looks_compound(user_input)
+
+    # --- NEW: Simple keyword check for greetings ---
+    # We check this *before* calling the LLM router
+    clean_input = user_input.lower().strip("?!., ")
+    if not is_compound and any(clean_input.startswith(word) for word in GREETING_KEYWORDS):
+        print("[Intent: GREETING] (Hard-coded)")
+        profiling.tag(intent="GREETING")
+        full_answer = "Hi there! How can I help you?"
+        return {
+            "full_text": full_answer,
+            "summary_text": full_answer
+        }
+    # --- END OF NEW CHECK ---
+
+    steps = None
+    if is_compound:
+        # 1a. Multi-part request: ask the planner for sub-tasks instead of one intent
+        try:
+            steps = planner.make_plan(user_input)
+        except Exception as e:
+            print(f"Planner failed ({e}), falling back to the router.")
+
+    if steps and len(steps) > 1:
+        # 2a. Run the plan and merge the answers
+        profiling.tag(intent="PLAN")
+        full_answer, needs_summary = run_plan(steps)
+    else:
+        if steps:
+            intent = steps[0]["intent"]
+        else:
+            # 1. Use the LLM Router (keyword rules if it's unavailable)
+            try:
+                intent = router_chain.invoke({"user_input": user_input})
+            except StageUnavailable as e:
+                print(f"Router unavailable ({e}), using keyword rules.")
+                intent = fallback_intent(user_input)
+        print(f"[Intent: {intent}]")
+        profiling.tag(intent=intent.strip())
+
+        # 2. Call the correct tool based on the intent
+        full_answer, needs_summary = run_intent(intent, user_input)
+
+    return make_response(full_answer, needs_summary)
+
+def make_response(full_answer, needs_summary):
+    """Builds the {full_text, summary_text} object the UI and speaker use."""
     # 3. Create the final response object
     response = {
         "full_text": full_answer,
@@ -134,7 +223,6 @@ def get_ai_response(user_input):
     # 4. Summarize if needed
     if needs_summary and len(full_answer) > 70: # Only summarize long answers
         print("Summarizing full answer...")
-        summary = summarizer_chain.invoke({"full_text": full_answer})
-        response["summary_text"] = summary
+        response["summary_text"] = summarize(full_answer)
         
-    return response
\ No newline at end of file
+    return response
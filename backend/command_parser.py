@@ -0,0 +1,247 @@
+import re
+import json
+
+# --- App Map (moved here from system_tool so the parser can match app names) ---
+APP_MAP = {
+    "chrome": "Google Chrome",
+    "vscode": "Visual Studio Code",
+    "spotify": "Spotify",
+    "textedit": "TextEdit",
+    "notes": "Notes",
+    "terminal": "Terminal"
+}
+
+# Every spoken name we accept for an app -> its APP_MAP key
+APP_ALIASES = {alias: alias for alias in APP_MAP}
+APP_ALIASES.update({real.lower(): alias for alias, real in APP_MAP.items()})
+APP_ALIASES.update({
+    "google": "chrome",
+    "vs code": "vscode",
+    "visual studio": "vscode",
+    "text edit": "textedit",
+})
+
+# --- Schema for parsed commands ---
+# command -> {field: (type, required)}
+COMMAND_SCHEMA = {
+    "open_app": {"app_name": (str, True)},
+    "timer": {"duration": (int, True)},
+    "open_website": {"url": (str, True)},
+    "play_spotify": {"song_name": (str, True), "artist_name": (str, False)},
+    "reminder": {"message": (str, True), "duration": (int, True), "interval": (int, False)},
+    "list_timers": {},
+    "cancel_timer": {"target": (str, False)},
+    "snooze_timer": {"duration": (int, False), "target": (str, False)},
+    "unrecognized": {"reason": (str, False)},
+}
+
+# --- Number words (for "set a timer for five minutes") ---
+NUMBER_WORDS = {
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+    "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10, "eleven": 11,
+    "twelve": 12, "thirteen": 13, "fourteen": 14, "fifteen": 15, "sixteen": 16,
+    "seventeen": 17, "eighteen": 18, "nineteen": 19, "twenty": 20, "thirty": 30,
+    "forty": 40, "forty five": 45, "fifty": 50, "sixty": 60, "ninety": 90,
+    "half a": 0.5, "half an": 0.5,
+}
+
+UNIT_SECONDS = {
+    "s": 1, "sec": 1, "secs": 1, "second": 1, "seconds": 1,
+    "m": 60, "min": 60, "mins": 60, "minute": 60, "minutes": 60,
+    "h": 3600, "hr": 3600, "hrs": 3600, "hour": 3600, "hours": 3600,
+    "day": 86400, "days": 86400,
+}
+
+# --- Grammar (compiled once) ---
+_NUMBER = r"(?:\d+(?:\.\d+)?|" + "|".join(sorted((re.escape(w) for w in NUMBER_WORDS), key=len, reverse=True)) + r")"
+_UNIT = r"(?:" + "|".join(sorted(UNIT_SECONDS, key=len, reverse=True)) + r")"
+_DURATION_PART = re.compile(rf"(?P<num>{_NUMBER})\s*-?\s*(?P<unit>{_UNIT})\b")
+_DURATION = rf"{_NUMBER}\s*-?\s*{_UNIT}(?:\s*(?:,|and)?\s*{_NUMBER}\s*-?\s*{_UNIT})*"
+
+_POLITE = r"(?:(?:hey\s+)?lumi,?\s+)?(?:please\s+|can you\s+|could you\s+)?"
+
+TIMER_PATTERNS = [
+    # "set a timer for 5 minutes", "timer for 1 hour and 30 minutes"
+    re.compile(rf"^{_POLITE}(?:set|start|make)?\s*(?:a|the)?\s*timer\s+(?:for\s+)?(?P<duration>{_DURATION})$"),
+    # "set a 5 minute timer"
+    re.compile(rf"^{_POLITE}(?:set|start|make)?\s*(?:a|an)?\s*(?P<duration>{_DURATION})\s+timer$"),
+]
+# "remind me to stretch in 20 minutes", "remind me every hour to drink water"
+REMINDER_PATTERNS = [
+    re.compile(rf"^{_POLITE}remind me\s+(?:to\s+|that\s+|about\s+)?(?P<message>.+?)\s+(?P<mode>in|every)\s+(?P<duration>{_DURATION}|{_UNIT})$"),
+    re.compile(rf"^{_POLITE}remind me\s+(?P<mode>in|every)\s+(?P<duration>{_DURATION}|{_UNIT})\s+(?:to\s+|that\s+|about\s+)?(?P<message>.+)$"),
+]
+LIST_TIMERS_PATTERN = re.compile(
+    rf"^{_POLITE}(?:(?:list|show|tell me|what are)\s+(?:me\s+)?(?:all\s+)?(?:of\s+)?(?:my|the)?\s*(?:timers?|reminders?)"
+    r"|(?:what|which)\s+(?:timers?|reminders?)\s+(?:do i have|are (?:set|running))"
+    r"|do i have any\s+(?:timers?|reminders?))(?:\s+(?:and|or)\s+(?:timers?|reminders?))?(?:\s+(?:set|running))?$"
+)
+CANCEL_TIMER_PATTERN = re.compile(
+    rf"^{_POLITE}(?:cancel|stop|delete|clear|remove)\s+(?P<all>all\s+(?:of\s+)?)?(?:my\s+|the\s+)?(?P<what>.*?)\s*"
+    r"(?:timers?|reminders?|alarms?)(?:\s+(?:number\s+|#)?(?P<id>\d+))?(?:\s+(?:to|about|for)\s+(?P<about>.+))?$"
+)
+SNOOZE_PATTERN = re.compile(
+    rf"^{_POLITE}snooze(?:\s+(?:it|that|this|the\s+(?:timer|reminder|alarm)))?(?:\s+for\s+(?P<duration>{_DURATION}))?$"
+)
+URL_PATTERN = re.compile(
+    r"\b(?:open|go to|visit|browse to|navigate to|take me to)\s+"
+    r"(?P<url>(?:https?://)?(?:www\.)?[a-z0-9-]+(?:\.[a-z0-9-]+)*\.[a-z]{2,}(?:/\S*)?)$"
+)
+OPEN_APP_PATTERN = re.compile(rf"^{_POLITE}(?:open|launch|start)\s+(?:up\s+)?(?:the\s+)?(?P<app>.+?)(?:\s+app(?:lication)?)?$")
+PLAY_PATTERN = re.compile(
+    rf"^{_POLITE}play\s+(?:the\s+song\s+|the\s+track\s+|song\s+)?(?P<song>.+?)"
+    r"(?:\s+by\s+(?P<artist>.+?))?(?:\s+on\s+spotify)?$"
+)
+
+
+def tidy_command(user_input: str) -> str:
+    """Collapses whitespace and drops trailing punctuation, keeping the original case."""
+    return " ".join(user_input.split()).strip(" .!?")
+
+
+def normalize_command(user_input: str) -> str:
+    """Lowercases, collapses whitespace and drops trailing punctuation."""
+    return tidy_command(user_input).lower()
+
+
+def parse_duration(text: str):
+    """Converts '1 hour and 30 minutes' / 'five minutes' / 'hour' into whole seconds."""
+    if text.strip() in UNIT_SECONDS:
+        return UNIT_SECONDS[text.strip()]  # "every hour"
+    total = 0
+    for match in _DURATION_PART.finditer(text):
+        num = match.group("num")
+        value = NUMBER_WORDS[num] if num in NUMBER_WORDS else float(num)
+        total += value * UNIT_SECONDS[match.group("unit")]
+    return int(round(total)) if total > 0 else None
+
+
+def fast_parse(user_input: str):
+    """
+    Deterministic parser for the common command shapes.
+    Returns a command dict (same shape the LLM produces), or None when the
+    input doesn't match and the LLM should take over.
+    Patterns match the lowercased text; URLs, songs, artists and messages
+    are cut from the original-case input at the same offsets.
+    """
+    original = tidy_command(user_input)
+    text = original.lower()
+
+    def slot(match, name):
+        if len(original) != len(text):  # A few non-ASCII letters change length when lowercased
+            return match.group(name)
+        return original[match.start(name):match.end(name)]
+
+    # 1. Timers
+    for pattern in TIMER_PATTERNS:
+        match = pattern.match(text)
+        if match:
+            duration = parse_duration(match.group("duration"))
+            if duration:
+                return {"command": "timer", "duration": duration}
+
+    # 2. Reminders and timer management
+    for pattern in REMINDER_PATTERNS:
+        match = pattern.match(text)
+        if match:
+            duration = parse_duration(match.group("duration"))
+            if duration:
+                command = {"command": "reminder", "message": slot(match, "message"), "duration": duration}
+                if match.group("mode") == "every":
+                    command["interval"] = duration
+                return command
+
+    if LIST_TIMERS_PATTERN.match(text):
+        return {"command": "list_timers"}
+
+    match = CANCEL_TIMER_PATTERN.match(text)
+    if match:
+        command = {"command": "cancel_timer"}
+        target = "all" if match.group("all") else (match.group("id") or match.group("about") or match.group("what"))
+        if target:
+            command["target"] = target
+        return command
+
+    match = SNOOZE_PATTERN.match(text)
+    if match:
+        command = {"command": "snooze_timer"}
+        if match.group("duration"):
+            command["duration"] = parse_duration(match.group("duration"))
+        return command
+
+    # 3. Websites (checked before apps so "open chrome and go to youtube.com" is a URL)
+    match = URL_PATTERN.search(text)
+    if match:
+        url = slot(match, "url")
+        if not url.lower().startswith(("http://", "https://")):
+            url = "https://" + url
+        return {"command": "open_website", "url": url}
+
+    # 4. Apps we know about
+    match = OPEN_APP_PATTERN.match(text)
+    if match:
+        alias = APP_ALIASES.get(match.group("app"))
+        if alias:
+            return {"command": "open_app", "app_name": alias}
+
+    # 5. "play X by Y (on spotify)"
+    match = PLAY_PATTERN.match(text)
+    if match and match.group("song"):
+        command = {"command": "play_spotify", "song_name": slot(match, "song")}
+        if match.group("artist"):
+            command["artist_name"] = slot(match, "artist")
+        return command
+
+    return None
+
+
+def extract_json_object(raw_text: str) -> dict:
+    """Pulls the first {...} object out of an LLM reply (handles ```json fences)."""
+    start = raw_text.find("{")
+    end = raw_text.rfind("}")
+    if start == -1 or end <= start:
+        raise ValueError(f"No JSON object in parser output: {raw_text!r}")
+    data = json.loads(raw_text[start:end + 1])
+    if not isinstance(data, dict):
+        raise ValueError("Parser output is not a JSON object.")
+    return data
+
+
+def validate_command(data: dict) -> dict:
+    """
+    Checks a parsed command against COMMAND_SCHEMA.
+    Returns a clean copy (unknown fields dropped) or raises ValueError.
+    """
+    command = data.get("command")
+    if command not in COMMAND_SCHEMA:
+        raise ValueError(f"Unknown command: {command!r}")
+
+    clean = {"command": command}
+    for field, (field_type, required) in COMMAND_SCHEMA[command].items():
+        value = data.get(field)
+        if value is None or value == "":
+            if required:
+                raise ValueError(f"'{command}' is missing '{field}'")
+            continue
+
+        if field_type is int:
+            # Accept 300, 300.0 and "300" -- but not True/False
+            if isinstance(value, bool):
+                raise ValueError(f"'{field}' must be a number")
+            if isinstance(value, str) and value.strip().isdigit():
+                value = int(value.strip())
+            if isinstance(value, float) and value.is_integer():
+                value = int(value)
+            if not isinstance(value, int) or value <= 0:
+                raise ValueError(f"'{field}' must be a positive whole number")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            value = str(value)  # e.g. {"target": 3}
+        elif not isinstance(value, field_type):
+            raise ValueError(f"'{field}' must be a {field_type.__name__}")
+        else:
+            value = value.strip()
+            if not value and required:
+                raise ValueError(f"'{command}' is missing '{field}'")
+
+        clean[field] = value
+    return clean
@@ -0,0 +1,135 @@
+import os
+import re
+import threading
+
+# --- Packing Settings ---
+DEFAULT_CONTEXT_TOKENS = int(os.environ.get("LUMI_CONTEXT_PACK_TOKENS", "1500"))
+MIN_OVERLAP_CHARS = 30        # Shortest suffix/prefix match we treat as a real overlap
+MAX_OVERLAP_CHARS = 400       # Splitter overlap is 200; leave some slack
+NEAR_DUPLICATE_JACCARD = 0.85  # Word-shingle similarity above which a chunk is dropped
+# ---
+
+# Running totals so we can see what packing saves (printed per query too)
+PACKING_STATS = {"queries": 0, "tokens_before": 0, "tokens_after": 0}
+_stats_lock = threading.Lock()
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token); good enough for budgeting."""
+    return len(text) // 4 + 1
+
+
+def _merge_overlap(first: str, second: str):
+    """
+    If the end of `first` is the start of `second` (adjacent splitter chunks),
+    returns the two stitched together without the repeated part. Else None.
+    """
+    probe = second[:MIN_OVERLAP_CHARS]
+    if len(probe) < MIN_OVERLAP_CHARS:
+        return None
+    window_start = max(0, len(first) - MAX_OVERLAP_CHARS)
+    idx = first.find(probe, window_start)
+    while idx != -1:
+        overlap = len(first) - idx
+        if second.startswith(first[idx:]):
+            return first + second[overlap:]
+        idx = first.find(probe, idx + 1)
+    return None
+
+
+def _shingles(text: str, size: int = 3) -> set:
+    words = re.findall(r"\w+", text.lower())
+    return {" ".join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+
+
+def _is_near_duplicate(text: str, shingles: set, kept) -> bool:
+    for other_text, other_shingles in kept:
+        if text in other_text:
+            return True
+        union = len(shingles | other_shingles)
+        if union and len(shingles & other_shingles) / union >= NEAR_DUPLICATE_JACCARD:
+            return True
+    return False
+
+
+def pack_documents(docs, max_tokens: int = DEFAULT_CONTEXT_TOKENS) -> str:
+    """
+    Turns retrieved Documents (most relevant first) into a compact context string:
+
+    1. Adjacent/overlapping chunks from the same source are stitched together.
+    2. Near-duplicate chunks are dropped.
+    3. Passages are written as '[n] (source) text' instead of Document reprs.
+    4. Passages are added in relevance order until the token budget is used.
+    """
+    # Each passage: [text, source, best_rank]
+    passages = [[doc.page_content.strip(), doc.metadata.get("source", ""), rank]
+                for rank, doc in enumerate(docs) if doc.page_content.strip()]
+
+    # 1. Merge overlapping neighbours (repeat until nothing changes, so runs of 3+ chunks join up)
+    merged = True
+    while merged:
+        merged = False
+        for i, a in enumerate(passages):
+            for j, b in enumerate(passages):
+                if i == j or a[1] != b[1]:
+                    continue
+                joined = _merge_overlap(a[0], b[0])
+                if joined is not None:
+                    passages[i] = [joined, a[1], min(a[2], b[2])]
+                    del passages[j]
+                    merged = True
+                    break
+            if merged:
+                break
+
+    # 2. Drop near-duplicates, keeping the more relevant copy
+    passages.sort(key=lambda p: p[2])
+    kept = []
+    unique = []
+    for text, source, rank in passages:
+        shingles = _shingles(text)
+        if _is_near_duplicate(text, shingles, kept):
+            continue
+        kept.append((text, shingles))
+        unique.append((text, source))
+
+    # 3 + 4. Compact format, trimmed to budget
+    lines = []
+    budget = max_tokens
+    for n, (text, source) in enumerate(unique, start=1):
+        header = f"[{n}] ({source}) " if source else f"[{n}] "
+        line = header + " ".join(text.split())
+        cost = estimate_tokens(line)
+        if cost > budget:
+            if budget > 50:
+                # Partially include the passage rather than nothing
+                lines.append(line[:budget * 4].rsplit(" ", 1)[0] + " ...")
+            break
+        lines.append(line)
+        budget -= cost
+
+    return "\n".join(lines)
+
+
+def make_context_packer(max_tokens: int = DEFAULT_CONTEXT_TOKENS, label: str = "RAG"):
+    """
+    Returns a function for use between a retriever and a prompt, e.g.
+    {"context": retriever | RunnableLambda(make_context_packer())}.
+    Logs the tokens the old 'stuff the Document list' prompt would have
+    used next to what we actually send.
+    """
+    def pack(docs) -> str:
+        context = pack_documents(docs, max_tokens)
+        before = estimate_tokens(str(docs))
+        after = estimate_tokens(context)
+        with _stats_lock:
+            PACKING_STATS["queries"] += 1
+            PACKING_STATS["tokens_before"] += before
+            PACKING_STATS["tokens_after"] += after
+            total_before = PACKING_STATS["tokens_before"]
+            total_after = PACKING_STATS["tokens_after"]
+        print(f"{label}: Context tokens {before} -> {after} "
+              f"(all queries: {total_before} -> {total_after})")
+        return context
+
+    return pack
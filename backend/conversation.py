@@ -0,0 +1,242 @@
+import os
+import re
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from langchain_core.prompts import PromptTemplate
+from langchain_core.output_parsers import StrOutputParser
+from langchain_google_genai import ChatGoogleGenerativeAI
+
+from backend.database import embedding_function
+from backend.context_packer import estimate_tokens
+from backend.resilience import guarded
+
+# Get API key
+GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY")
+
+# --- Conversation Settings ---
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("LUMI_CONTEXT_TOKENS", "800"))  # Hard cap on history sent per prompt
+KEEP_VERBATIM_TURNS = 4       # Most recent turns kept word-for-word
+RECALL_TOP_K = 2              # Older turns pulled back in by similarity
+RECALL_MIN_SCORE = 0.35       # Cosine similarity needed to recall an old turn
+MAX_TURN_CHARS = 600          # Long answers are clipped before they're stored
+MAX_ARCHIVED_TURNS = 500      # Per session
+SESSION_IDLE_TTL = 60 * 60    # Sessions untouched for an hour are dropped
+MAX_SESSIONS = 100
+# ---
+
+# Real follow-ups: a leading conjunction ("and the weekend?"), "what about ...",
+# a pronoun standing in for the subject ("it was great?") or a pronoun / "the
+# second one" with no noun of its own ("tell me more about it"). A pronoun that
+# opens a noun phrase ("this weekend", "that restaurant on Main St") is not one.
+FOLLOW_UP_PATTERN = re.compile(
+    r"^(?:and|but|so|also|then|what about|how about)\b"
+    r"|^(?:it|they|them|he|she|those|these|his|her|its|their)\b"
+    r"|^(?:that|this)(?:'s|\s+(?:is|was|one|ones)\b|\s*[?.!]*$)"
+    r"|(?<!time is )\b(?:it|that|this|them|those|these|him|her|one|ones)\s*[?.!]*$"
+    r"|\b(?:it|that|this|them)\s+(?:again|too|instead|then)\b"
+    r"|\bthe\s+(?:first|second|third|last|previous|other|same)\s+ones?\b",
+    re.IGNORECASE
+)
+# Notes are stored as said: never rewritten, even if they mention "it" or "that"
+NO_REWRITE_PREFIXES = ("remember", "note", "save")
+
+
+def _clip(text: str) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= MAX_TURN_CHARS else text[:MAX_TURN_CHARS] + "..."
+
+
+def _format_turn(turn) -> str:
+    return f"User: {turn['user']}\nLumi: {turn['assistant']}"
+
+
+# --- Chains ---
+# Guarded: on a timeout, contextualize() keeps the raw input and the summary waits
+summary_llm = guarded(ChatGoogleGenerativeAI(model="gemini-flash-latest", temperature=0, google_api_key=GOOGLE_API_KEY), "condense")
+
+rolling_summary_template = """
+Update the running summary of a conversation between a user and their assistant, Lumi.
+Keep names, numbers, lists and decisions. Use at most 4 sentences.
+
+Current summary: "{summary}"
+New exchange:
+{turn}
+
+Updated summary:
+"""
+rolling_summary_chain = PromptTemplate.from_template(rolling_summary_template) | summary_llm | StrOutputParser()
+
+condense_template = """
+Given the conversation so far, rewrite the user's latest message as a single
+standalone request that makes sense without the conversation. Keep it in the
+user's voice. If it is already standalone, return it unchanged.
+
+Conversation so far:
+{history}
+
+Latest message: "{user_input}"
+Standalone request:
+"""
+condense_chain = PromptTemplate.from_template(condense_template) | summary_llm | StrOutputParser()
+
+
+class Session:
+    """One conversation: recent turns verbatim, older turns summarized and indexed."""
+
+    def __init__(self):
+        self.recent = []            # Last KEEP_VERBATIM_TURNS turns
+        self.archive = []           # Older turns (text)
+        self.archive_vectors = None  # np.ndarray, one row per archived turn
+        self.summary = ""
+        self.last_used = time.time()
+        self.lock = threading.Lock()
+
+
+class ConversationStore:
+    """
+    Per-session multi-turn memory with a hard token budget.
+
+    Prompt history is built from (in priority order) the most recent turns,
+    older turns recalled by embedding similarity, and a rolling summary of
+    everything else -- trimmed until it fits CONTEXT_TOKEN_BUDGET, so prompt
+    size stays flat however long a session runs.
+    """
+
+    def __init__(self, token_budget=CONTEXT_TOKEN_BUDGET):
+        self.token_budget = token_budget
+        self._sessions = {}
+        self._lock = threading.Lock()
+        # Summaries are updated off the request path, one at a time
+        self._background = ThreadPoolExecutor(max_workers=1, thread_name_prefix="conversation-summary")
+
+    def _session(self, session_id) -> Session:
+        now = time.time()
+        with self._lock:
+            # Drop idle sessions (and the oldest ones if there are too many)
+            expired = [sid for sid, s in self._sessions.items() if now - s.last_used > SESSION_IDLE_TTL]
+            for sid in expired:
+                del self._sessions[sid]
+            if session_id not in self._sessions and len(self._sessions) >= MAX_SESSIONS:
+                oldest = min(self._sessions, key=lambda sid: self._sessions[sid].last_used)
+                del self._sessions[oldest]
+
+            session = self._sessions.setdefault(session_id, Session())
+            session.last_used = now
+            return session
+
+    # --- Writing ---
+    def record_turn(self, session_id, user_input: str, answer: str):
+        """Stores one exchange; the oldest verbatim turn rolls into the summary."""
+        session = self._session(session_id)
+        turn = {"user": _clip(user_input), "assistant": _clip(answer)}
+
+        with session.lock:
+            session.recent.append(turn)
+            if len(session.recent) <= KEEP_VERBATIM_TURNS:
+                return
+            rolled = session.recent.pop(0)
+
+        self._background.submit(self._archive_turn, session, rolled)
+
+    def _archive_turn(self, session, turn):
+        text = _format_turn(turn)
+        try:
+            vector = np.asarray(embedding_function.embed_query(text), dtype=np.float32)
+            summary = rolling_summary_chain.invoke({"summary": session.summary, "turn": text}).strip()
+        except Exception as e:
+            print(f"Conversation: Failed to archive turn: {e}")
+            return
+
+        with session.lock:
+            session.archive.append(turn)
+            if session.archive_vectors is None:
+                session.archive_vectors = vector[None, :]
+            else:
+                session.archive_vectors = np.vstack([session.archive_vectors, vector])
+            if len(session.archive) > MAX_ARCHIVED_TURNS:
+                session.archive.pop(0)
+                session.archive_vectors = session.archive_vectors[1:]
+            session.summary = summary
+
+    # --- Reading ---
+    def _recall(self, session, user_input):
+        """Older turns most similar to the new message (not just the most recent)."""
+        if session.archive_vectors is None:
+            return []
+        query = np.asarray(embedding_function.embed_query(user_input), dtype=np.float32)
+        scores = session.archive_vectors @ query  # Vectors are normalized -> cosine similarity
+        best = np.argsort(-scores)[:RECALL_TOP_K]
+        return [session.archive[i] for i in sorted(best) if scores[i] >= RECALL_MIN_SCORE]
+
+    def build_history(self, session_id, user_input: str) -> str:
+        """Conversation context for the next prompt, never over the token budget."""
+        session = self._session(session_id)
+        with session.lock:
+            recent = list(session.recent)
+            summary = session.summary
+            recalled = self._recall(session, user_input) if session.archive else []
+
+        budget = self.token_budget
+        parts = []
+
+        # 1. Newest turns first -- they matter most for follow-ups
+        recent_parts = []
+        for turn in reversed(recent):
+            text = _format_turn(turn)
+            if estimate_tokens(text) > budget:
+                break
+            recent_parts.insert(0, text)
+            budget -= estimate_tokens(text)
+
+        # 2. Relevant older turns
+        recalled_parts = []
+        for turn in recalled:
+            text = _format_turn(turn)
+            if estimate_tokens(text) <= budget:
+                recalled_parts.append(text)
+                budget -= estimate_tokens(text)
+
+        # 3. Summary of everything else (clipped to what's left)
+        if summary and budget > 20:
+            parts.append("Summary of earlier conversation: " + summary[:budget * 4])
+        if recalled_parts:
+            parts.append("Related earlier turns:\n" + "\n".join(recalled_parts))
+        if recent_parts:
+            parts.append("Recent turns:\n" + "\n".join(recent_parts))
+
+        history = "\n\n".join(parts)
+        if history:
+            print(f"Conversation: {estimate_tokens(history)} history tokens (budget {self.token_budget})")
+        return history
+
+    def has_history(self, session_id) -> bool:
+        session = self._session(session_id)
+        return bool(session.recent or session.summary)
+
+    def contextualize(self, session_id, user_input: str) -> str:
+        """
+        Rewrites a follow-up ("and what about the second one?") into a
+        standalone request. Standalone inputs are returned untouched, so
+        only real follow-ups pay for the extra (bounded-size) LLM call.
+        """
+        if user_input.strip().lower().startswith(NO_REWRITE_PREFIXES):
+            return user_input
+        if not self.has_history(session_id) or not FOLLOW_UP_PATTERN.search(user_input.strip()):
+            return user_input
+
+        history = self.build_history(session_id, user_input)
+        try:
+            standalone = condense_chain.invoke({"history": history, "user_input": user_input}).strip().strip('"')
+        except Exception as e:
+            print(f"Conversation: Could not rewrite follow-up: {e}")
+            return user_input
+
+        if standalone and standalone != user_input:
+            print(f"Conversation: Rewrote follow-up as '{standalone}'")
+        return standalone or user_input
+
+
+conversation_store = ConversationStore()
@@ -1,4 +1,7 @@
 import os
+import bisect
+import threading
+import numpy as np
 from PIL import Image
 import pytesseract
 import pymupdf  # fitz
@@ -6,110 +9,323 @@ from io import BytesIO
 
 from langchain_community.vectorstores import FAISS
 from langchain_core.prompts import PromptTemplate
-from langchain_core.runnables import RunnablePassthrough
+from langchain_core.runnables import RunnablePassthrough, RunnableLambda
 from langchain_core.output_parsers import StrOutputParser
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
 # Import components we already have
 from backend.database import embedding_function
 from backend.brain import general_llm # Use the same LLM
+from backend.context_packer import make_context_packer
+from backend import profiling
+from backend.ann_index import build_doc_index, DOC_INDEX, DOC_ANN_MIN_CHUNKS
 
 # --- State Management ---
 # This will hold our in-memory RAG chain for the *current* document
 CURRENT_DOC_CHAIN = None
 # ---
 
-def extract_text_from_file(file_path):
-    """Extracts text from PDF or Image using OCR."""
-    print(f"Processor: Extracting text from {file_path}")
-    text = ""
-    
-    if file_path.lower().endswith('.pdf'):
-        doc = pymupdf.open(file_path)
-        for page_num, page in enumerate(doc):
-            # 1. First, try to get simple text
-            text += page.get_text()
-            
-            # 2. Then, get images and OCR them (for scanned PDFs)
-            image_list = page.get_images(full=True)
-            for img_index, img in enumerate(image_list):
-                xref = img[0]
-                base_image = doc.extract_image(xref)
-                image_bytes = base_image["image"]
-                
-                try:
-                    pil_image = Image.open(BytesIO(image_bytes))
-                    text += pytesseract.image_to_string(pil_image)
-                    print(f"  ... OCR'd image from page {page_num + 1}")
-                except Exception as e:
-                    print(f"Error processing image on page {page_num + 1}: {e}")
-        doc.close()
-        
-    elif file_path.lower().endswith(('.png', '.jpg', '.jpeg')):
+SUPPORTED_IMAGES = ('.png', '.jpg', '.jpeg')
+RETRIEVER_K = 4
+
+# --- Hierarchical index settings ---
+OUTLINE_MAX_LEVEL = 2      # PDF outline levels that start a new section
+MAX_SECTION_PAGES = 40     # Longer sections (or docs without an outline) are split into page ranges
+SECTIONS_TO_SEARCH = 3     # Coarse step: how many sections get a fine-grained search
+HEADING_WEIGHT = 0.5       # How much a section's heading counts next to its content centroid
+# ---
+
+text_splitter = RecursiveCharacterTextSplitter(
+    chunk_size=1000,
+    chunk_overlap=200
+)
+
+# --- Text Extraction (works on bytes, no temp files needed) ---
+
+def is_supported(filename):
+    return filename.lower().endswith(('.pdf',) + SUPPORTED_IMAGES)
+
+def count_pages(file_bytes, filename):
+    """Number of pages to extract (images count as one page)."""
+    if filename.lower().endswith('.pdf'):
+        with pymupdf.open(stream=file_bytes, filetype="pdf") as doc:
+            return doc.page_count
+    return 1
+
+def read_sections(file_bytes, filename, page_count):
+    """
+    Splits the document into sections: [(title, start_page, end_page), ...].
+    Uses the PDF outline (bookmarks) when there is one; otherwise, and for
+    very long sections, falls back to plain page ranges.
+    """
+    starts = {}
+    if filename.lower().endswith('.pdf'):
+        with pymupdf.open(stream=file_bytes, filetype="pdf") as doc:
+            for level, title, page in doc.get_toc(simple=True):
+                if level <= OUTLINE_MAX_LEVEL and 1 <= page <= page_count and title.strip():
+                    # Several headings on one page -> one section
+                    starts.setdefault(page - 1, []).append(title.strip())
+    if starts and 0 not in starts:
+        starts[0] = []
+
+    sections = []
+    boundaries = sorted(starts) or [0]
+    for i, start in enumerate(boundaries):
+        end = boundaries[i + 1] if i + 1 < len(boundaries) else page_count
+        title = " > ".join(starts.get(start, []))
+        for part_start in range(start, max(end, start + 1), MAX_SECTION_PAGES):
+            part_end = min(end, part_start + MAX_SECTION_PAGES)
+            sections.append((title, part_start, max(part_end, part_start + 1)))
+    return sections
+
+def extract_page_texts(file_bytes, filename, start, end):
+    """Extracts [(page_num, text), ...] (with OCR) from pages [start, end) of a PDF or from an image."""
+    pages = []
+
+    if filename.lower().endswith('.pdf'):
+        with pymupdf.open(stream=file_bytes, filetype="pdf") as doc:
+            for page_num in range(start, min(end, doc.page_count)):
+                page = doc[page_num]
+                # 1. First, try to get simple text
+                text = page.get_text()
+
+                # 2. Then, get images and OCR them (for scanned PDFs)
+                for img in page.get_images(full=True):
+                    xref = img[0]
+                    base_image = doc.extract_image(xref)
+                    image_bytes = base_image["image"]
+
+                    try:
+                        pil_image = Image.open(BytesIO(image_bytes))
+                        text += pytesseract.image_to_string(pil_image)
+                        print(f"  ... OCR'd image from page {page_num + 1}")
+                    except Exception as e:
+                        print(f"Error processing image on page {page_num + 1}: {e}")
+                pages.append((page_num, text))
+
+    elif filename.lower().endswith(SUPPORTED_IMAGES):
         try:
-            pil_image = Image.open(file_path)
-            text = pytesseract.image_to_string(pil_image)
+            pil_image = Image.open(BytesIO(file_bytes))
+            pages.append((0, pytesseract.image_to_string(pil_image)))
             print("  ... OCR'd standalone image")
         except Exception as e:
-            print(f"Error processing image {file_path}: {e}")
-            
-    else:
+            print(f"Error processing image {filename}: {e}")
+
+    return pages
+
+def extract_pages(file_bytes, filename, start, end):
+    """Extracts text (with OCR) from pages [start, end) of a PDF or from an image."""
+    return "".join(text for _, text in extract_page_texts(file_bytes, filename, start, end))
+
+def extract_text_from_file(file_path):
+    """Extracts text from PDF or Image using OCR."""
+    print(f"Processor: Extracting text from {file_path}")
+    if not is_supported(file_path):
         return "Unsupported file type."
-        
-    return text
 
-def load_and_process_document(file_path: str) -> str:
-    """Loads, processes, and sets a document as the active RAG chain."""
+    with open(file_path, 'rb') as f:
+        file_bytes = f.read()
+    return extract_pages(file_bytes, file_path, 0, count_pages(file_bytes, file_path))
+
+# --- Document Index (hierarchical; can grow while it is being queried) ---
+
+def _normalize(vector):
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+def chunk_pages(chunks, pages):
+    """
+    The page each chunk starts on. Chunks are cut from the pages' texts joined
+    in order, so each one is found after the previous chunk's start (they overlap).
+    """
+    offsets, position = [], 0
+    for _, page_text in pages:
+        offsets.append(position)
+        position += len(page_text)
+    text = "".join(page_text for _, page_text in pages)
+
+    result, cursor = [], 0
+    for chunk in chunks:
+        found = text.find(chunk, cursor)
+        if found != -1:
+            cursor = found + 1
+        # Not found (the splitter reshaped it): assume it's on the previous chunk's page
+        at = found if found != -1 else max(0, cursor - 1)
+        result.append(pages[max(0, bisect.bisect_right(offsets, at) - 1)][0])
+    return result
+
+
+class DocumentIndex:
+    """
+    Two-level index for one document: each section (chapter / page range) has
+    its own FAISS index of chunks, plus one vector that represents the whole
+    section -- the centroid of its chunks, nudged towards its heading.
+
+    A question first picks the closest sections (one small matrix product over
+    a few hundred section vectors), then searches chunks only inside them, so
+    answers come from the right part of a long manual and the fine search
+    stays small however many chunks the document has.
+
+    Chunks can be added in batches while questions are already being answered
+    from the batches indexed so far.
+    """
+
+    def __init__(self, sections=None):
+        # [(title, start_page, end_page), ...]; default: one section for everything
+        self.sections = sections or [("", 0, 1)]
+        self._starts = [start for _, start, _ in self.sections]
+        self._stores = [None] * len(self.sections)
+        self._sums = [None] * len(self.sections)
+        self._counts = [0] * len(self.sections)
+        self._heading_vectors = [None] * len(self.sections)
+        self._approximate = set()   # Sections whose exact index was swapped for an HNSW / IVF one
+        self._lock = threading.Lock()
+        self.chunk_count = 0
+
+        titles = [(i, title) for i, (title, _, _) in enumerate(self.sections) if title]
+        if titles:
+            vectors = embedding_function.embed_documents([title for _, title in titles])
+            for (i, _), vector in zip(titles, vectors):
+                self._heading_vectors[i] = np.asarray(vector, dtype=np.float32)
+
+    def section_for_page(self, page_num):
+        # Sections are sorted by start page
+        return max(0, bisect.bisect_right(self._starts, page_num) - 1)
+
+    def add_pages(self, page_texts):
+        """Splits [(page_num, text), ...] into chunks and files them under their sections."""
+        by_section = {}
+        for page_num, text in sorted(page_texts):
+            by_section.setdefault(self.section_for_page(page_num), []).append((page_num, text))
+        added = 0
+        for section, pages in by_section.items():
+            text = "".join(page_text for _, page_text in pages)
+            chunks = text_splitter.split_text(text) if text.strip() else []
+            if chunks:
+                self.add_texts(chunks, section=section, pages=chunk_pages(chunks, pages))
+                added += len(chunks)
+        return added
+
+    def add_texts(self, chunks, section=0, pages=None):
+        """pages: the 0-based page each chunk starts on (default: the section's first page)."""
+        # Embed outside the lock so searches aren't blocked by the model
+        vectors = embedding_function.embed_documents(chunks)
+        title, start, _ = self.sections[section]
+        pages = pages or [start] * len(chunks)
+        metadatas = [{"section": title, "page": page + 1} for page in pages]
+        with self._lock:
+            if self._stores[section] is None:
+                self._stores[section] = FAISS.from_embeddings(list(zip(chunks, vectors)), embedding_function, metadatas=metadatas)
+            else:
+                self._stores[section].add_embeddings(list(zip(chunks, vectors)), metadatas=metadatas)
+            total = np.sum(np.asarray(vectors, dtype=np.float32), axis=0)
+            self._sums[section] = total if self._sums[section] is None else self._sums[section] + total
+            self._counts[section] += len(chunks)
+            self.chunk_count += len(chunks)
+            self._maybe_go_approximate(section)
+
+    def _maybe_go_approximate(self, section):
+        """Swaps a section's exact index for an HNSW / IVF one once it's big enough (LUMI_DOC_INDEX)."""
+        if DOC_INDEX == "flat" or self._counts[section] < DOC_ANN_MIN_CHUNKS or section in self._approximate:
+            return
+        store = self._stores[section]
+        flat = store.index
+        index = build_doc_index(flat.reconstruct_n(0, flat.ntotal))
+        if index is not None:
+            store.index = index  # Same ids in the same order, so the docstore mapping still holds
+            self._approximate.add(section)
+            print(f"Processor: Section {section} switched to a {DOC_INDEX} index ({flat.ntotal} chunks).")
+
+    def _section_vectors(self):
+        """(section ids, matrix of section vectors) for sections that have chunks."""
+        ids, vectors = [], []
+        for i, count in enumerate(self._counts):
+            if not count:
+                continue
+            vector = _normalize(self._sums[i] / count)
+            if self._heading_vectors[i] is not None:
+                vector = _normalize(vector + HEADING_WEIGHT * self._heading_vectors[i])
+            ids.append(i)
+            vectors.append(vector)
+        return ids, np.vstack(vectors) if vectors else None
+
+    def search(self, query):
+        query_vector = embedding_function.embed_query(query)
+        with self._lock:
+            ids, section_matrix = self._section_vectors()
+            if section_matrix is None:
+                return []
+
+            # 1. Coarse: closest sections
+            scores = section_matrix @ np.asarray(query_vector, dtype=np.float32)
+            chosen = [ids[i] for i in np.argsort(-scores)[:SECTIONS_TO_SEARCH]]
+
+            # 2. Fine: chunks inside those sections, merged by distance
+            hits = []
+            for section in chosen:
+                hits.extend(self._stores[section].similarity_search_with_score_by_vector(query_vector, k=RETRIEVER_K))
+        hits.sort(key=lambda hit: hit[1])
+        return [doc for doc, _ in hits[:RETRIEVER_K]]
+
+def activate_document(index, name):
+    """Makes `index` the document that /ask-document questions go to."""
     global CURRENT_DOC_CHAIN
-    
+
+    # Create RAG Chain over the (possibly still growing) index
+    template = """
+    Answer the question based *only* on the following context from the document:
+    {context}
+    Question: {question}
+    Answer:
+    """
+    prompt = PromptTemplate.from_template(template)
+
+    retriever = RunnableLambda(index.search)
+    CURRENT_DOC_CHAIN = (
+        {"context": retriever | RunnableLambda(make_context_packer(label="Document RAG")), "question": RunnablePassthrough()}
+        | prompt
+        | general_llm # Reusing the general_llm from brain
+        | StrOutputParser()
+    )
+    print(f"Processor: {name} is ready for questions ({index.chunk_count} chunks indexed so far).")
+
+def clear_document():
+    global CURRENT_DOC_CHAIN
+    CURRENT_DOC_CHAIN = None
+
+def load_and_process_document(file_path: str) -> str:
+    """Loads, processes, and sets a document as the active RAG chain (blocking)."""
+    with profiling.session("load_document"):
+        profiling.tag(filename=os.path.basename(file_path))
+        return _load_and_process_document(file_path)
+
+def _load_and_process_document(file_path: str) -> str:
     try:
-        # 1. Extract Text (with OCR)
-        raw_text = extract_text_from_file(file_path)
-        if not raw_text or raw_text == "Unsupported file type.":
-            CURRENT_DOC_CHAIN = None
+        if not is_supported(file_path):
+            clear_document()
             return f"Error: Unsupported file or no text found."
-        
-        # 2. Split Text
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000, 
-            chunk_overlap=200
-        )
-        chunks = text_splitter.split_text(raw_text)
-        
-        if not chunks:
-            CURRENT_DOC_CHAIN = None
+
+        # 1. Extract Text (with OCR), page by page
+        with open(file_path, 'rb') as f:
+            file_bytes = f.read()
+        page_count = count_pages(file_bytes, file_path)
+        page_texts = extract_page_texts(file_bytes, file_path, 0, page_count)
+
+        # 2. Split into chunks, filed under the document's sections
+        index = DocumentIndex(read_sections(file_bytes, file_path, page_count))
+        if not index.add_pages(page_texts):
+            clear_document()
             return "Error: Could not split text from document."
 
-        # 3. Create In-Memory Vector Store
-        print(f"Processor: Creating in-memory vector store for {len(chunks)} chunks...")
-        vector_store = FAISS.from_texts(
-            texts=chunks, 
-            embedding=embedding_function
-        )
-        retriever = vector_store.as_retriever()
-        
-        # 4. Create RAG Chain
-        template = """
-        Answer the question based *only* on the following context from the document:
-        {context}
-        Question: {question}
-        Answer:
-        """
-        prompt = PromptTemplate.from_template(template)
-        
-        CURRENT_DOC_CHAIN = (
-            {"context": retriever, "question": RunnablePassthrough()}
-            | prompt
-            | general_llm # Reusing the general_llm from brain
-            | StrOutputParser()
-        )
-        
-        print("Processor: Document is loaded and ready for questions.")
+        # 3. Make it the active document
+        print(f"Processor: Indexed {index.chunk_count} chunks in {len(index.sections)} sections.")
+        activate_document(index, os.path.basename(file_path))
+
         return f"Successfully loaded {os.path.basename(file_path)}. Ready for questions."
-        
+
     except Exception as e:
         print(f"Error in load_and_process_document: {e}")
-        CURRENT_DOC_CHAIN = None
+        clear_document()
         return "An error occurred during document processing."
 
 def ask_document_question(user_input: str) -> str:
@@ -117,10 +333,10 @@ def ask_document_question(user_input: str) -> str:
     print("Processor: Received question for document.")
     if CURRENT_DOC_CHAIN is None:
         return "Please upload a document before asking questions about it."
-        
+
     try:
         response = CURRENT_DOC_CHAIN.invoke(user_input)
         return response
     except Exception as e:
         print(f"Error in ask_document_question: {e}")
-        return "I encountered an error trying to answer that question."
\ No newline at end of file
+        return "I encountered an error trying to answer that question."
@@ -0,0 +1,294 @@
+import os
+import re
+import sys
+import json
+import time
+import queue
+import threading
+from collections import deque
+
+# --- Add root_dir to path (so 'backend' imports work when run as a script) ---
+backend_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(backend_dir)
+if root_dir not in sys.path:
+    sys.path.append(root_dir)
+# ---
+
+# --- Migration Settings ---
+LEGACY_COLLECTION = "cognitive_companion_memory"   # The store every install started with...
+LEGACY_EMBED_MODEL = "all-MiniLM-L6-v2"            # ...and the model that filled it
+POINTER_FILE = "active_collection.json"            # Lives next to the Chroma files
+MIGRATION_BATCH_SIZE = int(os.environ.get("LUMI_MIGRATION_BATCH_SIZE", "64"))
+MIGRATION_THREADS = int(os.environ.get("LUMI_MIGRATION_THREADS", "1"))  # Cores the new model may use
+LATENCY_BUDGET_MS = float(os.environ.get("LUMI_MIGRATION_LATENCY_BUDGET_MS", "25"))
+MAX_PAUSE = 2.0               # Longest the job backs off between batches
+MAX_YIELD = 1.0               # Longest it waits for in-flight queries before running a batch anyway
+RECENT_WINDOW = 10.0          # Seconds of foreground latency the throttle looks at
+# ---
+
+# Every collection belongs to exactly one embedding model. The pointer file
+# says which collection is live:
+#   {"collection": ..., "embedding_model": ..., "switched_at": ...,
+#    "previous": {"collection": ..., "embedding_model": ...} or null}
+# A migration fills a NEW collection in the background while queries keep
+# using the live one, then the memory service switches the pointer in one
+# step. The previous collection is kept (and kept up to date) until the
+# migration is finalized, so a rollback loses nothing.
+
+
+def collection_name_for(model_name):
+    """The default model keeps the original collection name, so existing stores are untouched."""
+    if model_name == LEGACY_EMBED_MODEL:
+        return LEGACY_COLLECTION
+    return f"{LEGACY_COLLECTION}__{re.sub(r'[^a-zA-Z0-9]+', '-', model_name).strip('-').lower()}"[:63]
+
+
+def read_pointer(chroma_path):
+    try:
+        with open(os.path.join(chroma_path, POINTER_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def write_pointer(chroma_path, pointer):
+    """Atomic: readers see the old pointer or the new one, never half a file."""
+    path = os.path.join(chroma_path, POINTER_FILE)
+    os.makedirs(chroma_path, exist_ok=True)
+    with open(path + ".tmp", "w") as f:
+        json.dump(pointer, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+class ForegroundMonitor:
+    """What the background job watches: queries in flight and their recent latency."""
+
+    def __init__(self, size=500):
+        self._samples = deque(maxlen=size)   # (finished at, seconds)
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def started(self):
+        with self._lock:
+            self._in_flight += 1
+        return time.perf_counter()
+
+    def finished(self, started):
+        now = time.perf_counter()
+        with self._lock:
+            self._in_flight -= 1
+            self._samples.append((now, now - started))
+
+    def busy(self):
+        return self._in_flight > 0
+
+    def p95_ms(self, within=None):
+        """p95 of all kept samples, or of those from the last `within` seconds (None if there are none)."""
+        cutoff = time.perf_counter() - within if within else float("-inf")
+        with self._lock:
+            ordered = sorted(seconds for at, seconds in self._samples if at >= cutoff)
+        if not ordered:
+            return None
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000
+
+
+class Mirror:
+    """
+    Copies new writes to a second collection, embedded with that collection's
+    model, on a background thread (so /add doesn't wait for a second model).
+    """
+
+    def __init__(self, collection, embedder, write_lock):
+        self.collection = collection
+        self.embedder = embedder
+        self.write_lock = write_lock
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="lumi-mirror", daemon=True)
+        self._thread.start()
+
+    def submit(self, ids, texts, metadatas):
+        self._queue.put((ids, texts, metadatas))
+
+    def _write(self, ids, texts, metadatas, locked=False):
+        vectors = self.embedder.embed_documents(texts)
+        if locked:  # The caller already holds the write lock
+            self.collection.upsert(ids=ids, documents=texts, metadatas=metadatas, embeddings=vectors)
+            return
+        with self.write_lock:
+            self.collection.upsert(ids=ids, documents=texts, metadatas=metadatas, embeddings=vectors)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                self._write(*item)
+            except Exception as e:
+                print(f"Migration: Mirrored write failed: {e}")
+            finally:
+                self._queue.task_done()
+
+    def drain(self):
+        """Blocks until every submitted write has landed (don't hold the write lock)."""
+        self._queue.join()
+
+    def stop(self):
+        self._queue.put(None)
+        self._thread.join()
+
+
+class Migration:
+    """
+    Re-embeds every chunk of `source` into `target` with a new model, in
+    throttled batches. Before each batch it waits (briefly) for in-flight
+    foreground queries to finish, and after each batch it compares the
+    foreground p95 with the p95 from before the migration started: while
+    it's more than LATENCY_BUDGET_MS worse, the pause between batches
+    doubles; once it's back under budget, the pause halves.
+    Writes made meanwhile reach the target through `mirror`.
+    When the copy is done, on_complete(self) performs the switch-over.
+
+    copy_vectors=True rebuilds the index for the SAME model (e.g. with tuned
+    HNSW settings, see ann_index.py): stored vectors are copied, not re-embedded.
+    """
+
+    def __init__(self, source, target, embedder, model_name, monitor, write_lock, on_complete,
+                 copy_vectors=False):
+        self.copy_vectors = copy_vectors
+        self.source = source
+        self.target = target
+        self.embedder = embedder
+        self.model_name = model_name
+        self.monitor = monitor
+        self.write_lock = write_lock
+        self.on_complete = on_complete
+        self.mirror = Mirror(target, embedder, write_lock)
+        self.state = "copying"
+        self.error = None
+        self.done = 0
+        self.total = source.count()
+        self.pause = 0.0
+        self.throttled_seconds = 0.0
+        self.started_at = time.time()
+        self.finished_at = None
+        self.baseline_p95_ms = monitor.p95_ms()
+        self._cancel = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="lumi-migration", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def cancel(self):
+        """Stops the job and its mirror (don't hold the write lock)."""
+        self._cancel.set()
+        self._thread.join()
+        self.mirror.stop()
+        if self.state == "copying":
+            self.state = "cancelled"
+
+    def _yield_to_foreground(self):
+        waited = 0.0
+        while self.monitor.busy() and waited < MAX_YIELD and not self._cancel.is_set():
+            time.sleep(0.005)
+            waited += 0.005
+        return waited
+
+    def _adjust_pause(self):
+        p95 = self.monitor.p95_ms(within=RECENT_WINDOW)
+        if p95 is not None and self.baseline_p95_ms is not None and p95 > self.baseline_p95_ms + LATENCY_BUDGET_MS:
+            self.pause = min(MAX_PAUSE, max(0.05, self.pause * 2))
+        else:
+            self.pause = self.pause / 2 if self.pause > 0.01 else 0.0
+
+    def _run(self):
+        try:
+            offset = 0
+            while not self._cancel.is_set():
+                self.throttled_seconds += self._yield_to_foreground()
+                include = ["documents", "metadatas"] + (["embeddings"] if self.copy_vectors else [])
+                page = self.source.get(limit=MIGRATION_BATCH_SIZE, offset=offset, include=include)
+                if not len(page["ids"]):
+                    break
+                if self.copy_vectors:
+                    vectors = page["embeddings"]
+                else:
+                    vectors = self.embedder.embed_documents(page["documents"])
+                with self.write_lock:
+                    self.target.upsert(ids=page["ids"], documents=page["documents"],
+                                       metadatas=[meta or {} for meta in page["metadatas"]], embeddings=vectors)
+                offset += len(page["ids"])
+                self.done = offset
+                self.total = max(self.source.count(), offset)  # Notes keep arriving meanwhile
+
+                if self.baseline_p95_ms is None:
+                    self.baseline_p95_ms = self.monitor.p95_ms()
+                self._adjust_pause()
+                if self.pause:
+                    self.throttled_seconds += self.pause
+                    self._cancel.wait(self.pause)
+
+            if self._cancel.is_set():
+                return
+            self.state = "switching"
+            self.on_complete(self)
+            self.state = "switched"
+        except Exception as e:
+            print(f"Migration: Failed: {e}")
+            self.state = "failed"
+            self.error = str(e)
+        finally:
+            self.finished_at = time.time()
+
+    def reconcile(self):
+        """Copies anything the paged pass and the mirror missed (call holding the write lock)."""
+        source_ids = set(self.source.get(include=[])["ids"])
+        missing = list(source_ids - set(self.target.get(include=[])["ids"]))
+        for start in range(0, len(missing), MIGRATION_BATCH_SIZE):
+            rows = self.source.get(ids=missing[start:start + MIGRATION_BATCH_SIZE], include=["documents", "metadatas"])
+            self.mirror._write(rows["ids"], rows["documents"], [meta or {} for meta in rows["metadatas"]], locked=True)
+        return len(missing)
+
+    def status(self):
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        remaining = max(0, self.total - self.done)
+        return {
+            "state": self.state,
+            "kind": "rebuild" if self.copy_vectors else "re-embed",
+            "embedding_model": self.model_name,
+            "done": self.done,
+            "total": self.total,
+            "percent": round(100.0 * self.done / self.total, 1) if self.total else 100.0,
+            "chunks_per_second": round(rate, 1),
+            "eta_seconds": round(remaining / rate) if rate and self.state == "copying" else None,
+            "pause_seconds": round(self.pause, 3),
+            "throttled_seconds": round(self.throttled_seconds, 1),
+            "baseline_p95_ms": self.baseline_p95_ms,
+            "foreground_p95_ms": self.monitor.p95_ms(within=RECENT_WINDOW),
+            "error": self.error,
+        }
+
+
+# --- Command line (talks to the memory service, which owns the store) ---
+if __name__ == "__main__":
+    from backend.memory_client import connect
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "status"
+    _, vector_store = connect()
+    if command == "start":
+        # python backend/embedding_migration.py start [model]  (default: LUMI_EMBED_MODEL)
+        print(vector_store.migration("start", model=sys.argv[2] if len(sys.argv) > 2 else None))
+    elif command in ("rebuild", "cancel", "rollback", "finalize"):
+        # rebuild: same model, new index built with the tuned HNSW settings (see ann_index.py)
+        print(vector_store.migration(command))
+    elif command == "watch":
+        while True:
+            status = vector_store.migration("status")
+            print(status)
+            if (status.get("migration") or {}).get("state") != "copying":
+                break
+            time.sleep(2)
+    else:
+        print(vector_store.migration("status"))
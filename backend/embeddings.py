@@ -0,0 +1,272 @@
+import os
+import sys
+import time
+import queue
+import platform
+import threading
+from concurrent.futures import Future
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# --- Embedding Backend Settings ---
+# LUMI_EMBED_BACKEND can be:
+#   'onnx'      -> ONNX Runtime export of the model (same vectors as PyTorch, faster on CPU)
+#   'onnx-int8' -> Quantized int8 ONNX export (fastest, tiny accuracy cost)
+#   'torch'     -> Plain sentence-transformers / PyTorch (the old behaviour)
+EMBED_MODEL_NAME = os.environ.get("LUMI_EMBED_MODEL", "all-MiniLM-L6-v2")
+EMBED_BACKEND = os.environ.get("LUMI_EMBED_BACKEND", "onnx").lower()
+EMBED_THREADS = int(os.environ.get("LUMI_EMBED_THREADS", "0"))  # 0 = let the runtime decide
+EMBED_BATCH_SIZE = int(os.environ.get("LUMI_EMBED_BATCH_SIZE", "64"))
+EMBED_MAX_LENGTH = 256  # all-MiniLM-L6-v2 was trained with max_seq_length=256
+
+# How long the query batcher waits for more concurrent requests before running a batch
+QUERY_BATCH_WAIT = float(os.environ.get("LUMI_EMBED_BATCH_WAIT_MS", "2")) / 1000.0
+QUERY_MAX_BATCH = 32
+# ---
+
+
+def _hub_repo(model_name: str) -> str:
+    """Short names like 'all-MiniLM-L6-v2' live under the sentence-transformers org."""
+    return model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+
+
+def _default_int8_file() -> str:
+    """Picks the quantized export that matches this CPU."""
+    machine = platform.machine().lower()
+    if machine in ("arm64", "aarch64"):
+        return "onnx/model_qint8_arm64.onnx"
+    return "onnx/model_quint8_avx2.onnx"
+
+
+# --- Encoders (one forward pass over an already-chosen batch) ---
+
+class _OnnxEncoder:
+    """Runs the model through ONNX Runtime with mean pooling + L2 normalize."""
+
+    def __init__(self, model_name: str, quantized: bool, threads: int):
+        import onnxruntime as ort
+        from huggingface_hub import hf_hub_download
+        from tokenizers import Tokenizer
+
+        repo = _hub_repo(model_name)
+        if quantized:
+            onnx_file = os.environ.get("LUMI_EMBED_ONNX_FILE", _default_int8_file())
+        else:
+            onnx_file = os.environ.get("LUMI_EMBED_ONNX_FILE", "onnx/model.onnx")
+
+        print(f"Embeddings: Loading ONNX model {repo}/{onnx_file}...")
+        model_path = hf_hub_download(repo, onnx_file)
+        tokenizer_path = hf_hub_download(repo, "tokenizer.json")
+
+        self.tokenizer = Tokenizer.from_file(tokenizer_path)
+        self.tokenizer.no_padding()  # We pad per batch ourselves, after sorting by length
+        self.tokenizer.enable_truncation(max_length=EMBED_MAX_LENGTH)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def token_lengths(self, texts):
+        return [len(e.ids) for e in self.tokenizer.encode_batch(texts)]
+
+    def encode(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        max_len = max(len(e.ids) for e in encodings)
+
+        input_ids = np.zeros((len(encodings), max_len), dtype=np.int64)
+        attention_mask = np.zeros((len(encodings), max_len), dtype=np.int64)
+        for row, enc in enumerate(encodings):
+            input_ids[row, :len(enc.ids)] = enc.ids
+            attention_mask[row, :len(enc.ids)] = 1
+
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+
+        token_embeddings = self.session.run(None, feeds)[0]
+
+        # Mean pooling over real tokens, then normalize (matches the model's Normalize module)
+        mask = attention_mask[..., None].astype(np.float32)
+        summed = (token_embeddings * mask).sum(axis=1)
+        counts = np.clip(mask.sum(axis=1), 1e-9, None)
+        pooled = summed / counts
+        norms = np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled / norms
+
+
+class _TorchEncoder:
+    """
+    Plain sentence-transformers model, with explicit thread settings.
+    torch.set_num_threads is process-wide, so a background encoder
+    (set_threads=False) leaves it alone rather than slowing every other model.
+    """
+
+    def __init__(self, model_name: str, threads: int, set_threads: bool = True):
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        if threads and set_threads:
+            torch.set_num_threads(threads)
+        print(f"Embeddings: Loading PyTorch model {model_name}...")
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.model.max_seq_length = EMBED_MAX_LENGTH
+
+    def token_lengths(self, texts):
+        # Character length is a good enough proxy and avoids tokenizing twice
+        return [len(t) for t in texts]
+
+    def encode(self, texts):
+        return self.model.encode(texts, batch_size=len(texts), convert_to_numpy=True)
+
+
+# --- Dynamic batching for concurrent queries ---
+
+class _QueryBatcher:
+    """
+    Collects embed_query calls that arrive at the same time (e.g. several
+    requests hitting the server at once) and runs them as one forward pass.
+    """
+
+    def __init__(self, encode_fn, max_batch=QUERY_MAX_BATCH, max_wait=QUERY_BATCH_WAIT):
+        self._encode = encode_fn
+        self._max_batch = max_batch
+        self._max_wait = max_wait
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def submit(self, text: str) -> Future:
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.perf_counter() + self._max_wait
+            while len(batch) < self._max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                vectors = self._encode([text for text, _ in batch])
+                for (_, future), vector in zip(batch, vectors):
+                    future.set_result(vector)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+
+
+# --- LangChain-compatible embedding function ---
+
+class LumiEmbeddings(Embeddings):
+    """
+    Drop-in replacement for HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2").
+    Documents are sorted by token length before batching so each batch pads
+    as little as possible; queries go through the dynamic batcher.
+    background=True (e.g. a migration's copy): `threads` limits this model
+    only; with PyTorch that isn't possible, so threads are left as they are.
+    """
+
+    def __init__(self, model_name=EMBED_MODEL_NAME, backend=EMBED_BACKEND,
+                 threads=EMBED_THREADS, batch_size=EMBED_BATCH_SIZE, background=False):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.backend = backend
+
+        if backend in ("onnx", "onnx-int8"):
+            try:
+                self._encoder = _OnnxEncoder(model_name, quantized=(backend == "onnx-int8"), threads=threads)
+            except Exception as e:
+                print(f"Embeddings: ONNX backend failed ({e}). Falling back to PyTorch.")
+                self.backend = "torch"
+                self._encoder = _TorchEncoder(model_name, threads, set_threads=not background)
+        else:
+            self._encoder = _TorchEncoder(model_name, threads, set_threads=not background)
+
+        self._batcher = _QueryBatcher(self._encode_batch)
+        print(f"Embeddings: Ready ({self.model_name}, backend={self.backend}, batch={self.batch_size}).")
+
+    def _encode_batch(self, texts):
+        return np.asarray(self._encoder.encode(texts), dtype=np.float32)
+
+    def embed_documents(self, texts):
+        texts = [t.replace("\n", " ") for t in texts]
+        if not texts:
+            return []
+
+        # Sort by length so every batch holds similarly sized texts (minimal padding)
+        lengths = self._encoder.token_lengths(texts)
+        order = sorted(range(len(texts)), key=lambda i: lengths[i])
+
+        vectors = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            batch_ids = order[start:start + self.batch_size]
+            batch_vectors = self._encode_batch([texts[i] for i in batch_ids])
+            for i, vector in zip(batch_ids, batch_vectors):
+                vectors[i] = vector.tolist()
+        return vectors
+
+    def embed_query(self, text):
+        vector = self._batcher.submit(text.replace("\n", " ")).result()
+        return vector.tolist()
+
+
+# --- Shared instances (one per model) ---
+_shared_embeddings = {}
+_shared_lock = threading.Lock()
+
+
+def get_embedding_function(model_name=EMBED_MODEL_NAME) -> LumiEmbeddings:
+    """Returns the process-wide embedding function for a model, loading it on first use."""
+    with _shared_lock:
+        if model_name not in _shared_embeddings:
+            _shared_embeddings[model_name] = LumiEmbeddings(model_name=model_name)
+        return _shared_embeddings[model_name]
+
+
+# --- Benchmark: python backend/embeddings.py [backend ...] ---
+if __name__ == "__main__":
+    from concurrent.futures import ThreadPoolExecutor
+
+    backends = sys.argv[1:] or ["torch", "onnx", "onnx-int8"]
+    queries = [f"What did I say about project idea number {i}?" for i in range(200)]
+    documents = [("Note %d: " % i) + "I need to remember to buy milk, eggs and bread. " * (1 + i % 12) for i in range(1000)]
+
+    for name in backends:
+        emb = LumiEmbeddings(backend=name)
+        emb.embed_query("warm up")
+
+        # 1. Single query latency
+        timings = []
+        for q in queries:
+            start = time.perf_counter()
+            emb.embed_query(q)
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        p50 = timings[len(timings) // 2]
+        p95 = timings[int(len(timings) * 0.95)]
+
+        # 2. Concurrent queries (exercises the dynamic batcher)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            list(pool.map(emb.embed_query, queries))
+        concurrent_qps = len(queries) / (time.perf_counter() - start)
+
+        # 3. Bulk ingest throughput
+        start = time.perf_counter()
+        emb.embed_documents(documents)
+        docs_per_sec = len(documents) / (time.perf_counter() - start)
+
+        print(f"[{emb.backend}] query p50={p50:.2f}ms p95={p95:.2f}ms | "
+              f"concurrent={concurrent_qps:.0f} q/s | ingest={docs_per_sec:.0f} docs/s")
@@ -1,7 +1,11 @@
 import os
+import re
+import time
+import threading
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langchain_google_genai import ChatGoogleGenerativeAI
+from backend.resilience import guarded, stale_answers, StageUnavailable
 
 # Get API key
 GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY")
@@ -11,11 +15,159 @@ GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY")
 general_llm = ChatGoogleGenerativeAI(model="gemini-pro-latest", temperature=0.7, google_api_key=GOOGLE_API_KEY)
 general_prompt_template = "{user_input}"
 general_prompt = PromptTemplate.from_template(general_prompt_template)
-general_chain = general_prompt | general_llm | StrOutputParser()
+general_chain = general_prompt | guarded(general_llm, "general") | StrOutputParser()
+
+# --- NEW: Fast model for the first attempt (see cascade below) ---
+fast_llm = ChatGoogleGenerativeAI(model="gemini-flash-latest", temperature=0.7, google_api_key=GOOGLE_API_KEY)
+fast_prompt_template = """{user_input}
+
+(After your answer, on its own last line, write CONFIDENCE: HIGH, MEDIUM or LOW
+for how sure you are that your answer is correct and complete.)"""
+fast_prompt = PromptTemplate.from_template(fast_prompt_template)
+fast_chain = fast_prompt | guarded(fast_llm, "general_fast") | StrOutputParser()
+
+# --- Cascade Policy ---
+# mode: 'cascade' (flash first, pro only if a check fails), 'fast' (flash only)
+# or 'pro' (always pro). Override per intent with e.g. LUMI_CASCADE_CONVERSATION=fast
+CASCADE_POLICIES = {
+    "CONVERSATION": {
+        "mode": os.environ.get("LUMI_CASCADE_CONVERSATION", "cascade"),
+        "min_chars": 2,                  # Anything non-empty is a fine reply to small talk
+        "escalate_on": ("LOW",),
+        "escalate_on_hedge": False,      # "I don't have feelings, but..." is a fine reply to "how are you?"
+        "pro_keywords": (),
+    },
+    "GENERAL_KNOWLEDGE": {
+        "mode": os.environ.get("LUMI_CASCADE_GENERAL_KNOWLEDGE", "cascade"),
+        "min_chars": 20,
+        "escalate_on": ("LOW",),
+        "escalate_on_hedge": True,
+        # Questions that need real reasoning skip straight to pro
+        "pro_keywords": ("step by step", "explain why", "compare", "prove", "derive",
+                         "write code", "write a program", "debug", "in detail"),
+    },
+}
+
+CONFIDENCE_PATTERN = re.compile(r"\s*[\(\[]?\s*\**CONFIDENCE:?\**\s*:?\s*(HIGH|MEDIUM|LOW)\W*$", re.IGNORECASE)
+OUTAGE_REPLIES = {
+    "CONVERSATION": "I'm here, but I'm having trouble reaching my language model. Give me a moment.",
+    "GENERAL_KNOWLEDGE": "I can't reach my language model right now. Please try again in a moment.",
+}
+HEDGE_PATTERN = re.compile(r"\b(i'?m not sure|i don'?t know|i cannot answer|i can'?t answer)\b", re.IGNORECASE)
+# ---
+
+
+class CascadeStats:
+    """Counts escalations and estimates the time saved by answering with flash."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.by_intent = {}
+        self.pro_seconds = 0.0     # Total time of every pro call (for the average)
+        self.pro_calls = 0
+
+    def record(self, intent, outcome, fast_seconds=0.0, pro_seconds=None):
+        with self._lock:
+            stats = self.by_intent.setdefault(intent, {
+                "requests": 0, "fast_accepted": 0, "escalated": 0, "direct_pro": 0,
+                "fast_seconds_accepted": 0.0, "fast_seconds_wasted": 0.0,
+            })
+            stats["requests"] += 1
+            stats[outcome] += 1
+            if outcome == "fast_accepted":
+                stats["fast_seconds_accepted"] += fast_seconds
+            elif outcome == "escalated":
+                stats["fast_seconds_wasted"] += fast_seconds
+            if pro_seconds is not None:
+                self.pro_seconds += pro_seconds
+                self.pro_calls += 1
+
+    def report(self):
+        """Per-intent counts plus estimated latency saved (vs. always using pro)."""
+        with self._lock:
+            avg_pro = self.pro_seconds / self.pro_calls if self.pro_calls else None
+            report = {"avg_pro_seconds": round(avg_pro, 2) if avg_pro else None}
+            for intent, stats in self.by_intent.items():
+                entry = dict(stats)
+                if avg_pro is not None:
+                    saved = (stats["fast_accepted"] * avg_pro
+                             - stats["fast_seconds_accepted"] - stats["fast_seconds_wasted"])
+                    entry["latency_saved_seconds"] = round(saved, 2)
+                entry["escalation_rate"] = round(stats["escalated"] / stats["requests"], 2)
+                report[intent] = entry
+            return report
+
+
+cascade_stats = CascadeStats()
+
+
+def _split_confidence(answer):
+    """'Paris.\\nCONFIDENCE: HIGH' -> ('Paris.', 'HIGH'). Missing -> 'MEDIUM'."""
+    match = CONFIDENCE_PATTERN.search(answer)
+    if not match:
+        return answer.strip(), "MEDIUM"
+    return answer[:match.start()].strip(), match.group(1).upper()
+
+
+def _escalation_reason(answer, confidence, policy):
+    """None if the fast answer is good enough, else why it isn't."""
+    if len(answer) < policy["min_chars"]:
+        return "answer too short"
+    if confidence in policy["escalate_on"]:
+        return f"confidence {confidence}"
+    if policy.get("escalate_on_hedge") and HEDGE_PATTERN.search(answer):
+        return "answer hedges"
+    return None
+
+
+def _ask_pro(user_input):
+    start = time.perf_counter()
+    answer = general_chain.invoke(user_input)
+    return answer, time.perf_counter() - start
 
 # --- Define the tool function ---
 
-def ask_general_knowledge(user_input: str) -> str:
-    """Answers general knowledge questions."""
+def ask_general_knowledge(user_input: str, intent: str = "GENERAL_KNOWLEDGE") -> str:
+    """Answers general knowledge (and conversational) questions."""
     print("Tool: Calling General Knowledge")
-    return general_chain.invoke(user_input)
+    try:
+        answer = _cascade(user_input, intent)
+    except StageUnavailable as e:
+        # Outage: last good answer to the same question, else a canned reply
+        print(f"Tool: General model unavailable ({e}), using a local fallback")
+        return stale_answers.recall(intent, user_input) or OUTAGE_REPLIES.get(intent, OUTAGE_REPLIES["GENERAL_KNOWLEDGE"])
+    stale_answers.remember(intent, user_input, answer)
+    return answer
+
+def _cascade(user_input, intent):
+    policy = CASCADE_POLICIES.get(intent, CASCADE_POLICIES["GENERAL_KNOWLEDGE"])
+    lowered = user_input.lower()
+
+    if policy["mode"] == "pro" or any(keyword in lowered for keyword in policy["pro_keywords"]):
+        answer, pro_seconds = _ask_pro(user_input)
+        cascade_stats.record(intent, "direct_pro", pro_seconds=pro_seconds)
+        return answer
+
+    # 1. Fast model first (if it's down or too slow, go straight to pro)
+    start = time.perf_counter()
+    try:
+        answer, confidence = _split_confidence(fast_chain.invoke(user_input))
+    except StageUnavailable as e:
+        print(f"Cascade: flash unavailable ({e}), escalating to pro")
+        answer, pro_seconds = _ask_pro(user_input)
+        cascade_stats.record(intent, "escalated", fast_seconds=time.perf_counter() - start - pro_seconds,
+                             pro_seconds=pro_seconds)
+        return answer
+    fast_seconds = time.perf_counter() - start
+
+    reason = None if policy["mode"] == "fast" else _escalation_reason(answer, confidence, policy)
+    if reason is None:
+        cascade_stats.record(intent, "fast_accepted", fast_seconds=fast_seconds)
+        print(f"Cascade: flash answered in {fast_seconds:.2f}s (confidence {confidence})")
+        return answer
+
+    # 2. Escalate
+    print(f"Cascade: escalating to pro ({reason})")
+    answer, pro_seconds = _ask_pro(user_input)
+    cascade_stats.record(intent, "escalated", fast_seconds=fast_seconds, pro_seconds=pro_seconds)
+    return answer
@@ -0,0 +1,138 @@
+import os
+import time
+import threading
+
+import numpy as np
+
+# --- Hot Tier Settings ---
+HOT_MAX_AGE = float(os.environ.get("LUMI_HOT_MAX_AGE_DAYS", "7")) * 86400  # Notes younger than this stay hot
+HOT_MAX_SIZE = int(os.environ.get("LUMI_HOT_MAX_SIZE", "20000"))
+HOT_SWEEP_INTERVAL = 10 * 60          # How often old notes are aged out
+HOT_CONFIDENT_DISTANCE = 0.6          # L2^2 on unit vectors (~cosine 0.7): good enough to skip the cold tier
+# ---
+
+
+def merge_hits(*hit_lists, k):
+    """Merges [(id, text, metadata, distance), ...] lists by distance, dropping duplicate ids."""
+    seen = set()
+    merged = []
+    for hit in sorted((h for hits in hit_lists for h in hits), key=lambda h: h[3]):
+        if hit[0] in seen:
+            continue
+        seen.add(hit[0])
+        merged.append(hit)
+        if len(merged) == k:
+            break
+    return merged
+
+
+class HotMemory:
+    """
+    Exact-search tier for recent notes: one NumPy matrix of unit vectors,
+    searched with a single matrix-vector product. Distances are squared L2
+    (2 - 2*cosine for unit vectors) so they line up with Chroma's default
+    metric and results from both tiers can be merged directly.
+    """
+
+    def __init__(self, max_age=HOT_MAX_AGE, max_size=HOT_MAX_SIZE):
+        self.max_age = max_age
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._vectors = None      # (n, dim) float32
+        self._ids = []
+        self._texts = []
+        self._metadatas = []
+        self._added_at = []
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add(self, ids, texts, metadatas, vectors, added_at=None):
+        if not ids:
+            return
+        vectors = np.asarray(vectors, dtype=np.float32)
+        stamps = added_at or [m.get("added_at", time.time()) for m in metadatas]
+        with self._lock:
+            # Re-adding an id (upsert) replaces the old row
+            self._remove_locked(set(ids))
+            self._vectors = vectors if self._vectors is None else np.vstack([self._vectors, vectors])
+            self._ids.extend(ids)
+            self._texts.extend(texts)
+            self._metadatas.extend(metadatas)
+            self._added_at.extend(stamps)
+            if len(self._ids) > self.max_size:
+                self._keep_locked(np.arange(len(self._ids) - self.max_size, len(self._ids)))
+
+    def clear(self):
+        with self._lock:
+            self._vectors = None
+            self._ids, self._texts, self._metadatas, self._added_at = [], [], [], []
+
+    def _keep_locked(self, keep):
+        keep = np.asarray(keep, dtype=np.int64)
+        if self._vectors is not None:
+            self._vectors = self._vectors[keep] if len(keep) else None
+        self._ids = [self._ids[i] for i in keep]
+        self._texts = [self._texts[i] for i in keep]
+        self._metadatas = [self._metadatas[i] for i in keep]
+        self._added_at = [self._added_at[i] for i in keep]
+
+    def _remove_locked(self, ids):
+        if any(i in ids for i in self._ids):
+            self._keep_locked([n for n, i in enumerate(self._ids) if i not in ids])
+
+    def age_out(self):
+        """Drops notes older than max_age (they're still in the cold tier)."""
+        cutoff = time.time() - self.max_age
+        with self._lock:
+            keep = [n for n, stamp in enumerate(self._added_at) if stamp >= cutoff]
+            dropped = len(self._ids) - len(keep)
+            if dropped:
+                self._keep_locked(keep)
+        if dropped:
+            print(f"HotMemory: Aged out {dropped} notes ({len(self)} still hot).")
+
+    def start_sweeper(self, interval=HOT_SWEEP_INTERVAL):
+        def sweep():
+            while True:
+                time.sleep(interval)
+                self.age_out()
+        threading.Thread(target=sweep, name="hot-memory-sweeper", daemon=True).start()
+
+    def search(self, query_vectors, k, where=None):
+        """
+        Returns one list of (id, text, metadata, distance) per query.
+        `where` supports simple {field: value} equality filters.
+        """
+        query_vectors = np.asarray(query_vectors, dtype=np.float32)
+        with self._lock:
+            if self._vectors is None:
+                return [[] for _ in query_vectors]
+            candidates = np.arange(len(self._ids))
+            if where:
+                candidates = np.array([n for n in candidates
+                                       if all(self._metadatas[n].get(f) == v for f, v in where.items())], dtype=np.int64)
+                if not len(candidates):
+                    return [[] for _ in query_vectors]
+
+            distances = 2.0 - 2.0 * (query_vectors @ self._vectors[candidates].T)
+            top = min(k, len(candidates))
+            results = []
+            for row in distances:
+                best = np.argpartition(row, top - 1)[:top]
+                best = best[np.argsort(row[best])]
+                results.append([
+                    (self._ids[candidates[i]], self._texts[candidates[i]], self._metadatas[candidates[i]], float(row[i]))
+                    for i in best
+                ])
+            return results
+
+    @staticmethod
+    def supports_filter(where) -> bool:
+        """Only flat equality filters are evaluated in the hot tier."""
+        return not where or all(not k.startswith("$") and not isinstance(v, dict) for k, v in where.items())
+
+    @staticmethod
+    def is_confident(hits, k) -> bool:
+        """True when the hot tier alone already has k close matches."""
+        return len(hits) >= k and hits[k - 1][3] <= HOT_CONFIDENT_DISTANCE
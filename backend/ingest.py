@@ -1,14 +1,20 @@
-import chromadb
 from dotenv import load_dotenv, find_dotenv
 import os
+import sys
 import uuid
 
-# --- THIS IS THE NEW IMPORT ---
-from langchain_huggingface import HuggingFaceEmbeddings
-# --- THIS IS THE NEW IMPORT ---
-
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_chroma import Chroma
+
+# --- Add root_dir to path (so 'backend' imports work when run as a script) ---
+backend_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(backend_dir)
+if root_dir not in sys.path:
+    sys.path.append(root_dir)
+# ---
+
+# --- Shared memory service (owns the embedding model and the Chroma store) ---
+from backend.memory_client import connect
+# ---
 
 
 # --- 1. Load API Key ---
@@ -20,26 +26,11 @@ if "GOOGLE_API_KEY" not in os.environ:
 # --- 2. Initialize ---
 print("Initializing...")
 
-# --- THIS IS THE NEW EMBEDDING MODEL (100% FREE AND LOCAL) ---
-print("Loading local embedding model (all-MiniLM-L6-v2)...")
-embedding_function = HuggingFaceEmbeddings(
-    model_name="all-MiniLM-L6-v2"
-)
-print("Embedding model loaded.")
-# --- END NEW EMBEDDING MODEL ---
-
-# Note: path is now ../ to save DB in the root LUMI folder
-client = chromadb.PersistentClient(path="../chroma_db") 
-
-collection = client.get_or_create_collection(
-    name="cognitive_companion_memory"
-)
-
-vector_store = Chroma(
-    client=client,
-    collection_name="cognitive_companion_memory",
-    embedding_function=embedding_function,
-)
+# --- UPDATED: Thin client -- no local model, no direct Chroma access ---
+print("Connecting to the memory service...")
+embedding_function, vector_store = connect()
+print("Memory service connected.")
+# ---
 
 text_splitter = RecursiveCharacterTextSplitter(
     chunk_size=1000, 
@@ -64,10 +55,10 @@ def add_note_to_memory(note_text, source="voice_journal"):
 if __name__ == "__main__":
     print("Running ingest script...")
     
-    collection_count = collection.count()
+    collection_count = vector_store.count()
     if collection_count > 0:
         print(f"Clearing {collection_count} old documents from memory...")
-        collection.delete(ids=collection.get()['ids']) 
+        vector_store.clear()
     
     add_note_to_memory(
         "Project Idea: 'Cognitive Companion'. A desktop AI that uses SST, TTS, LLMs, and RAG. It should also have an avatar and see the screen.",
@@ -0,0 +1,168 @@
+import os
+import time
+import json
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+
+# --- Memo Settings ---
+backend_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(backend_dir)
+LLM_MEMO_SIZE = int(os.environ.get("LUMI_LLM_MEMO_SIZE", "1024"))
+# Set LUMI_LLM_MEMO_DISK=1 to keep answers across restarts
+LLM_MEMO_DISK = os.environ.get("LUMI_LLM_MEMO_DISK", "0") == "1"
+LLM_MEMO_DB_PATH = os.environ.get("LUMI_LLM_MEMO_DB", os.path.join(root_dir, "lumi_llm_memo.db"))
+LLM_MEMO_TTL = float(os.environ.get("LUMI_LLM_MEMO_TTL_DAYS", "30")) * 86400
+# ---
+
+
+def _prompt_text(prompt) -> str:
+    """The exact text the model sees, for a str, PromptValue or message list."""
+    if isinstance(prompt, str):
+        return prompt
+    if hasattr(prompt, "to_messages"):
+        prompt = prompt.to_messages()
+    return json.dumps([(m.type, m.content) for m in prompt], ensure_ascii=False)
+
+
+class PromptMemo:
+    """
+    Exact memo for deterministic (temperature=0) LLM calls.
+
+    The key is a hash of the model name and the full prompt text, so two calls
+    only share an answer if Gemini would have seen byte-identical input. A RAG
+    prompt with different retrieved context is a different key automatically.
+
+    Identical calls that arrive while the first is still in flight wait on
+    its Future instead of sending their own request (single-flight).
+    """
+
+    def __init__(self, max_size=LLM_MEMO_SIZE, db_path=LLM_MEMO_DB_PATH if LLM_MEMO_DISK else None):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS llm_memo (key TEXT PRIMARY KEY, answer TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._db.execute("DELETE FROM llm_memo WHERE created_at < ?", (time.time() - LLM_MEMO_TTL,))
+            self._db.commit()
+            print(f"LLMMemo: Disk memo at {db_path}")
+
+    @staticmethod
+    def make_key(model_name, prompt) -> str:
+        return hashlib.sha256(f"{model_name}\x00{_prompt_text(prompt)}".encode("utf-8")).hexdigest()
+
+    def _get(self, key):
+        with self._lock:
+            answer = self._entries.get(key)
+            if answer is not None:
+                self._entries.move_to_end(key)
+                return answer
+        if self._db is not None:
+            with self._lock:
+                row = self._db.execute("SELECT answer FROM llm_memo WHERE key = ?", (key,)).fetchone()
+            if row:
+                self._put(key, row[0], persist=False)
+                return row[0]
+        return None
+
+    def _put(self, key, answer, persist=True):
+        with self._lock:
+            self._entries[key] = answer
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            if persist and self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO llm_memo (key, answer, created_at) VALUES (?, ?, ?)",
+                    (key, answer, time.time()),
+                )
+                self._db.commit()
+
+    def call(self, key, compute):
+        """Returns the memoized answer for key, computing it at most once at a time."""
+        answer = self._get(key)
+        if answer is not None:
+            with self._lock:
+                self.hits += 1
+            return answer
+
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not owner:
+            return future.result()
+
+        try:
+            answer = compute()
+            self._put(key, answer)
+            future.set_result(answer)
+            return answer
+        except Exception as e:
+            # Errors are shared with the waiters but never memoized
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "coalesced": self.coalesced,
+                    "entries": len(self._entries)}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM llm_memo")
+                self._db.commit()
+
+
+llm_memo = PromptMemo()
+
+
+def memoized(llm, memo=llm_memo):
+    """
+    Wraps a temperature-0 chat model so it can be used exactly like the model
+    (`prompt | memoized(llm) | StrOutputParser()` or `.invoke(text)`), but
+    identical prompts are answered from the memo.
+    """
+    if getattr(llm, "temperature", None) not in (0, 0.0):
+        raise ValueError("memoized() is only safe for temperature=0 models")
+    model_name = getattr(llm, "model", None) or getattr(llm, "model_name", type(llm).__name__)
+
+    def invoke(prompt):
+        key = memo.make_key(model_name, prompt)
+
+        def compute():
+            content = llm.invoke(prompt).content
+            if isinstance(content, list):
+                content = ' '.join(map(str, content))
+            return str(content)
+
+        return AIMessage(content=memo.call(key, compute))
+
+    return RunnableLambda(invoke, name=f"memoized_{model_name}")
@@ -0,0 +1,171 @@
+import os
+import sys
+import time
+import subprocess
+import threading
+
+import requests
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+# --- Client Settings ---
+MEMORY_SERVICE_URL = os.environ.get("LUMI_MEMORY_URL", f"http://127.0.0.1:{os.environ.get('LUMI_MEMORY_PORT', '5002')}")
+SERVICE_START_TIMEOUT = 120   # First start loads the embedding model
+REQUEST_TIMEOUT = 60
+# ---
+
+backend_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(backend_dir)
+
+_session = requests.Session()  # Keep-alive: no new TCP connection per call
+_start_lock = threading.Lock()
+
+
+def service_is_up() -> bool:
+    try:
+        return _session.get(f"{MEMORY_SERVICE_URL}/health", timeout=1).ok
+    except requests.RequestException:
+        return False
+
+
+def ensure_service_running():
+    """Starts backend/memory_service.py in the background if nobody has yet."""
+    if service_is_up():
+        return
+    with _start_lock:
+        if service_is_up():
+            return
+        print("MemoryClient: Memory service not running, starting it...")
+        subprocess.Popen(
+            [sys.executable, os.path.join(backend_dir, "memory_service.py")],
+            cwd=root_dir,
+            start_new_session=True,  # Outlives the tool that started it
+        )
+        deadline = time.time() + SERVICE_START_TIMEOUT
+        while time.time() < deadline:
+            if service_is_up():
+                print("MemoryClient: Memory service is up.")
+                return
+            time.sleep(0.25)
+        raise RuntimeError(f"Memory service did not start at {MEMORY_SERVICE_URL}")
+
+
+def _post(path, payload):
+    response = _session.post(f"{MEMORY_SERVICE_URL}{path}", json=payload, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    return response.json()
+
+
+def _post_long(path, payload):
+    """For bulk operations: no timeout, and errors come back as the service's message."""
+    response = _session.post(f"{MEMORY_SERVICE_URL}{path}", json=payload, timeout=None)
+    if response.status_code == 400:
+        raise ValueError(response.json().get("message"))
+    response.raise_for_status()
+    return response.json()
+
+
+def _get(path):
+    response = _session.get(f"{MEMORY_SERVICE_URL}{path}", timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    return response.json()
+
+
+class RemoteEmbeddings(Embeddings):
+    """
+    Embeddings computed by the memory service (no model in this process).
+    The first reply pins the model: vectors this process keeps (document
+    indexes, conversation recall) stay comparable even if the store is
+    migrated to a new embedding model meanwhile.
+    """
+
+    def __init__(self):
+        self.model = None
+
+    def _embed(self, payload):
+        reply = _post("/embed", dict(payload, model=self.model))
+        served = reply.get("embedding_model")
+        if self.model and served != self.model:
+            # Mixing models would silently make every similarity score meaningless
+            raise ValueError(f"The memory service embedded with {served}, but this process uses {self.model}.")
+        self.model = self.model or served
+        return reply["vectors"]
+
+    def embed_documents(self, texts):
+        if not texts:
+            return []
+        return self._embed({"texts": list(texts)})
+
+    def embed_query(self, text):
+        return self._embed({"texts": [text], "query": True})[0]
+
+
+class RemoteVectorStore(VectorStore):
+    """
+    The personal-memory collection, served by the memory service.
+    Works anywhere the old langchain_chroma.Chroma store was used
+    (add_texts, similarity_search, as_retriever).
+    """
+
+    def __init__(self):
+        self._embeddings = RemoteEmbeddings()
+
+    @property
+    def embeddings(self):
+        return self._embeddings
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        texts = list(texts)
+        return _post("/add", {"texts": texts, "metadatas": metadatas, "ids": ids})["ids"]
+
+    def similarity_search_with_score(self, query, k=4, filter=None, **kwargs):
+        return self.batch_similarity_search([query], k=k, filter=filter)[0]
+
+    def similarity_search(self, query, k=4, filter=None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, filter=filter)]
+
+    def batch_similarity_search(self, queries, k=4, filter=None):
+        """Several queries in one round trip. Returns [[(Document, distance), ...], ...]."""
+        results = _post("/query", {"queries": list(queries), "k": k, "where": filter})["results"]
+        return [
+            [(Document(page_content=hit["text"], metadata=hit["metadata"]), hit["distance"]) for hit in hits]
+            for hits in results
+        ]
+
+    def count(self) -> int:
+        return _get("/count")["count"]
+
+    def clear(self) -> int:
+        """Deletes every chunk in the collection."""
+        return _post("/clear", {})["deleted"]
+
+    def snapshot(self, incremental=False) -> dict:
+        """Exports ids, texts, metadata and vectors (see memory_snapshot.py)."""
+        return _post_long("/snapshot", {"incremental": incremental})
+
+    def restore(self, name, replace=True, force=False) -> dict:
+        """Loads a snapshot back without re-embedding anything."""
+        return _post_long("/restore", {"name": name, "replace": replace, "force": force})
+
+    def tune(self, k=4, target=0.95, apply=False) -> dict:
+        """Auto-tunes the collection's HNSW settings for a recall target (see ann_index.py)."""
+        return _post_long("/ann/tune", {"k": k, "target": target, "apply": apply})
+
+    def migration(self, action="status", **payload) -> dict:
+        """Embedding-model migration: status, start, cancel, rollback, finalize (see embedding_migration.py)."""
+        if action == "status":
+            return _get("/migration")
+        return _post_long(f"/migration/{action}", payload)
+
+    @classmethod
+    def from_texts(cls, texts, embedding=None, metadatas=None, **kwargs):
+        store = cls()
+        store.add_texts(texts, metadatas=metadatas)
+        return store
+
+
+def connect():
+    """Returns (embedding_function, vector_store), starting the service if needed."""
+    ensure_service_running()
+    return RemoteEmbeddings(), RemoteVectorStore()
@@ -0,0 +1,493 @@
+import os
+import sys
+import time
+import uuid
+import threading
+
+# --- Add root_dir to path (so 'backend' imports work when run as a script) ---
+backend_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(backend_dir)
+if root_dir not in sys.path:
+    sys.path.append(root_dir)
+# ---
+
+from dotenv import load_dotenv, find_dotenv
+load_dotenv(find_dotenv())
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+import chromadb
+from flask import Flask, jsonify, request
+
+from backend.embeddings import get_embedding_function, LumiEmbeddings, EMBED_MODEL_NAME
+from backend.answer_cache import bump_memory_version
+from backend.hot_memory import HotMemory, merge_hits
+from backend import memory_snapshot, ann_index
+from backend.embedding_migration import (ForegroundMonitor, Migration, Mirror, collection_name_for,
+                                         read_pointer, write_pointer, LEGACY_COLLECTION,
+                                         LEGACY_EMBED_MODEL, MIGRATION_THREADS)
+
+# --- Service Settings ---
+# Absolute path: the store is the same no matter which directory a tool starts in
+CHROMA_PATH = os.environ.get("LUMI_CHROMA_PATH", os.path.join(root_dir, "chroma_db"))
+MEMORY_SERVICE_HOST = "127.0.0.1"
+MEMORY_SERVICE_PORT = int(os.environ.get("LUMI_MEMORY_PORT", "5002"))
+# ---
+
+# The memory service is the ONLY process that loads the embedding model and
+# opens the Chroma store. server.py, ingest.py, query.py and voice_companion.py
+# talk to it through backend/memory_client.py, so the model is loaded once
+# however many tools are running, and all writes to the SQLite-backed store
+# go through one process, one at a time.
+#
+# Run it with:  python backend/memory_service.py
+# (memory_client starts it automatically if it isn't running.)
+
+app = Flask(__name__)
+
+print("MemoryService: Loading embedding model and vector store...")
+client = chromadb.PersistentClient(path=CHROMA_PATH)
+
+# --- NEW: Versioned collections ---
+# Each collection is tied to the embedding model that filled it, and the
+# pointer file (see embedding_migration.py) says which one is live. The store
+# keeps using ITS model even if LUMI_EMBED_MODEL changes; switching models
+# is a background migration, not a wipe and re-ingest.
+pointer = read_pointer(CHROMA_PATH)
+if pointer is None:
+    # First start with versioned collections: an existing store was built with the original model
+    legacy_count = ann_index.open_collection(client, LEGACY_COLLECTION).count()
+    model = LEGACY_EMBED_MODEL if legacy_count else EMBED_MODEL_NAME
+    pointer = {"collection": collection_name_for(model), "embedding_model": model,
+               "switched_at": None, "previous": None}
+    write_pointer(CHROMA_PATH, pointer)
+
+# Request handlers read both at once, so a switch-over never pairs one model with the other's vectors
+_store = (ann_index.open_collection(client, pointer["collection"]),
+          get_embedding_function(pointer["embedding_model"]))
+collection, embedding_function = _store
+print(f"MemoryService: Ready ({collection.count()} chunks in {pointer['collection']}, "
+      f"embedded with {pointer['embedding_model']}).")
+if pointer["embedding_model"] != EMBED_MODEL_NAME:
+    print(f"MemoryService: LUMI_EMBED_MODEL is {EMBED_MODEL_NAME}. To move the store to it, run "
+          f"'python backend/embedding_migration.py start' (queries keep working meanwhile).")
+
+foreground = ForegroundMonitor()   # What the migration job throttles against
+migration = None                   # The running (or last) Migration
+rollback_mirror = None             # After a switch: keeps the previous collection current until finalize
+# ---
+
+# --- NEW: Hot tier ---
+# Recent notes are also kept in an in-process NumPy matrix (exact search,
+# no HNSW walk, no SQLite). /query searches it first and only falls through
+# to the Chroma collection (the cold tier) when the hot tier can't answer
+# with k close matches on its own.
+hot_memory = HotMemory()
+
+
+def warm_hot_memory():
+    """Loads notes newer than the hot window from the cold tier."""
+    collection, _ = _store
+    cutoff = time.time() - hot_memory.max_age
+    recent = collection.get(
+        where={"added_at": {"$gte": cutoff}},
+        include=["documents", "metadatas", "embeddings"],
+    )
+    if len(recent["ids"]):
+        hot_memory.add(recent["ids"], recent["documents"], recent["metadatas"], recent["embeddings"])
+    print(f"MemoryService: Hot tier warmed with {len(hot_memory)} recent notes.")
+
+
+warm_hot_memory()
+hot_memory.start_sweeper()
+# ---
+
+# Chroma's SQLite store gets exactly one writer at a time
+_write_lock = threading.Lock()
+
+if pointer.get("previous"):
+    # A switch-over that hasn't been finalized: keep the old collection current so rollback stays lossless
+    rollback_mirror = Mirror(ann_index.open_collection(client, pointer["previous"]["collection"]),
+                             get_embedding_function(pointer["previous"]["embedding_model"]), _write_lock)
+
+
+@app.route('/health', methods=['GET'])
+def handle_health():
+    collection, _ = _store
+    return jsonify({"status": "ok", "count": collection.count(), "pid": os.getpid(),
+                    "embedding_model": pointer["embedding_model"]})
+
+
+@app.route('/embed', methods=['POST'])
+def handle_embed():
+    """Embeds a batch of texts (used for document indexes and conversation recall)."""
+    data = request.get_json()
+    texts = data.get("texts", [])
+    _, embedding_function = _store
+    # A client pinned to an older model (its in-memory vectors use it) keeps getting that model,
+    # even after a finalize or a restart (it's loaded again on first use)
+    model = data.get("model")
+    if model and model != embedding_function.model_name:
+        try:
+            embedding_function = get_embedding_function(model)
+        except Exception as e:
+            print(f"MemoryService: Could not load embedding model {model}: {e}")
+            return jsonify({"status": "error", "message": f"Could not load embedding model {model}: {e}"}), 400
+    request_started = foreground.started()
+    try:
+        if data.get("query"):
+            # Single queries go through the model's dynamic batcher
+            vectors = [embedding_function.embed_query(t) for t in texts]
+        else:
+            vectors = embedding_function.embed_documents(texts)
+    finally:
+        foreground.finished(request_started)
+    return jsonify({"vectors": vectors, "embedding_model": embedding_function.model_name})
+
+
+@app.route('/add', methods=['POST'])
+def handle_add():
+    data = request.get_json()
+    texts = data.get("texts", [])
+    if not texts:
+        return jsonify({"ids": []})
+
+    # Every note is stamped so the hot tier knows when to age it out
+    now = time.time()
+    metadatas = [dict(meta or {}, added_at=(meta or {}).get("added_at", now))
+                 for meta in (data.get("metadatas") or [{} for _ in texts])]
+    ids = data.get("ids") or [str(uuid.uuid4()) for _ in texts]
+
+    # Embed outside the lock; only the actual write is serialized
+    collection, embedding_function = _store
+    vectors = embedding_function.embed_documents(texts)
+    with _write_lock:
+        if _store[0] is not collection:
+            # Switched over while embedding: re-embed for the new collection
+            collection, embedding_function = _store
+            vectors = embedding_function.embed_documents(texts)
+        collection.upsert(ids=ids, documents=texts, metadatas=metadatas, embeddings=vectors)
+        # Same lock as /clear: a clear can't land between the two writes and leave a note in the hot tier only
+        hot_memory.add(ids, texts, metadatas, vectors)
+        # Decided from what _switch_over set under this lock, not from migration.state (it lags behind)
+        if rollback_mirror:
+            mirror = rollback_mirror
+        elif migration and migration.state in ("copying", "switching") and migration.target is not collection:
+            mirror = migration.mirror
+        else:
+            mirror = None
+    if mirror:
+        mirror.submit(ids, texts, metadatas)
+    bump_memory_version()
+    return jsonify({"ids": ids})
+
+
+@app.route('/query', methods=['POST'])
+def handle_query():
+    """Batched read: several queries are embedded and searched in one call."""
+    data = request.get_json()
+    queries = data.get("queries", [])
+    k = int(data.get("k", 4))
+    if not queries:
+        return jsonify({"results": []})
+
+    request_started = foreground.started()
+    try:
+        return _query(queries, k, data.get("where") or None)
+    finally:
+        foreground.finished(request_started)
+
+
+def _query(queries, k, where):
+    collection, embedding_function = _store
+    if len(queries) == 1:
+        vectors = [embedding_function.embed_query(queries[0])]
+    else:
+        vectors = embedding_function.embed_documents(queries)
+
+    # 1. Hot tier first: exact search over recent notes
+    started = time.perf_counter()
+    use_hot = HotMemory.supports_filter(where)
+    hot_hits = hot_memory.search(vectors, k, where) if use_hot else [[] for _ in queries]
+    hot_ms = (time.perf_counter() - started) * 1000
+
+    # 2. Cold tier only for the queries the hot tier couldn't answer
+    cold_rows = [i for i, hits in enumerate(hot_hits) if not HotMemory.is_confident(hits, k)]
+    cold_hits = {}
+    if cold_rows:
+        found = collection.query(
+            query_embeddings=[vectors[i] for i in cold_rows],
+            n_results=k,
+            where=where,
+            include=["documents", "metadatas", "distances"],
+        )
+        for row, ids, docs, metas, dists in zip(cold_rows, found["ids"], found["documents"],
+                                                found["metadatas"], found["distances"]):
+            cold_hits[row] = list(zip(ids, docs, [meta or {} for meta in metas], dists))
+
+    # 3. Merge by score (both tiers report squared L2 distance)
+    results = []
+    for i, hits in enumerate(hot_hits):
+        merged = merge_hits(hits, cold_hits.get(i, []), k=k)
+        results.append([
+            {"text": text, "metadata": meta, "distance": dist}
+            for _, text, meta, dist in merged
+        ])
+    print(f"MemoryService: {len(queries)} queries, hot tier {hot_ms:.2f}ms, "
+          f"{len(queries) - len(cold_rows)} answered without the cold tier.")
+    return jsonify({"results": results})
+
+
+@app.route('/count', methods=['GET'])
+def handle_count():
+    collection, _ = _store
+    return jsonify({"count": collection.count()})
+
+
+@app.route('/clear', methods=['POST'])
+def handle_clear():
+    """Deletes every chunk (used by ingest.py before re-ingesting)."""
+    _cancel_migration()  # Its copy would be stale
+    with _write_lock:
+        if migration and migration.state == "switching":
+            return jsonify({"status": "error", "message": "The store is switching embedding models. Try again."}), 409
+        collection, _ = _store  # Read under the lock: a switch-over may have just finished
+        ids = collection.get(include=[])["ids"]
+        if ids:
+            collection.delete(ids=ids)
+        if rollback_mirror:  # A rollback must not bring the notes back
+            old_ids = rollback_mirror.collection.get(include=[])["ids"]
+            if old_ids:
+                rollback_mirror.collection.delete(ids=old_ids)
+        hot_memory.clear()
+    bump_memory_version()
+    return jsonify({"deleted": len(ids)})
+
+
+@app.route('/snapshot', methods=['POST'])
+def handle_snapshot():
+    """Exports the store (or what changed since the last snapshot) with its vectors."""
+    data = request.get_json(silent=True) or {}
+    collection, _ = _store
+    with _write_lock:  # A consistent view: no writes while exporting
+        try:
+            manifest = memory_snapshot.export_snapshot(collection, pointer["embedding_model"],
+                                                       incremental=bool(data.get("incremental")))
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+    return jsonify({"status": "ok", "snapshot": manifest})
+
+
+@app.route('/restore', methods=['POST'])
+def handle_restore():
+    """Bulk-loads a snapshot's vectors back into the store (no re-embedding)."""
+    data = request.get_json(silent=True) or {}
+    if pointer.get("previous"):
+        return jsonify({"status": "error", "message": "Finalize or roll back the embedding migration first."}), 409
+    started = time.time()
+    _cancel_migration()  # Its copy would be stale
+    with _write_lock:
+        if (migration and migration.state == "switching") or pointer.get("previous"):
+            return jsonify({"status": "error", "message": "Finalize or roll back the embedding migration first."}), 409
+        collection, _ = _store  # Read under the lock: a switch-over may have just finished
+        try:
+            written = memory_snapshot.restore_snapshot(collection, data["name"], pointer["embedding_model"],
+                                                       replace=data.get("replace", True),
+                                                       force=bool(data.get("force")))
+        except (KeyError, FileNotFoundError, ValueError) as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        hot_memory.clear()
+        warm_hot_memory()
+    bump_memory_version()
+    return jsonify({"status": "ok", "restored": written, "count": collection.count(),
+                    "seconds": round(time.time() - started, 2)})
+
+
+
+# --- NEW: Embedding-model migration ---
+
+def _cancel_migration():
+    """Stops a running migration and drops its half-filled collection."""
+    global migration
+    if migration and migration.state == "copying":
+        migration.cancel()
+        if migration.state != "cancelled":
+            # It got past its last cancel check and switched over: the target is live now
+            return
+        client.delete_collection(name=migration.target.name)
+        print(f"MemoryService: Migration to {migration.model_name} cancelled.")
+
+
+def _switch_over(job):
+    """Called by the migration job when the copy is done: makes the new collection live in one step."""
+    global _store, collection, embedding_function, pointer, rollback_mirror
+    # Outside the lock: the live model gets the full thread count (the job's copy is throttled to
+    # LUMI_MIGRATION_THREADS), and the mirror's queued writes need the lock to land
+    new_embedder = get_embedding_function(job.model_name)
+    job.mirror.drain()
+
+    with _write_lock:
+        missed = job.reconcile()
+        old_collection, old_embedder = _store
+        previous = {"collection": pointer["collection"], "embedding_model": pointer["embedding_model"]}
+        new_pointer = {"collection": job.target.name, "embedding_model": job.model_name,
+                       "switched_at": time.time(), "previous": previous}
+        write_pointer(CHROMA_PATH, new_pointer)
+        pointer = new_pointer
+        _store = (job.target, new_embedder)
+        collection, embedding_function = _store
+        rollback_mirror = Mirror(old_collection, old_embedder, _write_lock)
+        hot_memory.clear()  # Hot vectors came from the old model
+        warm_hot_memory()
+    job.mirror.stop()
+    bump_memory_version()
+    print(f"MemoryService: Switched to {job.model_name} ({collection.count()} chunks, "
+          f"{missed} caught up at switch-over).")
+
+
+@app.route('/migration', methods=['GET'])
+def handle_migration_status():
+    return jsonify({
+        "embedding_model": pointer["embedding_model"],
+        "collection": pointer["collection"],
+        "configured_model": EMBED_MODEL_NAME,
+        "previous": pointer.get("previous"),
+        "migration": migration.status() if migration else None,
+    })
+
+
+@app.route('/migration/start', methods=['POST'])
+def handle_migration_start():
+    """Starts re-embedding the store with a new model in the background (queries keep using the old one)."""
+    global migration
+    data = request.get_json(silent=True) or {}
+    model = data.get("model") or EMBED_MODEL_NAME
+    if migration and migration.state in ("copying", "switching"):
+        return jsonify({"status": "error", "message": f"Already migrating to {migration.model_name}."}), 409
+    if pointer.get("previous"):
+        return jsonify({"status": "error", "message": "Finalize or roll back the last migration first."}), 409
+    if model == pointer["embedding_model"]:
+        return jsonify({"status": "error", "message": f"The store already uses {model}."}), 400
+
+    target_name = collection_name_for(model)
+    try:
+        client.delete_collection(name=target_name)  # Leftovers from a cancelled or rolled-back run
+    except Exception:
+        pass
+    # The job's own copy of the model, limited to LUMI_MIGRATION_THREADS so queries keep their cores
+    # (ONNX only: on PyTorch the limit would apply to the live model too, so the pause loop does the throttling)
+    embedder = LumiEmbeddings(model_name=model, threads=MIGRATION_THREADS, background=True)
+    source, _ = _store
+    # The new collection inherits the live one's (tuned) HNSW settings
+    target = ann_index.open_collection(client, target_name, ann_index.stored_settings(source))
+    migration = Migration(source, target, embedder, model, foreground, _write_lock,
+                          on_complete=_switch_over).start()
+    print(f"MemoryService: Migrating {migration.total} chunks to {model} in the background.")
+    return jsonify({"status": "ok", "migration": migration.status()})
+
+
+@app.route('/migration/rebuild', methods=['POST'])
+def handle_migration_rebuild():
+    """
+    Rebuilds the live collection with the HNSW settings stored on it (see ann_index.py):
+    same model, vectors copied rather than re-embedded, same switch-over and rollback.
+    """
+    global migration
+    if migration and migration.state in ("copying", "switching"):
+        return jsonify({"status": "error", "message": f"Already migrating to {migration.model_name}."}), 409
+    if pointer.get("previous"):
+        return jsonify({"status": "error", "message": "Finalize or roll back the last migration first."}), 409
+
+    source, embedder = _store
+    settings = ann_index.stored_settings(source)
+    if ann_index.current_hnsw(source) == settings:
+        return jsonify({"status": "error", "message": f"The collection is already built with {settings}."}), 400
+    target_name = f"{collection_name_for(pointer['embedding_model'])}__m{settings['max_neighbors']}" \
+                  f"-ef{settings['ef_construction']}-{int(time.time())}"
+    target = ann_index.open_collection(client, target_name, settings)
+    target.modify(metadata=dict(source.metadata or {}))  # Carries the tuning report over
+    migration = Migration(source, target, embedder, pointer["embedding_model"], foreground, _write_lock,
+                          on_complete=_switch_over, copy_vectors=True).start()
+    print(f"MemoryService: Rebuilding {migration.total} chunks with HNSW {settings} in the background.")
+    return jsonify({"status": "ok", "migration": migration.status()})
+
+
+@app.route('/migration/cancel', methods=['POST'])
+def handle_migration_cancel():
+    if not migration or migration.state != "copying":
+        return jsonify({"status": "error", "message": "No migration is running."}), 400
+    _cancel_migration()
+    return jsonify({"status": "ok", "migration": migration.status()})
+
+
+@app.route('/migration/rollback', methods=['POST'])
+def handle_migration_rollback():
+    """Makes the previous collection live again (it was kept current since the switch)."""
+    global _store, collection, embedding_function, pointer, rollback_mirror
+    if not pointer.get("previous") or not rollback_mirror:
+        return jsonify({"status": "error", "message": "Nothing to roll back to."}), 400
+    mirror = rollback_mirror
+    mirror.drain()
+    with _write_lock:
+        rolled_back = pointer["embedding_model"]
+        new_pointer = {"collection": pointer["previous"]["collection"],
+                       "embedding_model": pointer["previous"]["embedding_model"],
+                       "switched_at": time.time(), "previous": None}
+        write_pointer(CHROMA_PATH, new_pointer)
+        pointer = new_pointer
+        _store = (mirror.collection, mirror.embedder)
+        collection, embedding_function = _store
+        rollback_mirror = None
+        hot_memory.clear()
+        warm_hot_memory()
+    mirror.stop()
+    bump_memory_version()
+    print(f"MemoryService: Rolled back from {rolled_back} to {pointer['embedding_model']}.")
+    return jsonify({"status": "ok", "embedding_model": pointer["embedding_model"]})
+
+
+@app.route('/migration/finalize', methods=['POST'])
+def handle_migration_finalize():
+    """Drops the previous collection: the migration can no longer be rolled back."""
+    global pointer, rollback_mirror
+    if not pointer.get("previous"):
+        return jsonify({"status": "error", "message": "No finished migration to finalize."}), 400
+    if rollback_mirror:
+        rollback_mirror.drain()
+        rollback_mirror.stop()
+    with _write_lock:
+        dropped = pointer["previous"]["collection"]
+        rollback_mirror = None
+        pointer = dict(pointer, previous=None)
+        write_pointer(CHROMA_PATH, pointer)
+        client.delete_collection(name=dropped)
+    print(f"MemoryService: Finalized migration, dropped {dropped}.")
+    return jsonify({"status": "ok", "dropped": dropped})
+# ---
+
+
+# --- NEW: ANN tuning ---
+
+@app.route('/ann/tune', methods=['POST'])
+def handle_ann_tune():
+    """
+    Measures recall@k against exact search (and latency) for a grid of HNSW
+    settings on this collection's vectors; apply=True stores the cheapest
+    setting meeting the target with the collection (ef_search takes effect now,
+    M / ef_construction with /migration/rebuild).
+    """
+    data = request.get_json(silent=True) or {}
+    collection, _ = _store
+    try:
+        report = ann_index.tune_collection(collection, k=int(data.get("k", ann_index.TUNE_K)),
+                                           target=float(data.get("target", ann_index.TARGET_RECALL)),
+                                           apply=bool(data.get("apply")))
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    print(f"MemoryService: ANN tuning picked {report['chosen']} (recall@{report['k']} {report['recall']}).")
+    return jsonify(dict(report, status="ok"))
+# ---
+
+
+if __name__ == "__main__":
+    print(f"MemoryService: Listening on http://{MEMORY_SERVICE_HOST}:{MEMORY_SERVICE_PORT}")
+    app.run(host=MEMORY_SERVICE_HOST, port=MEMORY_SERVICE_PORT, debug=False, threaded=True)
@@ -0,0 +1,202 @@
+import os
+import sys
+import json
+import time
+
+import numpy as np
+
+# --- Add root_dir to path (so 'backend' imports work when run as a script) ---
+backend_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(backend_dir)
+if root_dir not in sys.path:
+    sys.path.append(root_dir)
+# ---
+
+# --- Snapshot Settings ---
+SNAPSHOT_DIR = os.environ.get("LUMI_SNAPSHOT_DIR", os.path.join(root_dir, "memory_snapshots"))
+EXPORT_PAGE_SIZE = 10000    # Rows read from Chroma per page
+RESTORE_BATCH_SIZE = 5000   # Rows written to Chroma per upsert
+# ---
+
+# A snapshot is a directory with two files:
+#   manifest.json  -- count, dimension, embedding model, created_at, and for
+#                     incremental snapshots the snapshot they build on ('base')
+#   data.npz       -- columns: vectors (float32, n x dim), added_at (float64),
+#                     and ids / texts / metadata (JSON) each stored as one
+#                     UTF-8 blob plus an int64 offsets array
+# Restoring loads the vectors straight back into Chroma: nothing is re-embedded.
+#
+# Incremental snapshots hold the rows added or updated (by 'added_at') since
+# their base was taken. Deletions aren't tracked, so restoring a chain
+# restores the base and then upserts each increment on top.
+
+
+def _pack_strings(strings):
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def _unpack_strings(blob, offsets):
+    raw = blob.tobytes()
+    return [raw[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+
+
+def list_snapshots(directory=SNAPSHOT_DIR):
+    """Manifests of every snapshot, oldest first."""
+    manifests = []
+    if not os.path.isdir(directory):
+        return manifests
+    for name in os.listdir(directory):
+        manifest_path = os.path.join(directory, name, "manifest.json")
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                manifests.append(json.load(f))
+    return sorted(manifests, key=lambda m: m["created_at"])
+
+
+def export_snapshot(collection, model_name, incremental=False, directory=SNAPSHOT_DIR):
+    """Writes the collection (or what changed since the last snapshot) to a new snapshot."""
+    base = None
+    where = None
+    if incremental:
+        previous = list_snapshots(directory)
+        if not previous:
+            raise ValueError("No earlier snapshot to build an incremental snapshot on.")
+        base = previous[-1]
+        where = {"added_at": {"$gt": base["created_at"]}}
+
+    created_at = time.time()
+    ids, texts, metadatas, vectors = [], [], [], []
+    offset = 0
+    while True:
+        page = collection.get(where=where, limit=EXPORT_PAGE_SIZE, offset=offset,
+                              include=["documents", "metadatas", "embeddings"])
+        if not len(page["ids"]):
+            break
+        ids.extend(page["ids"])
+        texts.extend(page["documents"])
+        metadatas.extend(meta or {} for meta in page["metadatas"])
+        vectors.append(np.asarray(page["embeddings"], dtype=np.float32))
+        offset += len(page["ids"])
+
+    dim = vectors[0].shape[1] if vectors else 0
+    matrix = np.vstack(vectors) if vectors else np.zeros((0, dim), dtype=np.float32)
+
+    name = time.strftime("%Y%m%d-%H%M%S", time.localtime(created_at)) + ("-incr" if incremental else "-full")
+    path = os.path.join(directory, name)
+    if os.path.exists(path):  # Two snapshots in the same second
+        name = f"{name}-{int(created_at * 1000) % 1000:03d}"
+        path = os.path.join(directory, name)
+    os.makedirs(path, exist_ok=True)
+
+    id_blob, id_offsets = _pack_strings(ids)
+    text_blob, text_offsets = _pack_strings(texts)
+    meta_blob, meta_offsets = _pack_strings([json.dumps(m, ensure_ascii=False) for m in metadatas])
+    np.savez(
+        os.path.join(path, "data.npz"),
+        vectors=matrix,
+        added_at=np.array([m.get("added_at", 0.0) for m in metadatas], dtype=np.float64),
+        id_blob=id_blob, id_offsets=id_offsets,
+        text_blob=text_blob, text_offsets=text_offsets,
+        meta_blob=meta_blob, meta_offsets=meta_offsets,
+    )
+    manifest = {
+        "name": name,
+        "created_at": created_at,
+        "count": len(ids),
+        "dim": int(dim),
+        "embedding_model": model_name,
+        "incremental": incremental,
+        "base": base["name"] if base else None,
+    }
+    with open(os.path.join(path, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Snapshot: Wrote {len(ids)} chunks to {path}")
+    return manifest
+
+
+def load_snapshot(name, directory=SNAPSHOT_DIR):
+    """(manifest, ids, texts, metadatas, vectors) for one snapshot."""
+    path = os.path.join(directory, name)
+    with open(os.path.join(path, "manifest.json")) as f:
+        manifest = json.load(f)
+    with np.load(os.path.join(path, "data.npz")) as data:
+        ids = _unpack_strings(data["id_blob"], data["id_offsets"])
+        texts = _unpack_strings(data["text_blob"], data["text_offsets"])
+        metadatas = [json.loads(m) for m in _unpack_strings(data["meta_blob"], data["meta_offsets"])]
+        vectors = data["vectors"]
+    return manifest, ids, texts, metadatas, vectors
+
+
+def snapshot_chain(name, directory=SNAPSHOT_DIR):
+    """The manifests to restore, full snapshot first, then each increment."""
+    chain = []
+    while name:
+        with open(os.path.join(directory, name, "manifest.json")) as f:
+            manifest = json.load(f)
+        chain.append(manifest)
+        name = manifest.get("base")
+    return list(reversed(chain))
+
+
+def restore_snapshot(collection, name, model_name, replace=True, directory=SNAPSHOT_DIR, force=False):
+    """
+    Bulk-loads a snapshot (and the snapshots it builds on) into the collection.
+    replace=True empties the collection first; replace=False merges (upsert).
+    Returns the number of rows written.
+    """
+    chain = snapshot_chain(name, directory)
+    # Load and check every snapshot BEFORE touching the store: a bad increment must not leave it empty
+    loaded = []
+    dims = set()
+    for manifest in chain:
+        if manifest["embedding_model"] != model_name and not force:
+            raise ValueError(f"Snapshot {manifest['name']} was embedded with {manifest['embedding_model']}, "
+                             f"but the store uses {model_name}. Re-embed instead, or pass force.")
+        _, ids, texts, metadatas, vectors = load_snapshot(manifest["name"], directory)
+        counts = {len(ids), len(texts), len(metadatas), len(vectors)}
+        if counts != {manifest["count"]}:
+            raise ValueError(f"Snapshot {manifest['name']} is damaged: the manifest lists {manifest['count']} chunks, "
+                             f"the data has {sorted(counts)}.")
+        if len(ids):
+            if vectors.ndim != 2 or vectors.shape[1] != manifest["dim"]:
+                raise ValueError(f"Snapshot {manifest['name']} is damaged: vectors are {vectors.shape}, "
+                                 f"the manifest says {manifest['dim']} dimensions.")
+            dims.add(manifest["dim"])
+        loaded.append((manifest["name"], ids, texts, metadatas, vectors))
+    if len(dims) > 1:
+        raise ValueError(f"Snapshots in the chain for {name} have different dimensions: {sorted(dims)}.")
+
+    if replace:
+        existing = collection.get(include=[])["ids"]
+        for start in range(0, len(existing), RESTORE_BATCH_SIZE):
+            collection.delete(ids=existing[start:start + RESTORE_BATCH_SIZE])
+
+    written = 0
+    for snapshot_name, ids, texts, metadatas, vectors in loaded:
+        for start in range(0, len(ids), RESTORE_BATCH_SIZE):
+            end = start + RESTORE_BATCH_SIZE
+            collection.upsert(ids=ids[start:end], documents=texts[start:end],
+                              metadatas=metadatas[start:end], embeddings=vectors[start:end])
+        written += len(ids)
+        print(f"Snapshot: Restored {len(ids)} chunks from {snapshot_name}")
+    return written
+
+# --- Command line (talks to the memory service, which owns the store) ---
+if __name__ == "__main__":
+    from backend.memory_client import connect
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "list"
+    _, vector_store = connect()
+    if command == "snapshot":
+        # python backend/memory_snapshot.py snapshot [--incremental]
+        print(vector_store.snapshot(incremental="--incremental" in sys.argv))
+    elif command == "restore":
+        # python backend/memory_snapshot.py restore <name> [--merge] [--force]
+        print(vector_store.restore(sys.argv[2], replace="--merge" not in sys.argv, force="--force" in sys.argv))
+    else:
+        for manifest in list_snapshots():
+            kind = f"incremental on {manifest['base']}" if manifest["incremental"] else "full"
+            print(f"{manifest['name']}: {manifest['count']} chunks, {manifest['embedding_model']} ({kind})")
@@ -1,9 +1,13 @@
 import os
 from langchain_core.prompts import PromptTemplate
-from langchain_core.runnables import RunnablePassthrough
+from langchain_core.runnables import RunnablePassthrough, RunnableLambda
 from langchain_core.output_parsers import StrOutputParser
 from langchain_google_genai import ChatGoogleGenerativeAI
 from .database import vector_store, text_splitter
+from .context_packer import make_context_packer
+from .answer_cache import AnswerCache, bump_memory_version
+from .llm_memo import memoized
+from .resilience import guarded, StageUnavailable
 
 # Get API key
 GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY")
@@ -12,7 +16,7 @@ GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY")
 retriever = vector_store.as_retriever(search_kwargs={"k": 2})
 
 # --- FIX: Added 'google_api_key=GOOGLE_API_KEY' back in ---
-rag_llm = ChatGoogleGenerativeAI(model="gemini-flash-latest", temperature=0, google_api_key=GOOGLE_API_KEY)
+rag_llm = memoized(guarded(ChatGoogleGenerativeAI(model="gemini-flash-latest", temperature=0, google_api_key=GOOGLE_API_KEY), "rag"))
 
 rag_prompt_template = """
 You are a helpful assistant. Answer the user's question based *only* on the
@@ -22,8 +26,11 @@ Question: {question}
 Answer:
 """
 rag_prompt = PromptTemplate.from_template(rag_prompt_template)
+# --- NEW: Merge overlapping chunks / drop duplicates / trim to budget before prompting ---
+pack_memory_context = RunnableLambda(make_context_packer(label="Memory RAG"))
+
 rag_chain = (
-    {"context": retriever, "question": RunnablePassthrough()}
+    {"context": retriever | pack_memory_context, "question": RunnablePassthrough()}
     | rag_prompt
     | rag_llm
     | StrOutputParser()
@@ -31,10 +38,31 @@ rag_chain = (
 
 # --- Define the tool functions ---
 
-def ask_personal_memory(user_input: str) -> str:
+# --- NEW: Answers are cached until the memory store changes ---
+personal_answer_cache = AnswerCache()
+
+def ask_personal_memory(user_input: str, namespace: str = "default") -> str:
     """Answers questions based *only* on the user's saved memory."""
+    answer, cache_key = personal_answer_cache.lookup(user_input, namespace)
+    if answer is not None:
+        print("Tool: Personal Memory (cache hit)")
+        return answer
+
     print("Tool: Calling Personal Memory (RAG)")
-    return rag_chain.invoke(user_input)
+    try:
+        answer = rag_chain.invoke(user_input)
+    except StageUnavailable as e:
+        print(f"Tool: RAG LLM unavailable ({e}), answering from retrieval only")
+        return retrieval_only_answer(user_input)
+    personal_answer_cache.store(cache_key, answer)
+    return answer
+
+def retrieval_only_answer(user_input: str) -> str:
+    """Outage fallback: read back the closest saved note instead of a generated answer."""
+    docs = retriever.invoke(user_input)
+    if not docs:
+        return "I can't reach my language model right now, and I couldn't find anything about that in your notes."
+    return f"I can't reach my language model right now, but here's the closest note I found: {docs[0].page_content}"
 
 def add_to_memory(user_input: str) -> str:
     """Adds a new note to the user's memory."""
@@ -44,4 +72,18 @@ def add_to_memory(user_input: str) -> str:
         texts=chunks,
         metadatas=[{"source": "voice_journal"} for _ in chunks]
     )
+    bump_memory_version()  # Invalidates cached personal-memory answers
     return "Got it. I've saved that to my memory."
+
+def add_notes_to_memory(notes: list) -> int:
+    """Saves many notes in ONE embed + upsert pass (used by /batch). Returns the chunk count."""
+    chunks = [chunk for note in notes for chunk in text_splitter.split_text(note)]
+    if not chunks:
+        return 0
+    print(f"Tool: Adding {len(notes)} notes ({len(chunks)} chunks) to memory in one pass")
+    vector_store.add_texts(
+        texts=chunks,
+        metadatas=[{"source": "voice_journal"} for _ in chunks]
+    )
+    bump_memory_version()
+    return len(chunks)
@@ -0,0 +1,139 @@
+import os
+import re
+import json
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from langchain_core.prompts import PromptTemplate
+from langchain_core.output_parsers import StrOutputParser
+from langchain_google_genai import ChatGoogleGenerativeAI
+from backend.resilience import guarded
+
+# Get API key
+GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY")
+
+INTENTS = ("CONVERSATION", "VISION", "INGEST", "PERSONAL_QUERY", "GENERAL_KNOWLEDGE", "SYSTEM_COMMAND")
+MAX_STEPS = 6
+MAX_PARALLEL_STEPS = 4
+
+# --- Compound detection (cheap, local) ---
+# Split on commas, semicolons and joining words; only treat the input as
+# compound if at least two of the parts look like real clauses: 2+ words,
+# opening with a verb or question word. So "what's the difference between
+# cats and dogs", "explain supply and demand" and "hi Lumi, how are you"
+# all stay a single request.
+_CLAUSE_SPLIT = re.compile(r"\s*(?:,|;|\band then\b|\bthen\b|\band also\b|\balso\b|\band\b)\s*", re.IGNORECASE)
+_CLAUSE_START = re.compile(
+    r"^(?:please\s+)?(?:open|launch|start|play|pause|set|remind|remember|note|save|add|tell|show|list|"
+    r"cancel|stop|snooze|look|read|summarize|explain|search|find|check|go|visit|take|turn|send|write|give|"
+    r"what|what's|whats|who|when|where|why|how|which|is|are|can|could|do|does|did|i|i'm|my)\b",
+    re.IGNORECASE
+)
+
+
+def looks_compound(user_input: str) -> bool:
+    clauses = [c for c in _CLAUSE_SPLIT.split(user_input) if len(c.split()) >= 2 and _CLAUSE_START.match(c)]
+    return len(clauses) >= 2
+
+
+# --- Planner chain ---
+planner_llm = guarded(ChatGoogleGenerativeAI(model="gemini-flash-latest", temperature=0, google_api_key=GOOGLE_API_KEY), "planner")
+
+planner_prompt_template = """
+Split the user's request into the separate tasks it contains, in order.
+Each task gets one of these intents:
+
+- 'CONVERSATION': greetings and small talk.
+- 'VISION': looking at or analyzing the screen.
+- 'INGEST': a new fact or note to save ("remember that...").
+- 'PERSONAL_QUERY': a question about the user's own notes or plans.
+- 'GENERAL_KNOWLEDGE': a general question about the world.
+- 'SYSTEM_COMMAND': a computer action (open apps/websites, timers, reminders, Spotify).
+
+Rewrite each task's 'input' so it makes sense on its own. Use 'depends_on' to list
+the ids of earlier tasks that must finish first (e.g. playing a song depends on
+opening Spotify). Tasks that don't need each other get an empty list.
+
+Respond with ONLY a JSON list, for example:
+User: "Open Spotify, play Nirvana and remember I have a dentist appointment Friday"
+[
+  {{"id": 1, "intent": "SYSTEM_COMMAND", "input": "Open Spotify", "depends_on": []}},
+  {{"id": 2, "intent": "SYSTEM_COMMAND", "input": "Play Nirvana on Spotify", "depends_on": [1]}},
+  {{"id": 3, "intent": "INGEST", "input": "I have a dentist appointment on Friday", "depends_on": []}}
+]
+
+User: "{user_input}"
+"""
+planner_prompt = PromptTemplate.from_template(planner_prompt_template)
+planner_chain = planner_prompt | planner_llm | StrOutputParser()
+
+
+def parse_plan(raw_text: str) -> list:
+    """
+    Turns the planner's reply into a list of validated steps.
+    Unknown intents fall back to GENERAL_KNOWLEDGE; dependencies may only
+    point at earlier steps, so the plan can never contain a cycle.
+    """
+    start = raw_text.find("[")
+    end = raw_text.rfind("]")
+    if start == -1 or end <= start:
+        raise ValueError(f"No JSON list in planner output: {raw_text!r}")
+
+    steps = []
+    id_map = {}  # planner's ids -> our 1..n ids (guards against duplicates)
+    for item in json.loads(raw_text[start:end + 1])[:MAX_STEPS]:
+        if not isinstance(item, dict) or not str(item.get("input", "")).strip():
+            continue
+        step_id = len(steps) + 1
+        intent = str(item.get("intent", "")).strip().upper()
+        depends_on = item.get("depends_on") or []
+        steps.append({
+            "id": step_id,
+            "intent": intent if intent in INTENTS else "GENERAL_KNOWLEDGE",
+            "input": str(item["input"]).strip(),
+            "depends_on": [id_map[d] for d in depends_on if isinstance(d, (int, str)) and d in id_map],
+        })
+        if isinstance(item.get("id"), (int, str)):
+            id_map[item["id"]] = step_id
+
+    if not steps:
+        raise ValueError("Planner returned no usable steps.")
+    return steps
+
+
+def make_plan(user_input: str) -> list:
+    """Asks the planner LLM for an ordered list of sub-tasks."""
+    raw = planner_chain.invoke({"user_input": user_input})
+    print(f"Planner output: {raw.strip()}")
+    return parse_plan(raw)
+
+
+# --- Plan execution ---
+_step_pool = ThreadPoolExecutor(max_workers=MAX_PARALLEL_STEPS, thread_name_prefix="plan-step")
+
+
+def execute_plan(steps: list, run_step) -> list:
+    """
+    Runs each step with run_step(step) as soon as its dependencies are done.
+    Independent steps run concurrently on a shared worker pool.
+    Returns the results in plan order.
+    """
+    results = {}
+    pending = {step["id"]: step for step in steps}
+    running = {}
+
+    while pending or running:
+        # Start everything whose dependencies have finished
+        for step_id, step in list(pending.items()):
+            if all(dep in results for dep in step["depends_on"]):
+                running[_step_pool.submit(run_step, step)] = step_id
+                del pending[step_id]
+
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            step_id = running.pop(future)
+            try:
+                results[step_id] = future.result()
+            except Exception as e:
+                print(f"Planner: Step {step_id} failed: {e}")
+                results[step_id] = e
+
+    return [results[step["id"]] for step in steps]
@@ -0,0 +1,181 @@
+import os
+import re
+import sys
+import json
+import time
+import functools
+import threading
+from contextlib import contextmanager
+
+# --- Profiling Settings ---
+# LUMI_PROFILE=off  (default) nothing is sampled, handlers run untouched
+# LUMI_PROFILE=all  every wrapped request / upload job is profiled and saved
+# LUMI_PROFILE=slow every one is sampled, but only saved if it took > LUMI_SLOW_REQUEST_SECONDS
+# A single request can opt in with the header 'X-Lumi-Profile: 1' (saved regardless of mode).
+backend_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(backend_dir)
+PROFILE_MODE = os.environ.get("LUMI_PROFILE", "off").lower()
+PROFILE_DIR = os.environ.get("LUMI_PROFILE_DIR", os.path.join(root_dir, "profiles"))
+SLOW_REQUEST_SECONDS = float(os.environ.get("LUMI_SLOW_REQUEST_SECONDS", "5"))
+SAMPLE_INTERVAL = float(os.environ.get("LUMI_PROFILE_INTERVAL_MS", "5")) / 1000
+PROFILE_HEADER = "X-Lumi-Profile"
+# ---
+
+# Leaf frames in these stdlib files mean "parked thread", not work
+_IDLE_FILES = ("threading.py", "queue.py", "selectors.py", "socketserver.py", "thread.py")
+
+_local = threading.local()
+_active_sessions = 0     # Fast path for tag(): nothing to do when no profile is running
+_sessions_lock = threading.Lock()
+
+
+class SamplingProfiler:
+    """
+    Samples every thread's Python stack every SAMPLE_INTERVAL seconds.
+    All threads are included (a request fans out to LLM, embedding and
+    hedge pools), minus threads that are just parked on a lock or queue.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.counts = {}            # (thread name, frame, frame, ...) -> samples
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def _frame_name(frame):
+        code = frame.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def _sample(self):
+        own_id = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            if os.path.basename(frame.f_code.co_filename) in _IDLE_FILES:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_name(frame))
+                frame = frame.f_back
+            key = (names.get(thread_id, str(thread_id)),) + tuple(reversed(stack))
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="lumi-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.counts
+
+
+# --- Output formats ---
+
+def to_collapsed(counts):
+    """Brendan Gregg's collapsed stacks ('a;b;c 12'), for flamegraph.pl / speedscope."""
+    return "\n".join(f"{';'.join(stack)} {count}" for stack, count in
+                     sorted(counts.items(), key=lambda item: -item[1])) + "\n"
+
+
+def to_speedscope(counts, name, interval, duration):
+    """A speedscope 'sampled' profile (open at https://www.speedscope.app)."""
+    frames, frame_index, samples, weights = [], {}, [], []
+    for stack, count in counts.items():
+        indexes = []
+        for frame in stack:
+            if frame not in frame_index:
+                frame_index[frame] = len(frames)
+                frames.append({"name": frame})
+            indexes.append(frame_index[frame])
+        samples.append(indexes)
+        weights.append(count * interval)
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "shared": {"frames": frames},
+        "profiles": [{
+            "type": "sampled", "name": name, "unit": "seconds",
+            "startValue": 0, "endValue": duration,
+            "samples": samples, "weights": weights,
+        }],
+        "name": name,
+        "activeProfileIndex": 0,
+        "exporter": "lumi",
+    }
+
+
+def _save(name, tags, counts, interval, duration):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    label = "_".join(re.sub(r"[^\w-]+", "-", str(v))[:40] for v in [name] + list(tags.values()) if v)
+    stem = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}_{label}_{int(duration * 1000)}ms")
+    with open(f"{stem}.collapsed.txt", "w") as f:
+        f.write(to_collapsed(counts))
+    with open(f"{stem}.speedscope.json", "w") as f:
+        json.dump(to_speedscope(counts, f"{name} {tags}", interval, duration), f)
+    print(f"Profiling: {name} took {duration:.2f}s -> {stem}.speedscope.json")
+
+
+# --- Public API ---
+
+@contextmanager
+def session(name, force=False):
+    """
+    Profiles the enclosed block when profiling is on (or force=True).
+    With LUMI_PROFILE=off and no force this is a plain no-op.
+    """
+    if not force and PROFILE_MODE not in ("all", "slow"):
+        yield
+        return
+
+    global _active_sessions
+    profiler = SamplingProfiler().start()
+    with _sessions_lock:
+        _active_sessions += 1
+    previous = getattr(_local, "tags", None)
+    _local.tags = {}
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - started
+        counts = profiler.stop()
+        tags = _local.tags
+        _local.tags = previous
+        with _sessions_lock:
+            _active_sessions -= 1
+        if force or PROFILE_MODE == "all" or duration >= SLOW_REQUEST_SECONDS:
+            try:
+                _save(name, tags, counts, profiler.interval, duration)
+            except OSError as e:
+                print(f"Profiling: Could not save profile: {e}")
+
+
+def tag(**tags):
+    """Labels the current profile (e.g. tag(intent='PERSONAL_QUERY')); free when nothing is profiled."""
+    if not _active_sessions:
+        return
+    current = getattr(_local, "tags", None)
+    if current is not None:
+        current.update(tags)
+
+
+def profile_route(name):
+    """Flask handler decorator: profiles the request if the mode or the X-Lumi-Profile header asks for it."""
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(*args, **kwargs):
+            from flask import request
+            force = request.headers.get(PROFILE_HEADER) == "1"
+            if not force and PROFILE_MODE == "off":
+                return handler(*args, **kwargs)
+            with session(name, force=force):
+                return handler(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -1,6 +1,6 @@
-import chromadb
 from dotenv import load_dotenv, find_dotenv
 import os
+import sys
 
 from langchain_core.prompts import PromptTemplate
 from langchain_core.runnables import RunnablePassthrough
@@ -8,10 +8,17 @@ from langchain_core.output_parsers import StrOutputParser
 
 # --- NEW/UPDATED IMPORTS ---
 from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_chroma import Chroma
 # --- END OF UPDATES ---
 
+# --- Add root_dir to path (so 'backend' imports work when run as a script) ---
+backend_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(backend_dir)
+if root_dir not in sys.path:
+    sys.path.append(root_dir)
+# ---
+
+from backend.memory_client import connect
+
 
 # --- 1. Load API Key ---
 load_dotenv(find_dotenv())
@@ -22,23 +29,10 @@ if "GOOGLE_API_KEY" not in os.environ:
 # --- 2. Initialize ---
 print("Initializing...")
 
-# --- NEW: Use the same local embedding model ---
-print("Loading local embedding model (all-MiniLM-L6-v2)...")
-embedding_function = HuggingFaceEmbeddings(
-    model_name="all-MiniLM-L6-v2"
-)
-print("Embedding model loaded.")
-
-# Note: path is now ../ to find DB in the root LUMI folder
-client = chromadb.PersistentClient(path="../chroma_db") 
-
-# --- THIS FIXES THE 'AttributeError' ---
-vector_store = Chroma(
-    client=client,
-    collection_name="cognitive_companion_memory",
-    embedding_function=embedding_function,
-)
-# --- END OF FIX ---
+# --- UPDATED: Thin client of the shared memory service (no local model) ---
+print("Connecting to the memory service...")
+embedding_function, vector_store = connect()
+print("Memory service connected.")
 
 llm = ChatGoogleGenerativeAI(model="gemini-pro-latest", temperature=0)
 
@@ -0,0 +1,260 @@
+import os
+import time
+import threading
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from langchain_core.runnables import Runnable
+
+from backend.answer_cache import normalize_query
+
+# --- Deadlines (seconds) per stage; override with e.g. LUMI_DEADLINE_ROUTER=3 ---
+STAGE_DEADLINES = {
+    "router": 4.0,
+    "batch_router": 20.0,       # Up to ROUTER_BATCH_SIZE statements per prompt
+    "planner": 5.0,
+    "parser": 5.0,
+    "summarizer": 4.0,
+    "condense": 4.0,
+    "rag": 8.0,
+    "general_fast": 8.0,
+    "general": 15.0,
+    "vision": 20.0,
+    "transcribe": 20.0,
+}
+DEFAULT_DEADLINE = 10.0
+
+HEDGE_MIN_SAMPLES = 20      # Observed calls needed before p95 is trusted for hedging
+LATENCY_WINDOW = 200        # Recent latencies kept per stage
+BREAKER_FAILURES = 5        # Consecutive failures that open the circuit
+BREAKER_RESET_SECONDS = 30  # How long an open circuit fast-fails before letting one call through
+STALE_ANSWERS_SIZE = 256
+# ---
+
+
+def stage_deadline(stage):
+    override = os.environ.get(f"LUMI_DEADLINE_{stage.upper()}")
+    return float(override) if override else STAGE_DEADLINES.get(stage, DEFAULT_DEADLINE)
+
+
+class StageUnavailable(Exception):
+    """A stage could not produce an answer in time; callers use a local fallback."""
+
+
+class StageTimeout(StageUnavailable):
+    pass
+
+
+class CircuitOpen(StageUnavailable):
+    pass
+
+
+class LatencyTracker:
+    """Recent successful latencies for one stage."""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct):
+        with self._lock:
+            if not self._samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+    def hedge_delay(self):
+        """p95 once there's enough history, else None (no hedging yet)."""
+        with self._lock:
+            enough = len(self._samples) >= HEDGE_MIN_SAMPLES
+        return self.percentile(95) if enough else None
+
+
+class CircuitBreaker:
+    """
+    closed -> (BREAKER_FAILURES in a row) -> open: every call fails instantly
+    -> (after BREAKER_RESET_SECONDS) -> half-open: one trial call decides.
+    """
+
+    def __init__(self, name, failures=BREAKER_FAILURES, reset_seconds=BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failures = failures
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._consecutive = 0
+        self._opened_at = None
+        self._trial_running = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half-open" if time.time() - self._opened_at >= self.reset_seconds else "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.time() - self._opened_at < self.reset_seconds or self._trial_running:
+                return False
+            self._trial_running = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                print(f"Resilience: Circuit '{self.name}' closed again.")
+            self._consecutive = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive += 1
+            if self._trial_running or self._consecutive >= self.failures:
+                if self._opened_at is None or self._trial_running:
+                    print(f"Resilience: Circuit '{self.name}' OPEN for {self.reset_seconds}s.")
+                self._opened_at = time.time()
+            self._trial_running = False
+
+
+# One breaker per upstream service: when Gemini is down, every stage fast-fails
+breakers = {"gemini": CircuitBreaker("gemini")}
+latencies = {}
+hedge_counts = {}
+_registry_lock = threading.Lock()
+
+# Stalled calls can't be cancelled, so the pool has headroom for them
+_call_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="guarded-call")
+
+
+def _tracker(stage):
+    with _registry_lock:
+        return latencies.setdefault(stage, LatencyTracker())
+
+
+def call_with_deadline(stage, fn, *args, breaker="gemini", deadline=None, **kwargs):
+    """
+    Runs fn(*args, **kwargs) with a deadline. If it's still running after the
+    stage's observed p95 (or fails fast), ONE duplicate is sent and whichever
+    finishes first wins. Raises StageUnavailable (CircuitOpen / StageTimeout)
+    instead of hanging.
+    """
+    circuit = breakers.setdefault(breaker, CircuitBreaker(breaker))
+    if not circuit.allow():
+        raise CircuitOpen(f"{stage}: circuit '{breaker}' is open")
+
+    tracker = _tracker(stage)
+    started = time.perf_counter()
+    ends_at = started + (deadline or stage_deadline(stage))
+    hedge_at = tracker.hedge_delay()
+    pending = {_call_pool.submit(fn, *args, **kwargs)}
+    hedged = False
+    last_error = None
+
+    while True:
+        now = time.perf_counter()
+        if now >= ends_at:
+            break
+        wake = ends_at if hedged or hedge_at is None else min(ends_at, started + hedge_at)
+        done, pending = wait(pending, timeout=max(0.0, wake - now), return_when=FIRST_COMPLETED)
+
+        for future in done:
+            if future.exception() is None:
+                elapsed = time.perf_counter() - started
+                tracker.record(elapsed)
+                circuit.record_success()
+                return future.result()
+            last_error = future.exception()
+
+        now = time.perf_counter()
+        too_slow = hedge_at is not None and now - started >= hedge_at
+        if not hedged and now < ends_at and (too_slow or not pending):
+            hedged = True
+            with _registry_lock:
+                hedge_counts[stage] = hedge_counts.get(stage, 0) + 1
+            print(f"Resilience: Hedging '{stage}' after {now - started:.2f}s"
+                  f"{' (first call failed)' if not pending else ''}.")
+            pending.add(_call_pool.submit(fn, *args, **kwargs))
+        elif not pending:
+            break
+
+    circuit.record_failure()
+    if last_error is not None and not pending:
+        raise StageUnavailable(f"{stage} failed: {last_error}") from last_error
+    raise StageTimeout(f"{stage} took longer than {ends_at - started:.1f}s")
+
+
+class GuardedModel(Runnable):
+    """
+    A chat model whose invoke() goes through call_with_deadline. Composes like
+    the model itself (`prompt | guarded(llm, "router") | StrOutputParser()`)
+    and can be wrapped by memoized() (hedges stay inside the memo, so the
+    memo's single-flight never coalesces a hedge with its original).
+    """
+
+    def __init__(self, llm, stage):
+        self._llm = llm
+        self.stage = stage
+
+    def invoke(self, input, config=None, **kwargs):
+        return call_with_deadline(self.stage, self._llm.invoke, input)
+
+    def __getattr__(self, name):
+        # temperature, model, ... come from the wrapped model
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self._llm, name)
+
+
+def guarded(llm, stage):
+    return GuardedModel(llm, stage)
+
+
+class StaleAnswers:
+    """Last good answer per question, served (marked as possibly outdated) during outages."""
+
+    def __init__(self, max_size=STALE_ANSWERS_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def remember(self, kind, query, answer):
+        with self._lock:
+            key = (kind, normalize_query(query))
+            self._entries[key] = answer
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def recall(self, kind, query):
+        with self._lock:
+            return self._entries.get((kind, normalize_query(query)))
+
+
+stale_answers = StaleAnswers()
+
+
+def report():
+    """p50/p95/p99 per stage, hedge counts and breaker states."""
+    with _registry_lock:
+        stages = dict(latencies)
+        hedges = dict(hedge_counts)
+    return {
+        "stages": {
+            stage: {
+                "p50": tracker.percentile(50),
+                "p95": tracker.percentile(95),
+                "p99": tracker.percentile(99),
+                "deadline": stage_deadline(stage),
+                "hedges": hedges.get(stage, 0),
+            }
+            for stage, tracker in stages.items()
+        },
+        "breakers": {name: breaker.state for name, breaker in breakers.items()},
+    }
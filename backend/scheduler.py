@@ -0,0 +1,233 @@
+import os
+import math
+import time
+import heapq
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from backend.command_parser import parse_duration
+
+# --- Storage ---
+# Saved next to chroma_db in the root LUMI folder, independent of the current directory
+backend_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(backend_dir)
+TIMER_DB_PATH = os.environ.get("LUMI_TIMER_DB", os.path.join(root_dir, "lumi_timers.db"))
+
+DEFAULT_SNOOZE = 5 * 60
+# ---
+
+
+def format_duration(seconds: int) -> str:
+    """300 -> '5 minutes', 5400 -> '1 hour 30 minutes'."""
+    parts = []
+    for name, size in (("day", 86400), ("hour", 3600), ("minute", 60), ("second", 1)):
+        value, seconds = divmod(int(seconds), size)
+        if value:
+            parts.append(f"{value} {name}{'s' if value != 1 else ''}")
+    return " ".join(parts) or "0 seconds"
+
+
+def next_due(due_at: float, interval: int, now: float) -> float:
+    """
+    The first run of a recurring timer after `now`, on its original cadence.
+    Advances by whole intervals, so an overdue reminder fires once, not once per missed run.
+    """
+    missed = max(1, math.ceil((now - due_at) / interval))
+    next_at = due_at + missed * interval
+    return next_at if next_at > now else next_at + interval
+
+
+class TimerScheduler:
+    """
+    All timers and reminders share ONE worker thread.
+
+    Deadlines sit in a min-heap; the worker sleeps on a Condition until the
+    earliest one is due (or until something new is added). Cancelled or
+    snoozed entries are left in the heap and skipped when they surface, so
+    adding and firing stay O(log n) no matter how many timers are pending.
+    Everything is mirrored to SQLite and reloaded on startup.
+    """
+
+    def __init__(self, db_path=TIMER_DB_PATH, on_fire=None):
+        self.on_fire = on_fire or (lambda timer, text: print(f"TIMER: {text}"))
+
+        self._timers = {}   # id -> timer dict
+        self._heap = []     # (due_at, id)
+        self._cond = threading.Condition()
+        self._last_fired = None
+        self._stopped = False
+        self._worker = None
+        # Callbacks (e.g. speaking) run here so a slow 'say' never delays other deadlines
+        self._callbacks = ThreadPoolExecutor(max_workers=1, thread_name_prefix="timer-callback")
+
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        # WAL + NORMAL sync: one small append per change instead of a full fsync
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS timers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                label TEXT NOT NULL,
+                message TEXT,
+                duration INTEGER NOT NULL,
+                interval INTEGER,
+                due_at REAL NOT NULL
+            )
+        """)
+        self._db.commit()
+        self._load()
+
+    # --- Persistence ---
+    def _load(self):
+        rows = self._db.execute("SELECT id, kind, label, message, duration, interval, due_at FROM timers").fetchall()
+        for row in rows:
+            timer = dict(zip(("id", "kind", "label", "message", "duration", "interval", "due_at"), row))
+            self._timers[timer["id"]] = timer
+            self._heap.append((timer["due_at"], timer["id"]))
+        heapq.heapify(self._heap)
+        if rows:
+            print(f"Scheduler: Restored {len(rows)} pending timers.")
+
+    def _save_due(self, timer):
+        self._db.execute("UPDATE timers SET due_at = ? WHERE id = ?", (timer["due_at"], timer["id"]))
+        self._db.commit()
+
+    def _delete(self, timer_ids):
+        self._db.executemany("DELETE FROM timers WHERE id = ?", [(i,) for i in timer_ids])
+        self._db.commit()
+
+    # --- Worker ---
+    def start(self):
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._run, name="timer-scheduler", daemon=True)
+            self._worker.start()
+        return self
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        self._callbacks.shutdown(wait=False)
+
+    def _run(self):
+        with self._cond:
+            while not self._stopped:
+                # Drop entries for timers that were cancelled or moved
+                while self._heap:
+                    due_at, timer_id = self._heap[0]
+                    timer = self._timers.get(timer_id)
+                    if timer is not None and timer["due_at"] == due_at:
+                        break
+                    heapq.heappop(self._heap)
+
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+
+                due_at, timer_id = self._heap[0]
+                wait = due_at - time.time()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+
+                heapq.heappop(self._heap)
+                timer = self._timers[timer_id]
+                if timer["interval"]:
+                    # Recurring: skip the runs missed during a long downtime, but keep the cadence
+                    timer["due_at"] = next_due(due_at, timer["interval"], time.time())
+                    heapq.heappush(self._heap, (timer["due_at"], timer_id))
+                    self._save_due(timer)
+                else:
+                    del self._timers[timer_id]
+                    self._delete([timer_id])
+
+                self._last_fired = dict(timer)
+                self._callbacks.submit(self.on_fire, dict(timer), self.fire_text(timer))
+
+    @staticmethod
+    def fire_text(timer) -> str:
+        if timer["kind"] == "reminder":
+            return f"Reminder: {timer['message']}"
+        return f"Timer complete. Your {timer['label']} is up."
+
+    # --- Public API ---
+    def add(self, kind: str, duration: int, message: str = None, interval: int = None) -> dict:
+        """Schedules a 'timer' or 'reminder' that fires in `duration` seconds."""
+        if kind == "reminder":
+            label = f"reminder to {message}"
+        else:
+            label = f"{format_duration(duration)} timer"
+
+        due_at = time.time() + duration
+        with self._cond:
+            cursor = self._db.execute(
+                "INSERT INTO timers (kind, label, message, duration, interval, due_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (kind, label, message, duration, interval, due_at)
+            )
+            self._db.commit()
+            timer = {"id": cursor.lastrowid, "kind": kind, "label": label, "message": message,
+                     "duration": duration, "interval": interval, "due_at": due_at}
+            self._timers[timer["id"]] = timer
+            heapq.heappush(self._heap, (due_at, timer["id"]))
+            self._cond.notify()
+        return dict(timer)
+
+    def list(self) -> list:
+        """Pending timers, soonest first."""
+        with self._cond:
+            return sorted((dict(t) for t in self._timers.values()), key=lambda t: t["due_at"])
+
+    def _match(self, target):
+        """Finds timers for a spoken target: None (the next one), 'all', an id, a duration or label words."""
+        pending = sorted(self._timers.values(), key=lambda t: t["due_at"])
+        if not pending:
+            return []
+        if not target:
+            return pending[:1]
+
+        target = target.strip().lower()
+        if target == "all":
+            return pending
+        if target.lstrip("#").isdigit():
+            timer = self._timers.get(int(target.lstrip("#")))
+            return [timer] if timer else []
+
+        seconds = parse_duration(target)
+        if seconds:
+            return [t for t in pending if t["duration"] == seconds][:1]
+        return [t for t in pending if target in t["label"].lower()][:1]
+
+    def cancel(self, target: str = None) -> list:
+        """Cancels matching timers and returns them."""
+        with self._cond:
+            matches = self._match(target)
+            for timer in matches:
+                del self._timers[timer["id"]]
+            if matches:
+                self._delete([t["id"] for t in matches])
+            # Stale heap entries are skipped by the worker
+            return [dict(t) for t in matches]
+
+    def snooze(self, target: str = None, seconds: int = DEFAULT_SNOOZE):
+        """
+        With no target, re-arms whatever just went off for another `seconds`
+        (recurring reminders keep their normal schedule too). With a target,
+        or if nothing has fired yet, pushes a pending timer back instead.
+        """
+        with self._cond:
+            fired = None if target else self._last_fired
+            if fired is not None:
+                self._last_fired = None
+                return self.add(fired["kind"], seconds, fired["message"])
+
+            matches = self._match(target)
+            if not matches:
+                return None
+            timer = matches[0]
+            timer["due_at"] += seconds
+            heapq.heappush(self._heap, (timer["due_at"], timer["id"]))
+            self._save_due(timer)
+            self._cond.notify()
+            return dict(timer)
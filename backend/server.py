@@ -6,8 +6,8 @@ from dotenv import load_dotenv, find_dotenv
 load_dotenv(find_dotenv())
 # --- END OF FIX ---
 
-# --- Silence the Tokenizer Warning ---
-os.environ["TOKENIZERS_PARALLELISM"] = "false"
+# --- Silence the Tokenizer Warning (can be overridden in .env) ---
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
 # ---
 
 # --- Add root_dir to path ---
@@ -27,6 +27,7 @@ import sounddevice as sd
 import scipy.io.wavfile as wavfile
 import google.generativeai as genai
 import threading 
+from collections import deque
 import shlex
 import werkzeug.utils
 
@@ -34,16 +35,19 @@ import werkzeug.utils
 from backend import brain 
 from backend import speak_tool
 from backend import document_processor
+from backend import upload_jobs
+from backend import batch
+from backend import profiling
+from backend import general_tool
+from backend import resilience
+from backend import audio_stream
+from backend.resilience import call_with_deadline
+from backend.wake_word import WakeWordListener
 # ---
 
 # --- 1. Initialize Flask App ---
 app = Flask(__name__)
 
-# --- NEW: Upload Folder ---
-UPLOAD_FOLDER = 'uploads'
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-# ---
-
 # --- 2. Load API Key & Configure ---
 GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY")
 if not GOOGLE_API_KEY:
@@ -70,7 +74,7 @@ def record_and_transcribe(filename="temp_audio.wav", duration=5, fs=44100):
             time.sleep(1)
             audio_file = genai.get_file(audio_file.name)
         
-        response = transcription_model.generate_content([
+        response = call_with_deadline("transcribe", transcription_model.generate_content, [
             "Transcribe this audio clip.",
             audio_file
         ])
@@ -84,8 +88,33 @@ def record_and_transcribe(filename="temp_audio.wav", duration=5, fs=44100):
             os.remove(filename)
         return None
 
+# --- NEW: Client-streamed audio (WebSocket, see audio_stream.py) ---
+# The UI streams its own microphone; segments arrive here as in-memory WAV
+# bytes and go inline to Gemini (no temp file, no upload + polling).
+def transcribe_segment(wav_bytes):
+    response = call_with_deadline("transcribe", transcription_model.generate_content, [
+        "Transcribe this audio clip. Reply with only the words spoken, or nothing if there is no speech.",
+        {"mime_type": "audio/wav", "data": wav_bytes}
+    ])
+    try:
+        return response.text
+    except ValueError:  # No text part: nothing was said
+        return ""
+
+def respond_to_transcript(user_input, session_id):
+    """Called the moment the last segment is transcribed."""
+    if not user_input:
+        threading.Thread(target=speak_tool.speak, args=("Sorry, I didn't catch that.",)).start()
+        return {"status": "error", "message": "No input detected", "user_text": ""}
+    print(f"You (streamed): {user_input}")
+    response_object = brain.get_ai_response(user_input, session_id=session_id)
+    response_object['user_text'] = user_input
+    threading.Thread(target=speak_tool.speak, args=(response_object["summary_text"],)).start()
+    return response_object
+
 # --- 5. Create the API Endpoint (Updated) ---
 @app.route('/listen', methods=['POST'])
+@profiling.profile_route('listen')
 def handle_listen():
     user_input = record_and_transcribe()
     if not user_input:
@@ -94,7 +123,9 @@ def handle_listen():
 
     print(f"You: {user_input}")
     
-    response_object = brain.get_ai_response(user_input)
+    # The UI can send a session_id so follow-up questions keep their context
+    session_id = (request.get_json(silent=True) or {}).get('session_id', 'default')
+    response_object = brain.get_ai_response(user_input, session_id=session_id)
     response_object['user_text'] = user_input
     
     # --- NEW: Use the speak tool ---
@@ -103,8 +134,43 @@ def handle_listen():
     
     return jsonify(response_object)
 
+# --- NEW: Hands-free Wake Word Mode ---
+# While enabled, a low-CPU listener waits for "Lumi" and then runs the same
+# record -> transcribe -> brain -> speak pipeline as /listen. The UI can poll
+# GET /wake-mode for the exchanges that happened hands-free.
+wake_exchanges = deque(maxlen=20)
+
+def handle_wake_word():
+    speak_tool.speak("Yes?")
+    user_input = record_and_transcribe()
+    if not user_input:
+        speak_tool.speak("Sorry, I didn't catch that.")
+        return
+    print(f"You (wake word): {user_input}")
+    response_object = brain.get_ai_response(user_input, session_id="wake-word")
+    response_object['user_text'] = user_input
+    response_object['at'] = time.time()
+    wake_exchanges.append(response_object)
+    speak_tool.speak(response_object["summary_text"])
+
+wake_listener = WakeWordListener(on_wake=handle_wake_word)
+
+@app.route('/wake-mode', methods=['GET', 'POST'])
+def handle_wake_mode():
+    if request.method == 'POST':
+        enabled = bool((request.get_json(silent=True) or {}).get('enabled', True))
+        if enabled:
+            try:
+                wake_listener.start()
+            except FileNotFoundError as e:
+                return jsonify({"status": "error", "message": str(e)}), 400
+        else:
+            wake_listener.stop()
+    return jsonify({"status": "ok", "enabled": wake_listener.running, "exchanges": list(wake_exchanges)})
+
 # --- NEW: Text Command Endpoint ---
 @app.route('/text-command', methods=['POST'])
+@profiling.profile_route('text-command')
 def handle_text_command():
     data = request.get_json()
     if not data or 'user_input' not in data:
@@ -117,7 +183,7 @@ def handle_text_command():
     print(f"You (text): {user_input}")
     
     # We can reuse the exact same brain function
-    response_object = brain.get_ai_response(user_input)
+    response_object = brain.get_ai_response(user_input, session_id=data.get('session_id', 'default'))
     response_object['user_text'] = user_input
     
     # Also speak the response
@@ -126,7 +192,23 @@ def handle_text_command():
     return jsonify(response_object)
 # --- END OF NEW ENDPOINT ---
 
-# --- NEW: Document Upload Endpoint ---
+# --- NEW: Batch Endpoint (many text commands / notes in one request) ---
+@app.route('/batch', methods=['POST'])
+@profiling.profile_route('batch')
+def handle_batch():
+    data = request.get_json(silent=True) or {}
+    inputs = [str(item).strip() for item in data.get('inputs', []) if str(item).strip()]
+    if not inputs:
+        return jsonify({"status": "error", "message": "No inputs provided"}), 400
+    if len(inputs) > batch.MAX_BATCH_ITEMS:
+        return jsonify({"status": "error", "message": f"At most {batch.MAX_BATCH_ITEMS} inputs per batch"}), 400
+
+    start = time.perf_counter()
+    results = batch.run_batch(inputs)
+    # Batches aren't spoken: N answers read aloud back to back isn't useful
+    return jsonify({"status": "ok", "results": results, "elapsed_seconds": round(time.perf_counter() - start, 2)})
+
+# --- NEW: Document Upload Endpoint (returns immediately, processing runs as a job) ---
 @app.route('/upload', methods=['POST'])
 def handle_upload():
     if 'file' not in request.files:
@@ -136,23 +218,39 @@ def handle_upload():
     if file.filename == '':
         return jsonify({"status": "error", "message": "No selected file"}), 400
     
-    if file:
-        filename = werkzeug.utils.secure_filename(file.filename)
-        filepath = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(filepath)
-        
-        print(f"File saved to {filepath}")
-        
-        # Process the file and create the RAG chain
-        message = document_processor.load_and_process_document(filepath)
-        
-        if "Error" in message:
-            return jsonify({"status": "error", "message": message}), 500
-        else:
-            return jsonify({"status": "success", "filename": filename, "message": message})
+    filename = werkzeug.utils.secure_filename(file.filename)
+    if not document_processor.is_supported(filename):
+        return jsonify({"status": "error", "message": "Error: Unsupported file type."}), 400
+
+    # pymupdf opens the uploaded bytes directly -- nothing is written to disk
+    # 'X-Lumi-Profile: 1' on the upload profiles the background job that indexes it
+    job_id = upload_jobs.submit_upload(file.read(), filename,
+                                       profile=request.headers.get(profiling.PROFILE_HEADER) == "1")
+    print(f"Upload job {job_id} queued for {filename}")
+
+    return jsonify({"status": "accepted", "job_id": job_id, "filename": filename}), 202
+
+# --- NEW: Upload Progress Endpoint ---
+@app.route('/upload-status/<job_id>', methods=['GET'])
+def handle_upload_status(job_id):
+    job = upload_jobs.get_job(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Unknown job id"}), 404
+    return jsonify(job)
+
+# --- NEW: Model Cascade Stats (escalations, latency saved) ---
+@app.route('/cascade-stats', methods=['GET'])
+def handle_cascade_stats():
+    return jsonify(general_tool.cascade_stats.report())
+
+# --- NEW: Latency / Hedging / Circuit Breaker Stats ---
+@app.route('/resilience-stats', methods=['GET'])
+def handle_resilience_stats():
+    return jsonify(resilience.report())
 
 # --- NEW: Document Q&A Endpoint ---
 @app.route('/ask-document', methods=['POST'])
+@profiling.profile_route('ask-document')
 def handle_ask_document():
     data = request.get_json()
     if not data or 'user_input' not in data:
@@ -180,4 +278,8 @@ if __name__ == "__main__":
     print("Starting Flask server... (Speak 'online' message)")
     # Use the tool for the startup message
     threading.Thread(target=speak_tool.speak, args=("Lumi is online, here to help",)).start()
+    # --- NEW: Render the canned replies to the TTS cache in the background ---
+    speak_tool.prerender_common_phrases()
+    # --- NEW: WebSocket endpoint for audio streamed from the UI ---
+    audio_stream.start_stream_server(transcribe_segment, respond_to_transcript)
     app.run(port=5001, debug=False)
\ No newline at end of file
@@ -1,17 +1,129 @@
+import os
+import hashlib
+import threading
 import subprocess
 import shlex
 
-def speak(text_to_speak: str):
+from backend.scheduler import TimerScheduler, format_duration
+
+# --- TTS Cache Settings ---
+# Clips are saved next to chroma_db in the root LUMI folder
+backend_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(backend_dir)
+TTS_CACHE_DIR = os.environ.get("LUMI_TTS_CACHE_DIR", os.path.join(root_dir, "tts_cache"))
+TTS_CACHE_MAX_BYTES = int(os.environ.get("LUMI_TTS_CACHE_MB", "50")) * 1024 * 1024
+TTS_VOICE = os.environ.get("LUMI_TTS_VOICE")    # None -> the system voice
+TTS_RATE = os.environ.get("LUMI_TTS_RATE")      # None -> the system rate
+CACHE_AFTER_REPEATS = 2   # Other text is rendered to the cache once it has been spoken this often
+
+# Fixed lines LUMI says all the time; rendered in the background at startup
+COMMON_PHRASES = [
+    "Lumi is online, here to help",
+    "Hi there! How can I help you?",
+    "Got it. I've saved that to my memory.",
+    "Sorry, I didn't catch that.",
+    "I'm not sure what you mean by that.",
+]
+# "Timer complete. Your 5 minutes timer is up." includes the timer's label, so only the
+# usual lengths are rendered up front; other lengths are cached once they repeat
+COMMON_TIMER_SECONDS = (60, 120, 180, 300, 600, 900, 1200, 1800, 2700, 3600)
+COMMON_PHRASES += [TimerScheduler.fire_text({"kind": "timer", "label": f"{format_duration(seconds)} timer"})
+                   for seconds in COMMON_TIMER_SECONDS]
+# ---
+
+_seen_counts = {}
+_render_lock = threading.Lock()
+
+
+def _say_args(voice, rate):
+    args = ["say"]
+    if voice:
+        args += ["-v", voice]
+    if rate:
+        args += ["-r", str(rate)]
+    return args
+
+
+def _clip_path(text, voice, rate):
+    """Cache key: (voice, rate, text hash)."""
+    digest = hashlib.sha256(f"{voice or ''}|{rate or ''}|{text}".encode("utf-8")).hexdigest()[:32]
+    return os.path.join(TTS_CACHE_DIR, f"{digest}.aiff")
+
+
+def _evict():
+    """Deletes least-recently-played clips until the cache fits its size limit."""
+    try:
+        clips = [os.path.join(TTS_CACHE_DIR, name) for name in os.listdir(TTS_CACHE_DIR) if name.endswith(".aiff")]
+        clips = [(os.stat(path), path) for path in clips]
+    except OSError:
+        return
+    total = sum(stat.st_size for stat, _ in clips)
+    # Playing a clip bumps its mtime, so oldest mtime = least recently played
+    for stat, path in sorted(clips, key=lambda item: item[0].st_mtime):
+        if total <= TTS_CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+            total -= stat.st_size
+        except OSError:
+            pass
+
+
+def render(text, voice=TTS_VOICE, rate=TTS_RATE):
+    """Renders text to a cached audio clip ('say -o') and returns its path."""
+    path = _clip_path(text, voice, rate)
+    if os.path.exists(path):
+        return path
+    os.makedirs(TTS_CACHE_DIR, exist_ok=True)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp.aiff"
+    try:
+        subprocess.run(_say_args(voice, rate) + ["-o", tmp_path, text], check=True)
+        os.replace(tmp_path, path)  # Players never see a half-written clip
+    except Exception as e:
+        print(f"Error rendering TTS clip: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+    with _render_lock:
+        _evict()
+    return path
+
+
+def prerender_common_phrases(phrases=COMMON_PHRASES, voice=TTS_VOICE, rate=TTS_RATE):
+    """Renders the fixed phrases in a background thread so the first use is instant too."""
+    def run():
+        rendered = sum(1 for phrase in phrases if render(phrase, voice, rate))
+        print(f"Speak: {rendered}/{len(phrases)} common phrases ready in the TTS cache.")
+    threading.Thread(target=run, name="tts-prerender", daemon=True).start()
+
+
+def speak(text_to_speak: str, voice=TTS_VOICE, rate=TTS_RATE):
     """
     Uses the Mac's 'say' command to speak text.
     This is robust and blocks until speech is done.
+    Text that is already in the TTS cache is played straight from disk
+    ('afplay'), skipping synthesis.
     """
     print(f"Companion: {text_to_speak}")
     try:
         # Sanitize text for the command line
         sanitized_text = text_to_speak.replace('\n', ' ')
-        
+
+        clip = _clip_path(sanitized_text, voice, rate)
+        if os.path.exists(clip):
+            os.utime(clip, None)  # Mark as recently played (for eviction)
+            subprocess.run(["afplay", clip], check=True)
+            return
+
         # Use subprocess.run() to wait for the command to complete
-        subprocess.run(["say", sanitized_text], check=True)
+        subprocess.run(_say_args(voice, rate) + [sanitized_text], check=True)
+
+        # Repeated text gets rendered for next time, off the speaking thread
+        key = (voice, rate, sanitized_text)
+        _seen_counts[key] = _seen_counts.get(key, 0) + 1
+        if _seen_counts[key] == CACHE_AFTER_REPEATS:
+            threading.Thread(target=render, args=(sanitized_text, voice, rate), daemon=True).start()
+        if len(_seen_counts) > 1000:
+            _seen_counts.clear()
     except Exception as e:
-        print(f"Error in 'say' command playback: {e}")
\ No newline at end of file
+        print(f"Error in 'say' command playback: {e}")
@@ -0,0 +1,164 @@
+import time
+import threading
+
+# --- Playback Settings ---
+SEARCH_CACHE_TTL = 24 * 60 * 60   # Track URIs don't change; a day is safe
+SEARCH_CACHE_SIZE = 512
+DEVICE_READY_TIMEOUT = 15.0       # Max seconds to wait for a cold-launched client
+DEVICE_POLL_START = 0.25          # First poll delay, doubled each time...
+DEVICE_POLL_MAX = 2.0             # ...up to this
+API_RETRIES = 3                   # Attempts for recoverable API errors (429 / 5xx / network)
+# ---
+
+
+class PlaybackError(Exception):
+    """Raised when Spotify can't play something; the message is safe to speak."""
+
+
+def _is_no_device_error(error) -> bool:
+    return getattr(error, "http_status", None) == 404 or "No active device" in str(error)
+
+
+def _is_recoverable(error) -> bool:
+    status = getattr(error, "http_status", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    # No HTTP status: network problems (timeouts, dropped connections)
+    return isinstance(error, (ConnectionError, TimeoutError)) or "timed out" in str(error).lower()
+
+
+class SpotifyController:
+    """
+    Plays tracks through the Spotify Web API without fixed sleeps.
+
+    Only uses client.search / client.devices / client.start_playback, so a
+    local stub object can stand in for spotipy.Spotify. launch_app and
+    is_app_running are injected for the same reason.
+    """
+
+    def __init__(self, client, launch_app=None, is_app_running=None,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.client = client
+        self.launch_app = launch_app
+        self.is_app_running = is_app_running
+        self.clock = clock
+        self.sleep = sleep
+
+        self._search_cache = {}  # query -> (track_uri, expires_at)
+        self._cache_lock = threading.Lock()
+        self._device_id = None   # Last device that accepted playback
+
+    # --- API calls with retries ---
+    def _call(self, fn, *args, **kwargs):
+        delay = 0.5
+        for attempt in range(1, API_RETRIES + 1):
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                if attempt == API_RETRIES or not _is_recoverable(e):
+                    raise
+                headers = getattr(e, "headers", None) or {}
+                wait = float(headers.get("Retry-After", delay))
+                print(f"Spotify: Recoverable error ({e}); retrying in {wait:.1f}s...")
+                self.sleep(wait)
+                delay *= 2
+
+    # --- Search (TTL cached) ---
+    def find_track(self, song: str, artist: str = None):
+        """Returns the track URI for a song, or None if Spotify has no match."""
+        query = song.strip().lower()
+        if artist:
+            query += f" artist:{artist.strip().lower()}"
+
+        now = self.clock()
+        with self._cache_lock:
+            cached = self._search_cache.get(query)
+            if cached and cached[1] > now:
+                print(f"Spotify: Search cache hit for '{query}'")
+                return cached[0]
+
+        results = self._call(self.client.search, q=query, limit=1, type='track')
+        tracks = results['tracks']['items']
+        if not tracks:
+            return None
+
+        track_uri = tracks[0]['uri']
+        with self._cache_lock:
+            if len(self._search_cache) >= SEARCH_CACHE_SIZE:
+                # Drop the entry closest to expiry
+                oldest = min(self._search_cache, key=lambda k: self._search_cache[k][1])
+                del self._search_cache[oldest]
+            self._search_cache[query] = (track_uri, now + SEARCH_CACHE_TTL)
+        return track_uri
+
+    # --- Device readiness ---
+    def _pick_device(self):
+        devices = self._call(self.client.devices).get('devices', [])
+        for device in devices:
+            if device.get('is_active'):
+                return device['id']
+        return devices[0]['id'] if devices else None
+
+    def wait_for_device(self, timeout=DEVICE_READY_TIMEOUT):
+        """
+        Polls sp.devices() with exponential backoff until a device shows up.
+        Launches the desktop app (silently) first if it isn't running.
+        Returns a device id, or None on timeout.
+        """
+        device_id = self._pick_device()
+        if device_id:
+            return device_id
+
+        if self.launch_app and not (self.is_app_running and self.is_app_running()):
+            print("Spotify: No device available, launching the app...")
+            self.launch_app()
+
+        deadline = self.clock() + timeout
+        delay = DEVICE_POLL_START
+        while self.clock() < deadline:
+            self.sleep(min(delay, max(0.0, deadline - self.clock())))
+            device_id = self._pick_device()
+            if device_id:
+                return device_id
+            delay = min(delay * 2, DEVICE_POLL_MAX)
+        return None
+
+    # --- Playback ---
+    def play_track(self, track_uri: str):
+        """Starts playback, waiting for a device only if there isn't one."""
+        try:
+            # Warm path: the last device we used (or whatever is active)
+            self._call(self.client.start_playback, device_id=self._device_id, uris=[track_uri])
+            return
+        except Exception as e:
+            if not _is_no_device_error(e):
+                raise
+            print("Spotify: No active device, waiting for one...")
+
+        self._device_id = self.wait_for_device()
+        if not self._device_id:
+            raise PlaybackError("I played the song, but there was no active device. Please check your Spotify Connect settings.")
+        self._call(self.client.start_playback, device_id=self._device_id, uris=[track_uri])
+
+    def play(self, song: str, artist: str = None) -> str:
+        """Finds and plays a song. Returns the message to speak."""
+        start = time.perf_counter()
+        try:
+            track_uri = self.find_track(song, artist)
+            if not track_uri:
+                return f"Sorry, I couldn't find a song called {song}."
+
+            print(f"Telling Spotify API to play URI: {track_uri}")
+            self.play_track(track_uri)
+        except PlaybackError as e:
+            return str(e)
+        except Exception as e:
+            print(f"Spotify API Error: {e}")
+            error_message = str(e).strip().splitlines()[-1]
+            return f"I couldn't play that. The system reported: {error_message}"
+        finally:
+            print(f"Spotify: Request took {(time.perf_counter() - start) * 1000:.0f}ms")
+
+        if artist:
+            return f"Playing {song} by {artist} on Spotify."
+        return f"Playing {song} on Spotify."
@@ -1,15 +1,20 @@
 import os
 import sys
 import subprocess
-import threading
 import json
 import shlex
 import webbrowser  # For opening URLs
 import urllib.parse 
 import time
+import functools
 from langchain_core.output_parsers import StrOutputParser
 from langchain_google_genai import ChatGoogleGenerativeAI
 from backend import speak_tool 
+from backend.spotify_controller import SpotifyController
+from backend.scheduler import TimerScheduler, format_duration, DEFAULT_SNOOZE
+from backend.llm_memo import memoized
+from backend.resilience import guarded, StageUnavailable
+from backend.command_parser import APP_MAP, fast_parse, tidy_command, extract_json_object, validate_command
 
 # --- Import Spotipy ---
 import spotipy
@@ -19,17 +24,10 @@ from spotipy.oauth2 import SpotifyOAuth
 GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY")
 
 # This LLM is *only* for parsing commands
-parser_llm = ChatGoogleGenerativeAI(model="gemini-flash-latest", temperature=0, google_api_key=GOOGLE_API_KEY)
-
-# --- App Map (unchanged) ---
-APP_MAP = {
-    "chrome": "Google Chrome",
-    "vscode": "Visual Studio Code",
-    "spotify": "Spotify",
-    "textedit": "TextEdit",
-    "notes": "Notes",
-    "terminal": "Terminal"
-}
+# Memoized + single-flight: a double-clicked command sends one request
+parser_llm = memoized(guarded(ChatGoogleGenerativeAI(model="gemini-flash-latest", temperature=0, google_api_key=GOOGLE_API_KEY), "parser"))
+
+# --- App Map now lives in command_parser.py (imported above) ---
 
 # --- Initialize Spotipy Client ---
 try:
@@ -78,16 +76,37 @@ def is_app_running_check(app_name: str) -> bool:
     except subprocess.CalledProcessError:
         return False
 
-# --- Main Tool Function ---
-def execute_system_command(user_input: str) -> str:
-    """Parses and executes a safe system command."""
-    print(f"Tool: Received system command: '{user_input}'")
+# --- NEW: Spotify playback controller ---
+def launch_spotify_silently():
+    """Launches Spotify in the background ('open -g') without stealing focus."""
+    print("Executing: open -a Spotify -g (Silent Launch)")
+    try:
+        subprocess.run(["open", "-a", "Spotify", "-g"], check=True)
+    except Exception as e:
+        # If launch fails, the device poll times out and we report that instead.
+        print(f"Silent Launch Error: {e}")
 
-    # 1. Parse the command
+spotify_player = SpotifyController(
+    sp,
+    launch_app=launch_spotify_silently,
+    is_app_running=lambda: is_app_running_check("Spotify"),
+) if sp is not None else None
+
+# --- NEW: Timer / reminder scheduler (one thread for every timer, persisted) ---
+def announce_timer(timer, text):
+    print(f"TIMER: {text}")
+    speak_tool.speak(text)
+
+timer_scheduler = TimerScheduler(on_fire=announce_timer).start()
+
+# --- LLM Fallback Parser ---
+def parse_with_llm(user_input: str) -> dict:
+    """Asks the parser LLM to structure a command the fast path couldn't match."""
     parser_prompt = f"""
     You are an AI assistant that parses a user's natural language command into a
     structured JSON object. You can only perform a few actions: 'open_app', 'timer',
-    'open_website', and 'play_spotify'.
+    'open_website', 'play_spotify', 'reminder', 'list_timers', 'cancel_timer'
+    and 'snooze_timer'.
 
     - 'open_app': Opens a locally installed application.
       - Requires: 'app_name' (e.g., "chrome", "vscode", "spotify").
@@ -98,6 +117,14 @@ def execute_system_command(user_input: str) -> str:
     - 'play_spotify': Plays music on Spotify.
       - Requires: 'song_name' (e.g., "Bohemian Rhapsody").
       - Optional: 'artist_name' (e.g., "Queen").
+    - 'reminder': Speaks a reminder later.
+      - Requires: 'message' and 'duration' (seconds until it fires).
+      - Optional: 'interval' in seconds, for reminders that repeat.
+    - 'list_timers': Lists pending timers and reminders.
+    - 'cancel_timer': Cancels a timer or reminder.
+      - Optional: 'target' ("all", a timer number, or words from its label).
+    - 'snooze_timer': Snoozes the timer that just went off.
+      - Optional: 'duration' in seconds, 'target'.
 
     If the command is not one of these, or if it's too complex (like 'close this app'),
     respond with {{"command": "unrecognized"}}.
@@ -121,6 +148,12 @@ def execute_system_command(user_input: str) -> str:
     User: "Play smells like teen spirit by nirvana" ->
     {{ "command": "play_spotify", "song_name": "smells like teen spirit", "artist_name": "nirvana" }}
 
+    User: "Remind me to drink water every two hours" ->
+    {{ "command": "reminder", "message": "drink water", "duration": 7200, "interval": 7200 }}
+
+    User: "Get rid of the reminder about the dentist" ->
+    {{ "command": "cancel_timer", "target": "dentist" }}
+
     User: "What's the weather?" ->
     {{ "command": "unrecognized", "reason": "Cannot get weather" }}
 
@@ -129,17 +162,43 @@ def execute_system_command(user_input: str) -> str:
 
     User: "{user_input}" ->
     """
-    
+
+    response = parser_llm.invoke(parser_prompt)
+    raw_content = response.content
+    if isinstance(raw_content, list):
+        raw_content = ' '.join(map(str, raw_content))
+
+    print(f"LLM Parser output: {str(raw_content).strip()}")
+    return validate_command(extract_json_object(str(raw_content)))
+
+# --- NEW: Cached parse (fast path first, LLM only if needed) ---
+# The cache key keeps the user's case: URLs, songs and reminder texts are case-sensitive
+@functools.lru_cache(maxsize=256)
+def _parse_with_llm_cached(tidy_input: str) -> dict:
+    return parse_with_llm(tidy_input)
+
+def parse_command(user_input: str) -> dict:
+    """Returns a validated command dict. Raises on unparseable LLM output."""
+    command_data = fast_parse(user_input)
+    if command_data is not None:
+        print(f"Fast parser output: {command_data}")
+        return command_data
+    # Copy so callers can't mutate the cached entry
+    return dict(_parse_with_llm_cached(tidy_command(user_input)))
+
+# --- Main Tool Function ---
+def execute_system_command(user_input: str) -> str:
+    """Parses and executes a safe system command."""
+    print(f"Tool: Received system command: '{user_input}'")
+
+    # 1. Parse the command
     try:
-        response = parser_llm.invoke(parser_prompt)
-        raw_content = response.content
-        if isinstance(raw_content, list):
-            raw_content = ' '.join(map(str, raw_content))
-        
-        json_str = str(raw_content).strip().replace("`", "").replace("json", "")
-        print(f"LLM Parser output: {json_str}")
-        command_data = json.loads(json_str)
+        command_data = parse_command(user_input)
         command = command_data.get("command")
+    except StageUnavailable as e:
+        # Only commands the fast parser knows work during an outage
+        print(f"Command parser LLM unavailable: {e}")
+        return "I can't reach my language model right now, so I can only do simple commands like opening apps or setting timers."
     except Exception as e:
         print(f"Error parsing command: {e}")
         return "I had trouble understanding that command."
@@ -165,14 +224,48 @@ def execute_system_command(user_input: str) -> str:
         if not duration or not isinstance(duration, int):
             return "You need to tell me how long the timer should be."
         
-        def timer_finished(seconds):
-            text = f"Timer complete. Your {seconds} seconds are up."
-            print(f"TIMER: {text}")
-            speak_tool.speak(text)
-        
-        threading.Timer(duration, timer_finished, args=[duration]).start()
-        print(f"Executing: Timer for {duration} seconds")
-        return f"OK, timer set for {duration} seconds."
+        # All timers share the scheduler's single worker thread
+        timer = timer_scheduler.add("timer", duration)
+        print(f"Executing: Timer #{timer['id']} for {duration} seconds")
+        return f"OK, timer set for {format_duration(duration)}."
+
+    # --- NEW: Reminders & timer management (backed by the scheduler) ---
+    elif command == "reminder":
+        message = command_data.get("message")
+        duration = command_data.get("duration")
+        interval = command_data.get("interval")
+        if not message or not duration:
+            return "You need to tell me what to remind you about and when."
+
+        timer_scheduler.add("reminder", duration, message, interval=interval)
+        if interval:
+            return f"OK, I'll remind you to {message} every {format_duration(interval)}."
+        return f"OK, I'll remind you to {message} in {format_duration(duration)}."
+
+    elif command == "list_timers":
+        timers = timer_scheduler.list()
+        if not timers:
+            return "You don't have any timers or reminders set."
+
+        now = time.time()
+        lines = [f"#{t['id']} {t['label']}, due in {format_duration(max(1, t['due_at'] - now))}" for t in timers[:10]]
+        more = f" And {len(timers) - 10} more." if len(timers) > 10 else ""
+        return f"You have {len(timers)} pending: " + "; ".join(lines) + "." + more
+
+    elif command == "cancel_timer":
+        cancelled = timer_scheduler.cancel(command_data.get("target"))
+        if not cancelled:
+            return "I couldn't find a timer or reminder like that."
+        if len(cancelled) == 1:
+            return f"Cancelled your {cancelled[0]['label']}."
+        return f"Cancelled {len(cancelled)} timers and reminders."
+
+    elif command == "snooze_timer":
+        seconds = command_data.get("duration") or DEFAULT_SNOOZE
+        timer = timer_scheduler.snooze(command_data.get("target"), seconds)
+        if not timer:
+            return "There's nothing to snooze."
+        return f"Snoozed. I'll remind you again in {format_duration(seconds)}."
 
     elif command == "open_website":
         url = command_data.get("url")
@@ -183,9 +276,9 @@ def execute_system_command(user_input: str) -> str:
         webbrowser.open(url)
         return f"Opening {url}."
 
-    # --- UPDATED: 'play_spotify' (Final Focus-Safe Hybrid) ---
+    # --- UPDATED: 'play_spotify' (uses SpotifyController, no fixed sleeps) ---
     elif command == "play_spotify":
-        if sp is None:
+        if spotify_player is None:
             return "Sorry, the Spotify service isn't connected. Please check the server."
             
         song = command_data.get("song_name")
@@ -194,52 +287,9 @@ def execute_system_command(user_input: str) -> str:
         if not song:
             return "You need to tell me what song to play."
         
-        # Build a search query for the API
-        search_query = song
-        if artist:
-            search_query += f" artist:{artist}"
-        
-        try:
-            # 1. Check if Spotify is running and launch silently if needed
-            if not is_app_running_check("Spotify"):
-                # If closed, use 'open -g' for a silent launch
-                print("Executing: open -a Spotify -g (Silent Launch)")
-                try:
-                    subprocess.run(["open", "-a", "Spotify", "-g"], check=True)
-                    time.sleep(7) # <-- FIX: EXTENDED DELAY
-                except Exception as e:
-                    print(f"Silent Launch Error: {e}")
-                    # If launch fails, we let the API call fail below and return the original error.
-                    pass 
-            else:
-                print("Spotify process already running. Proceeding to API play.")
-                
-            # 2. Use API to find the song URI
-            results = sp.search(q=search_query, limit=1, type='track')
-            tracks = results['tracks']['items']
-            
-            if not tracks:
-                return f"Sorry, I couldn't find a song called {song}."
-            
-            # 3. Get the Track URI (its official ID)
-            track_uri = tracks[0]['uri']
-            
-            # 4. Play the track URI using the API (Reliable Playback)
-            print(f"Telling Spotify API to play URI: {track_uri}")
-            sp.start_playback(uris=[track_uri])
-            
-            if artist:
-                return f"Playing {song} by {artist} on Spotify."
-            else:
-                return f"Playing {song} on Spotify."
-
-        except Exception as e:
-            print(f"Spotify API Error: {e}")
-            error_message = str(e).strip().splitlines()[-1]
-            if "No active device found" in str(e):
-                return "I played the song, but there was no active device. Please check your Spotify Connect settings."
-            return f"I couldn't play that. The system reported: {error_message}"
+        # Search is TTL-cached and the controller waits for a device only when needed
+        return spotify_player.play(song, artist)
 
     else:
         # This is the "unrecognized" or failed block
-        return "I can't perform that system command. I'm limited to opening apps, opening websites, setting timers, and playing music on Spotify."
\ No newline at end of file
+        return "I can't perform that system command. I'm limited to opening apps, opening websites, timers and reminders, and playing music on Spotify."
\ No newline at end of file
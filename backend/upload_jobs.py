@@ -0,0 +1,120 @@
+import os
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from backend import document_processor
+from backend import profiling
+
+# --- Job Settings ---
+PAGES_PER_BATCH = 8       # Pages extracted per task (and indexed together)
+EXTRACT_WORKERS = max(2, (os.cpu_count() or 2) - 1)
+MAX_FINISHED_JOBS = 50    # Old job records we keep around for /upload-status
+# ---
+
+# OCR runs in tesseract subprocesses (pytesseract shells out), so this pool
+# already spreads the heavy work over several processes. A multiprocessing
+# pool would re-import server.py (and every model) in each worker under the
+# 'spawn' start method that macOS uses.
+_extract_pool = ThreadPoolExecutor(max_workers=EXTRACT_WORKERS, thread_name_prefix="doc-extract")
+# One job is indexed at a time; later uploads queue behind it
+_job_runner = ThreadPoolExecutor(max_workers=1, thread_name_prefix="upload-job")
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+def _update(job, **fields):
+    with _jobs_lock:
+        job.update(fields)
+        done = job["pages_extracted"] / job["pages_total"] if job["pages_total"] else 0
+        elapsed = time.time() - job["started_at"] if job["started_at"] else 0
+        if job["status"] in ("extracting", "indexing") and done > 0:
+            job["eta_seconds"] = round(elapsed / done - elapsed, 1)
+        elif job["status"] in ("ready", "error"):
+            job["eta_seconds"] = 0
+
+
+def get_job(job_id):
+    """A copy of the job's progress record, or None."""
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        return dict(job) if job else None
+
+
+def submit_upload(file_bytes, filename, profile=False):
+    """Queues a document for background processing and returns its job id."""
+    job_id = uuid.uuid4().hex[:12]
+    job = {
+        "job_id": job_id,
+        "filename": filename,
+        "status": "queued",
+        "pages_total": 0,
+        "pages_extracted": 0,
+        "chunks_embedded": 0,
+        "queryable": False,
+        "eta_seconds": None,
+        "message": "Waiting to start.",
+        "created_at": time.time(),
+        "started_at": None,
+    }
+    with _jobs_lock:
+        _jobs[job_id] = job
+        # Forget the oldest finished jobs
+        finished = [j for j in _jobs.values() if j["status"] in ("ready", "error")]
+        for old in sorted(finished, key=lambda j: j["created_at"])[:-MAX_FINISHED_JOBS or None]:
+            del _jobs[old["job_id"]]
+
+    _job_runner.submit(_run_job, job, file_bytes, profile)
+    return job_id
+
+
+def _run_job(job, file_bytes, profile=False):
+    with profiling.session("upload", force=profile):
+        profiling.tag(filename=job["filename"])
+        _index_document(job, file_bytes)
+
+
+def _index_document(job, file_bytes):
+    filename = job["filename"]
+    try:
+        pages_total = document_processor.count_pages(file_bytes, filename)
+        _update(job, status="extracting", pages_total=pages_total, started_at=time.time(),
+                message=f"Reading {pages_total} pages...")
+
+        # 1. Extract page batches in parallel
+        futures = [
+            _extract_pool.submit(document_processor.extract_page_texts, file_bytes, filename, start, start + PAGES_PER_BATCH)
+            for start in range(0, pages_total, PAGES_PER_BATCH)
+        ]
+
+        # 2. Sections (from the PDF outline) are known up front; chunks are filed under them
+        index = document_processor.DocumentIndex(document_processor.read_sections(file_bytes, filename, pages_total))
+
+        # 3. Index each batch as soon as it's ready; questions work after the first one
+        for future in as_completed(futures):
+            page_texts = future.result()
+            if any(text.strip() for _, text in page_texts):
+                _update(job, status="indexing")
+                index.add_pages(page_texts)
+                if not job["queryable"] and index.chunk_count:
+                    document_processor.activate_document(index, filename)
+            _update(job,
+                    pages_extracted=min(pages_total, job["pages_extracted"] + PAGES_PER_BATCH),
+                    chunks_embedded=index.chunk_count,
+                    queryable=index.chunk_count > 0,
+                    message=f"Indexed {index.chunk_count} chunks so far.")
+
+        if index.chunk_count == 0:
+            document_processor.clear_document()
+            _update(job, status="error", message="Error: Unsupported file or no text found.")
+            return
+
+        _update(job, status="ready", pages_extracted=pages_total,
+                message=f"Successfully loaded {filename}. Ready for questions.")
+        print(f"Upload job {job['job_id']}: {filename} done in {time.time() - job['started_at']:.1f}s")
+
+    except Exception as e:
+        print(f"Error in upload job {job['job_id']}: {e}")
+        _update(job, status="error", message="An error occurred during document processing.")
@@ -4,6 +4,7 @@ import mss.tools
 from PIL import Image
 import google.generativeai as genai
 from io import BytesIO
+from backend.resilience import call_with_deadline, StageUnavailable
 
 # Get API key
 GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY")
@@ -42,10 +43,13 @@ def analyze_screen(user_query: str) -> str:
             img
         ]
         
-        response = vision_model.generate_content(prompt_parts)
+        response = call_with_deadline("vision", vision_model.generate_content, prompt_parts)
         
         return response.text
             
+    except StageUnavailable as e:
+        print(f"Vision model unavailable: {e}")
+        return "I can't reach the vision model right now. Please try again in a moment."
     except Exception as e:
         print(f"Vision Error: {e}")
         return "I encountered an error trying to see your screen."
\ No newline at end of file
@@ -0,0 +1,382 @@
+import os
+import sys
+import glob
+import time
+import queue
+import threading
+
+import numpy as np
+import scipy.io.wavfile as wavfile
+from scipy.fft import dct
+from scipy.signal import resample_poly
+
+# --- Wake Word Settings ---
+backend_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(backend_dir)
+# Enrolled recordings of the wake word ("Lumi"), one WAV per utterance
+WAKE_TEMPLATE_DIR = os.environ.get("LUMI_WAKE_DIR", os.path.join(root_dir, "wake_word"))
+WAKE_THRESHOLD = os.environ.get("LUMI_WAKE_THRESHOLD")  # None -> calibrated from the templates
+
+SAMPLE_RATE = 16000
+FRAME_SAMPLES = 480               # 30 ms capture blocks
+RING_SECONDS = 2.0
+PRE_ROLL_SECONDS = 0.15           # Audio kept from before the gate opened
+MIN_WORD_SECONDS = 0.25
+MAX_WORD_SECONDS = 1.2            # Longer bursts are scored on their first 1.2 s ("Lumi, open...")
+MAX_BURST_SECONDS = 2 * MAX_WORD_SECONDS  # Louder than the floor for longer = the background got louder
+HANGOVER_FRAMES = 8               # 240 ms of quiet ends a burst
+GATE_RATIO = 3.0                  # Speech = this many times louder than the noise floor
+MIN_GATE_RMS = 200.0              # ...and at least this loud (int16 units)
+COOLDOWN_SECONDS = 1.0            # Ignore re-triggers right after a detection
+# ---
+
+
+# --- Features ---
+
+def _mel_filterbank(n_filters=26, n_fft=512, sample_rate=SAMPLE_RATE):
+    def hz_to_mel(hz):
+        return 2595 * np.log10(1 + hz / 700)
+
+    def mel_to_hz(mel):
+        return 700 * (10 ** (mel / 2595) - 1)
+
+    mel_points = np.linspace(hz_to_mel(0), hz_to_mel(sample_rate / 2), n_filters + 2)
+    bins = np.floor((n_fft + 1) * mel_to_hz(mel_points) / sample_rate).astype(int)
+    bank = np.zeros((n_filters, n_fft // 2 + 1), dtype=np.float32)
+    for i in range(1, n_filters + 1):
+        left, center, right = bins[i - 1], bins[i], bins[i + 1]
+        if center > left:
+            bank[i - 1, left:center] = (np.arange(left, center) - left) / (center - left)
+        if right > center:
+            bank[i - 1, center:right] = (right - np.arange(center, right)) / (right - center)
+    return bank
+
+_MEL_BANK = _mel_filterbank()
+_WINDOW = np.hamming(400).astype(np.float32)
+
+
+def mfcc(samples, n_coeffs=13):
+    """
+    (frames, n_coeffs) MFCCs (25 ms windows, 10 ms hop), mean/variance
+    normalized per utterance so loudness and mic gain don't matter.
+    """
+    signal = np.asarray(samples, dtype=np.float32)
+    signal = np.append(signal[0], signal[1:] - 0.97 * signal[:-1])  # Pre-emphasis
+    if len(signal) < 400:
+        signal = np.pad(signal, (0, 400 - len(signal)))
+    n_frames = 1 + (len(signal) - 400) // 160
+    index = np.arange(400)[None, :] + 160 * np.arange(n_frames)[:, None]
+    frames = signal[index] * _WINDOW
+    power = np.abs(np.fft.rfft(frames, 512)) ** 2 / 512
+    energies = np.log(power @ _MEL_BANK.T + 1e-10)
+    energies = np.maximum(energies, energies.max() - 10)  # ~43 dB floor: near-silent bands are just noise
+    features = dct(energies, type=2, axis=1, norm="ortho")[:, 1:n_coeffs + 1]
+    return (features - features.mean(axis=0)) / (features.std(axis=0) + 1e-8)
+
+
+def dtw_distance(template, segment):
+    """
+    Open-end DTW: the template must match the START of the segment, but the
+    segment may carry on afterwards. Returns the cost per aligned step.
+    """
+    cost = np.sqrt(((template[:, None, :] - segment[None, :, :]) ** 2).sum(axis=2))
+    t_len, s_len = cost.shape
+    acc = np.full((t_len + 1, s_len + 1), np.inf, dtype=np.float64)
+    acc[0, 0] = 0.0
+    for i in range(1, t_len + 1):
+        row = cost[i - 1]
+        prev = acc[i - 1]
+        current = acc[i]
+        for j in range(1, s_len + 1):
+            current[j] = row[j - 1] + min(prev[j - 1], prev[j], current[j - 1])
+    # Free end: best alignment that covers at least half the template's length
+    ends = np.arange(1, s_len + 1)
+    valid = ends >= t_len // 2
+    if not valid.any():
+        return np.inf
+    normalized = acc[t_len, 1:][valid] / (t_len + ends[valid])
+    return float(normalized.min())
+
+
+def load_clip(path):
+    """A WAV file as mono float32 samples at SAMPLE_RATE."""
+    rate, data = wavfile.read(path)
+    is_float = np.issubdtype(data.dtype, np.floating)
+    data = np.asarray(data, dtype=np.float32)
+    if data.ndim > 1:
+        data = data.mean(axis=1)
+    if is_float:
+        data = data * 32767  # Float WAVs are in [-1, 1]
+    if rate != SAMPLE_RATE:
+        divisor = np.gcd(rate, SAMPLE_RATE)
+        data = resample_poly(data, SAMPLE_RATE // divisor, rate // divisor)
+    return data.astype(np.float32)
+
+
+def trim_silence(samples, ratio=0.1):
+    """Cuts leading/trailing quiet (10 ms frames below ratio * the loudest frame)."""
+    samples = np.asarray(samples, dtype=np.float32)
+    n_frames = len(samples) // 160
+    if n_frames == 0:
+        return samples
+    rms = np.sqrt(np.mean(samples[:n_frames * 160].reshape(n_frames, 160) ** 2, axis=1))
+    loud = np.where(rms > rms.max() * ratio)[0]
+    if not len(loud):
+        return samples
+    return samples[loud[0] * 160:(loud[-1] + 1) * 160]
+
+
+# --- Keyword Spotter ---
+
+class KeywordSpotter:
+    """
+    Template-matching keyword spotter: MFCCs of a speech burst compared (DTW)
+    against a few enrolled recordings of the wake word. Tiny, fully local,
+    and it only runs when the energy gate has found a word-length burst.
+    """
+
+    def __init__(self, templates, threshold=None):
+        if not templates:
+            raise ValueError("KeywordSpotter needs at least one template")
+        trimmed = [trim_silence(t) for t in templates]
+        self._longest = max(len(t) for t in trimmed)
+        self.templates = [mfcc(t) for t in trimmed]
+        self.threshold = float(threshold) if threshold is not None else self._calibrate()
+
+    def _calibrate(self):
+        """Accept anything about as close as the enrolled recordings are to each other."""
+        if len(self.templates) < 2:
+            return 1.0
+        pairwise = [dtw_distance(a, b) for i, a in enumerate(self.templates)
+                    for j, b in enumerate(self.templates) if i != j]
+        return max(pairwise) * 1.25
+
+    @classmethod
+    def from_directory(cls, directory=WAKE_TEMPLATE_DIR, threshold=WAKE_THRESHOLD):
+        paths = sorted(glob.glob(os.path.join(directory, "*.wav")))
+        if not paths:
+            raise FileNotFoundError(
+                f"No wake word recordings in {directory}. Run: python backend/wake_word.py enroll")
+        return cls([load_clip(p) for p in paths], threshold)
+
+    def score(self, samples):
+        samples = trim_silence(samples)
+        candidates = [samples]
+        # "Lumi, open Spotify" in one breath: also try word-length prefixes,
+        # so the rest of the sentence doesn't skew the normalization
+        if len(samples) > 1.5 * self._longest:
+            candidates += [samples[:int(self._longest * stretch)] for stretch in (0.9, 1.1, 1.3)]
+        return min(dtw_distance(template, mfcc(candidate))
+                   for candidate in candidates for template in self.templates)
+
+    def matches(self, samples):
+        return self.score(samples) <= self.threshold
+
+
+# --- Detector (energy gate + ring buffer; pure, so it can be fed recorded clips) ---
+
+class WakeWordDetector:
+    """
+    Feed 30 ms frames to process_frame(). Silence costs one RMS per frame;
+    the spotter only runs on word-length bursts of speech.
+    """
+
+    def __init__(self, spotter):
+        self.spotter = spotter
+        self._ring = np.zeros(int(RING_SECONDS * SAMPLE_RATE), dtype=np.float32)
+        self._written = 0               # Total samples ever written
+        self._noise_floor = None
+        self._burst_start = None        # Sample index where the current burst began
+        self._quiet_frames = 0
+        self._scored_burst = False
+        self._cooldown_until = 0
+        self.checks = 0                 # How many times the spotter actually ran
+
+    def _write(self, frame):
+        size = len(self._ring)
+        start = self._written % size
+        end = start + len(frame)
+        if end <= size:
+            self._ring[start:end] = frame
+        else:
+            split = size - start
+            self._ring[start:] = frame[:split]
+            self._ring[:end - size] = frame[split:]
+        self._written += len(frame)
+
+    def _read(self, start, end):
+        """Samples [start, end) by absolute index (must still be in the ring)."""
+        start = max(start, self._written - len(self._ring))
+        size = len(self._ring)
+        index = np.arange(start, end) % size
+        return self._ring[index]
+
+    def _check(self, end):
+        self.checks += 1
+        start = self._burst_start - int(PRE_ROLL_SECONDS * SAMPLE_RATE)
+        end = min(end, self._burst_start + int(MAX_WORD_SECONDS * SAMPLE_RATE))
+        return self.spotter.matches(self._read(start, end))
+
+    def process_frame(self, frame) -> bool:
+        """True when the wake word has just been heard."""
+        frame = np.asarray(frame, dtype=np.float32).reshape(-1)
+        self._write(frame)
+        rms = float(np.sqrt(np.mean(frame ** 2))) if len(frame) else 0.0
+
+        if self._noise_floor is None:
+            self._noise_floor = rms
+        is_speech = rms > max(MIN_GATE_RMS, self._noise_floor * GATE_RATIO)
+        if not is_speech and self._burst_start is None:
+            # Track the background level only while nobody is talking
+            self._noise_floor = 0.95 * self._noise_floor + 0.05 * rms
+
+        if is_speech:
+            self._quiet_frames = 0
+            if self._burst_start is None:
+                self._burst_start = self._written - len(frame)
+                self._scored_burst = False
+        elif self._burst_start is not None:
+            self._quiet_frames += 1
+
+        if self._burst_start is None:
+            return False
+
+        length = (self._written - self._burst_start) / SAMPLE_RATE
+        burst_over = self._quiet_frames >= HANGOVER_FRAMES
+        heard = False
+        if not self._scored_burst and time.monotonic() >= self._cooldown_until:
+            if length >= MAX_WORD_SECONDS or (burst_over and length >= MIN_WORD_SECONDS):
+                self._scored_burst = True
+                heard = self._check(self._written)
+                if heard:
+                    self._cooldown_until = time.monotonic() + COOLDOWN_SECONDS
+        if burst_over:
+            self._burst_start = None
+        elif length >= MAX_BURST_SECONDS:
+            # A fan or traffic that never stops would keep the burst open (and the floor frozen) forever:
+            # close it and take the last word-length of audio as the new background level
+            recent = self._read(self._written - int(MAX_WORD_SECONDS * SAMPLE_RATE), self._written)
+            self._noise_floor = max(self._noise_floor, float(np.sqrt(np.mean(recent ** 2))))
+            self._burst_start = None
+            self._quiet_frames = 0
+        return heard
+
+    def detect_in_clip(self, samples):
+        """Runs a whole recording through the detector; returns detection times (seconds)."""
+        samples = np.asarray(samples, dtype=np.float32)
+        hits = []
+        for start in range(0, len(samples) - FRAME_SAMPLES + 1, FRAME_SAMPLES):
+            if self.process_frame(samples[start:start + FRAME_SAMPLES]):
+                hits.append(round((start + FRAME_SAMPLES) / SAMPLE_RATE, 2))
+                self._cooldown_until = 0  # Clips aren't real-time
+        # Flush a burst that runs to the end of the clip
+        for _ in range(HANGOVER_FRAMES):
+            if self.process_frame(np.zeros(FRAME_SAMPLES, dtype=np.float32)):
+                hits.append(round(len(samples) / SAMPLE_RATE, 2))
+        return hits
+
+
+# --- Live microphone ---
+
+def wait_for_wake_word(detector=None, stop_event=None):
+    """
+    Blocks until the wake word is heard (True) or stop_event is set (False).
+    The microphone stream is closed again before returning, so the normal
+    recorder (sd.rec in server.py / voice_companion.py) can use the mic.
+    """
+    import sounddevice as sd
+
+    detector = detector or WakeWordDetector(KeywordSpotter.from_directory())
+    frames = queue.Queue()
+
+    def callback(indata, frame_count, time_info, status):
+        # Runs on the audio thread: copy and hand off, nothing else
+        frames.put(indata[:, 0].copy())
+
+    with sd.InputStream(samplerate=SAMPLE_RATE, channels=1, dtype='int16',
+                        blocksize=FRAME_SAMPLES, callback=callback):
+        while stop_event is None or not stop_event.is_set():
+            try:
+                frame = frames.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if detector.process_frame(frame):
+                print("WakeWord: Heard 'Lumi'.")
+                return True
+    return False
+
+
+class WakeWordListener:
+    """Background loop: wait for the wake word, run on_wake(), repeat until stopped."""
+
+    def __init__(self, on_wake):
+        self.on_wake = on_wake
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return self
+        detector = WakeWordDetector(KeywordSpotter.from_directory())  # Fails here if nothing is enrolled
+        self._stop.clear()
+
+        def loop():
+            while not self._stop.is_set():
+                try:
+                    if wait_for_wake_word(detector, self._stop):
+                        self.on_wake()
+                except Exception as e:
+                    print(f"WakeWord: Error in listener: {e}")
+                    time.sleep(1)
+
+        self._thread = threading.Thread(target=loop, name="wake-word", daemon=True)
+        self._thread.start()
+        print(f"WakeWord: Listening for 'Lumi' (threshold {detector.spotter.threshold:.3f}).")
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+
+# --- Command line: enroll / test clips / live listen ---
+
+def _enroll(count=3):
+    import sounddevice as sd
+    os.makedirs(WAKE_TEMPLATE_DIR, exist_ok=True)
+    for n in range(count):
+        input(f"[{n + 1}/{count}] Press Enter, then say 'Lumi'...")
+        recording = sd.rec(int(1.5 * SAMPLE_RATE), samplerate=SAMPLE_RATE, channels=1, dtype='int16')
+        sd.wait()
+        samples = recording[:, 0].astype(np.float32)
+        # Trim to the loud part so templates are just the word
+        loud = np.where(np.abs(samples) > max(MIN_GATE_RMS, np.abs(samples).max() * 0.1))[0]
+        if len(loud):
+            samples = samples[max(0, loud[0] - 1600):loud[-1] + 1600]
+        path = os.path.join(WAKE_TEMPLATE_DIR, f"lumi_{int(time.time())}_{n}.wav")
+        wavfile.write(path, SAMPLE_RATE, samples.astype(np.int16))
+        print(f"Saved {path}")
+
+
+if __name__ == "__main__":
+    mode = sys.argv[1] if len(sys.argv) > 1 else "listen"
+    if mode == "enroll":
+        _enroll()
+    elif mode == "test":
+        # python backend/wake_word.py test clip1.wav clip2.wav ...
+        spotter = KeywordSpotter.from_directory()
+        print(f"Threshold: {spotter.threshold:.3f}")
+        for path in sys.argv[2:]:
+            detector = WakeWordDetector(spotter)
+            started = time.perf_counter()
+            clip = load_clip(path)
+            hits = detector.detect_in_clip(clip)
+            cpu = time.perf_counter() - started
+            print(f"{path}: detections at {hits} | spotter ran {detector.checks}x | "
+                  f"{cpu / (len(clip) / SAMPLE_RATE) * 100:.2f}% of real time")
+    else:
+        while wait_for_wake_word():
+            print("Wake word detected!")
@@ -97,8 +97,179 @@ function setProcessingState(isProcessing) {
   }
 }
 
+// --- NEW: Stream the microphone to the server over a WebSocket ---
+// The UI captures the audio itself and sends it as 16 kHz int16 PCM while
+// the user is still speaking; the server transcribes it in segments as it
+// arrives and answers as soon as the last one lands. The server ends the
+// utterance when the user stops talking; clicking the orb again stops early.
+// If streaming isn't available we fall back to /listen (server-side mic).
+const STREAM_URL = 'ws://127.0.0.1:5003';
+const STREAM_SAMPLE_RATE = 16000;
+const MAX_LISTEN_MS = 15000;
+let activeStream = null; // { stop } while the mic is streaming
+
+// Runs on the audio thread: float samples -> int16, posted in ~100 ms chunks
+const PCM_WORKLET = `
+class PcmSender extends AudioWorkletProcessor {
+  constructor() { super(); this.chunks = []; this.size = 0; }
+  process(inputs) {
+    const channel = inputs[0][0];
+    if (channel) {
+      const pcm = new Int16Array(channel.length);
+      for (let i = 0; i < channel.length; i++) {
+        const s = Math.max(-1, Math.min(1, channel[i]));
+        pcm[i] = s < 0 ? s * 0x8000 : s * 0x7fff;
+      }
+      this.chunks.push(pcm);
+      this.size += pcm.length;
+      if (this.size >= sampleRate / 10) {
+        const out = new Int16Array(this.size);
+        let offset = 0;
+        for (const chunk of this.chunks) { out.set(chunk, offset); offset += chunk.length; }
+        this.port.postMessage(out.buffer, [out.buffer]);
+        this.chunks = [];
+        this.size = 0;
+      }
+    }
+    return true;
+  }
+}
+registerProcessor('pcm-sender', PcmSender);
+`;
+
+function streamUtterance(onPartial, onEnd) {
+  return new Promise(async (resolve, reject) => {
+    let mic = null;
+    let context = null;
+    let timer = null;
+    let capturing = true;
+    let opened = false;
+    let settled = false;
+
+    const stopCapture = () => {
+      if (!capturing) return;
+      capturing = false;
+      activeStream = null;
+      clearTimeout(timer);
+      if (mic) mic.getTracks().forEach(track => track.stop());
+      if (context) context.close();
+      onEnd();
+    };
+    const fail = (error) => {
+      stopCapture();
+      if (!settled) { settled = true; reject(error); }
+    };
+
+    try {
+      mic = await navigator.mediaDevices.getUserMedia({ audio: { channelCount: 1, echoCancellation: true, noiseSuppression: true } });
+    } catch (error) {
+      error.fallback = true;
+      return fail(error);
+    }
+
+    const ws = new WebSocket(STREAM_URL);
+    ws.binaryType = 'arraybuffer';
+    activeStream = {
+      stop: () => {
+        if (ws.readyState === WebSocket.OPEN) ws.send(JSON.stringify({ type: 'stop' }));
+        stopCapture();
+      }
+    };
+
+    ws.onopen = async () => {
+      opened = true;
+      try {
+        context = new AudioContext({ sampleRate: STREAM_SAMPLE_RATE });
+        const workletURL = URL.createObjectURL(new Blob([PCM_WORKLET], { type: 'application/javascript' }));
+        await context.audioWorklet.addModule(workletURL);
+        const sender = new AudioWorkletNode(context, 'pcm-sender');
+        sender.port.onmessage = (event) => {
+          if (capturing && ws.readyState === WebSocket.OPEN) ws.send(event.data);
+        };
+        context.createMediaStreamSource(mic).connect(sender);
+        sender.connect(context.destination); // Keeps the node pulled; it outputs silence
+        ws.send(JSON.stringify({ type: 'start', sample_rate: context.sampleRate }));
+        timer = setTimeout(activeStream.stop, MAX_LISTEN_MS);
+      } catch (error) {
+        ws.close();
+        fail(error);
+      }
+    };
+    ws.onmessage = (event) => {
+      const message = JSON.parse(event.data);
+      if (message.type === 'partial' || message.type === 'final') {
+        onPartial(message.text);
+      } else if (message.type === 'end') {
+        stopCapture();
+      } else if (message.type === 'response') {
+        settled = true;
+        resolve(message);
+        ws.close();
+      } else if (message.type === 'error') {
+        ws.close();
+        fail(new Error(message.message));
+      }
+    };
+    ws.onerror = () => {
+      const error = new Error('Streaming connection failed.');
+      error.fallback = !opened; // Server without the stream endpoint: use /listen
+      fail(error);
+    };
+    ws.onclose = () => fail(new Error('Streaming connection closed.'));
+  });
+}
+
+function showListenResult(data, listeningP) {
+  lumiUI.classList.remove('thinking');
+  lumiUI.classList.remove('listening');
+  isListening = false;
+
+  console.log('Got response from Python:', data);
+
+  if (responseContent.contains(listeningP)) { 
+      responseContent.removeChild(listeningP); 
+  }
+
+  if (data.user_text) {
+    addMessageToChat('user', data.user_text);
+  }
+  addMessageToChat('ai', data.full_text || data.message);
+}
+
+function showListenError(error, listeningP) {
+  console.error('Error calling Python server (listen):', error);
+  lumiUI.classList.remove('thinking');
+  lumiUI.classList.remove('listening');
+  isListening = false;
+
+  if (responseContent.contains(listeningP)) { 
+      responseContent.removeChild(listeningP); 
+  }
+  addMessageToChat('error', error.message || 'Could not connect to the brain.');
+}
+
+// The old path: the server records 5 seconds on its own microphone
+function listenOnServer(listeningP) {
+  invokeAPI('http://127.0.0.1:5001/listen', { method: 'POST' })
+    .then(data => showListenResult(data, listeningP))
+    .catch(error => showListenError(error, listeningP));
+
+  // Start a 5-second timer to match the recording time
+  setTimeout(() => {
+    if (lumiUI.classList.contains('listening')) {
+        lumiUI.classList.remove('listening');
+        lumiUI.classList.add('thinking');
+        listeningP.innerText = "Thinking...";
+    }
+  }, 5000); // 5000ms = 5 seconds
+}
+
 // Attach the click listener to the LUMI orb
 lumiUI.addEventListener('click', () => {
+  if (activeStream) {
+    activeStream.stop(); // Second click: done talking
+    return;
+  }
   if (isListening || isDocumentMode) {
      if(isDocumentMode) {
         addMessageToChat('system', 'In Document Mode. Use text input to ask questions or clear the document session.');
@@ -111,44 +282,24 @@ lumiUI.addEventListener('click', () => {
   
   const listeningP = addMessageToChat('system', 'Listening...');
 
-  // 2. Start the API call
-  // --- UPDATED: Using new invokeAPI function ---
-  invokeAPI('http://127.0.0.1:5001/listen', { method: 'POST' })
-    .then(data => { 
-      lumiUI.classList.remove('thinking');
-      isListening = false;
-      
-      console.log('Got response from Python:', data);
-      
-      if (responseContent.contains(listeningP)) { 
-          responseContent.removeChild(listeningP); 
-      }
-      
-      if (data.user_text) {
-        addMessageToChat('user', data.user_text);
-      }
-      addMessageToChat('ai', data.full_text);
-    })
-    .catch(error => {
-      console.error('Error calling Python server (listen):', error);
-      lumiUI.classList.remove('thinking');
+  streamUtterance(
+    (text) => { listeningP.innerText = `Listening... "${text}"`; },
+    () => {
       lumiUI.classList.remove('listening');
-      isListening = false;
-      
-      if (responseContent.contains(listeningP)) { 
-          responseContent.removeChild(listeningP); 
+      lumiUI.classList.add('thinking');
+    }
+  )
+    .then(data => showListenResult(data, listeningP))
+    .catch(error => {
+      if (error.fallback) {
+        console.warn('Audio streaming unavailable, recording on the server instead:', error);
+        lumiUI.classList.remove('thinking');
+        lumiUI.classList.add('listening');
+        listenOnServer(listeningP);
+      } else {
+        showListenError(error, listeningP);
       }
-      addMessageToChat('error', error.message || 'Could not connect to the brain.');
     });
-    
-  // 3. Start a 5-second timer to match the recording time
-  setTimeout(() => {
-    if (lumiUI.classList.contains('listening')) {
-        lumiUI.classList.remove('listening');
-        lumiUI.classList.add('thinking');
-        listeningP.innerText = "Thinking...";
-    }
-  }, 5000); // 5000ms = 5 seconds
 });
 
 
@@ -198,6 +349,60 @@ commandInput.addEventListener('keydown', (event) => {
 // --- END OF MODIFIED HANDLER ---
 
 
+// --- NEW: Switch the UI into Document Mode ---
+function enterDocumentMode(fileName) {
+    isDocumentMode = true;
+    currentDocumentName = fileName;
+    const displayName = currentDocumentName.length > 20 ? currentDocumentName.substring(0, 17) + '...' : currentDocumentName;
+    docStatusText.innerText = `Chatting with: ${displayName}`;
+    clearDocBtn.classList.remove('hidden');
+    commandInput.placeholder = "Ask a question about the document...";
+}
+
+// --- NEW: Poll an upload job until it is ready ---
+// Questions are allowed as soon as the first batches are indexed.
+function pollUploadJob(jobId, fileName) {
+    const progressP = addMessageToChat('system', `Reading ${fileName}...`);
+    let announcedQueryable = false;
+
+    const poll = () => {
+        invokeAPI(`http://127.0.0.1:5001/upload-status/${jobId}`, { method: 'GET' })
+            .then(job => {
+                if (job.status === 'error') {
+                    setProcessingState(false);
+                    uploadDocBtn.disabled = false;
+                    addMessageToChat('error', `Error loading document. ${job.message}`);
+                    return;
+                }
+
+                const eta = job.eta_seconds ? ` (about ${Math.ceil(job.eta_seconds)}s left)` : '';
+                progressP.innerText = `Reading ${fileName}: ${job.pages_extracted}/${job.pages_total} pages, ${job.chunks_embedded} chunks indexed${eta}`;
+
+                if (job.queryable && !announcedQueryable) {
+                    announcedQueryable = true;
+                    setProcessingState(false);
+                    enterDocumentMode(fileName);
+                    if (job.status !== 'ready') {
+                        addMessageToChat('system', 'You can start asking questions while I finish reading the rest.');
+                    }
+                }
+
+                if (job.status === 'ready') {
+                    uploadDocBtn.disabled = false;
+                    addMessageToChat('ai', `Successfully loaded ${fileName}. You can now ask questions about it.`);
+                    return;
+                }
+                setTimeout(poll, 1000);
+            })
+            .catch(error => {
+                setProcessingState(false);
+                uploadDocBtn.disabled = false;
+                addMessageToChat('error', `Lost track of the upload. ${error.message}`);
+            });
+    };
+    poll();
+}
+
 // --- NEW: Document Upload Listeners (MODIFIED) ---
 uploadDocBtn.addEventListener('click', () => {
     docUploadInput.click(); // Trigger the hidden file input
@@ -231,17 +436,8 @@ docUploadInput.addEventListener('change', (event) => {
     })
     // --- END OF FIX ---
         .then(data => {
-            setProcessingState(false);
-            uploadDocBtn.disabled = false;
-
-            // Handle success
-            isDocumentMode = true;
-            currentDocumentName = file.name;
-            const displayName = currentDocumentName.length > 20 ? currentDocumentName.substring(0, 17) + '...' : currentDocumentName;
-            docStatusText.innerText = `Chatting with: ${displayName}`;
-            clearDocBtn.classList.remove('hidden');
-            commandInput.placeholder = "Ask a question about the document...";
-            addMessageToChat('ai', `Successfully loaded ${file.name}. You can now ask questions about it.`);
+            // --- NEW: Upload returns a job id right away; poll for progress ---
+            pollUploadJob(data.job_id, file.name);
         })
         .catch(error => {
             setProcessingState(false);
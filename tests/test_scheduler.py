@@ -0,0 +1,56 @@
+import os
+import time
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+from backend.scheduler import TimerScheduler, next_due
+
+
+class NextDueTest(unittest.TestCase):
+    def test_on_time_run_advances_one_interval(self):
+        self.assertEqual(next_due(1000.0, 60, 1000.0), 1060.0)
+
+    def test_overdue_run_skips_missed_runs(self):
+        # 2.5 intervals late: the next run is the 3rd one, still in the future
+        self.assertEqual(next_due(1000.0, 60, 1150.0), 1180.0)
+
+    def test_exact_multiple_is_not_due_now(self):
+        self.assertEqual(next_due(1000.0, 60, 1120.0), 1180.0)
+
+
+class OverdueReminderTest(unittest.TestCase):
+    def test_overdue_recurring_reminder_fires_once(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, "timers.db")
+            # A reminder every minute that was due 2.5 minutes ago (e.g. the app was closed)
+            db = sqlite3.connect(db_path)
+            db.execute("""
+                CREATE TABLE timers (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, label TEXT NOT NULL,
+                    message TEXT, duration INTEGER NOT NULL, interval INTEGER, due_at REAL NOT NULL
+                )
+            """)
+            db.execute("INSERT INTO timers (kind, label, message, duration, interval, due_at) VALUES (?, ?, ?, ?, ?, ?)",
+                       ("reminder", "reminder to stretch", "stretch", 60, 60, time.time() - 150))
+            db.commit()
+            db.close()
+
+            fired = []
+            first = threading.Event()
+            scheduler = TimerScheduler(db_path=db_path, on_fire=lambda timer, text: (fired.append(text), first.set()))
+            scheduler.start()
+            try:
+                self.assertTrue(first.wait(2))
+                time.sleep(0.3)   # Time for a second (wrong) run to show up
+                self.assertEqual(fired, ["Reminder: stretch"])
+                (timer,) = scheduler.list()
+                self.assertGreater(timer["due_at"], time.time() + 20)
+            finally:
+                scheduler.stop()
+                scheduler._db.close()
+
+
+if __name__ == "__main__":
+    unittest.main()